@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Микро-бенчмарк очистки ответов LLM
+
+Сравнивает прежнюю реализацию _clean_ai_response (8 проходов re.sub)
+с однопроходным ResponseCleaner, в том числе в потоковом режиме.
+
+Запуск:
+    python benchmarks/bench_cleaner.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ai.cleaner import ResponseCleaner, clean_response
+
+
+def legacy_clean(text: str) -> str:
+    """Прежняя реализация SoulMirrorAgent._clean_ai_response"""
+    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
+    text = re.sub(r'__(.+?)__', r'\1', text)
+    text = re.sub(r'\*(.+?)\*', r'\1', text)
+    text = re.sub(r'_(.+?)_', r'\1', text)
+    text = re.sub(r'^\d+\.\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'^[-*+]\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+PLAIN = ('Сегодня звезды советуют прислушаться к своему внутреннему голосу. '
+         'Энергия Льва помогает проявить себя, но не забывайте о близких.\n\n') * 6
+
+MARKDOWN = ('## Совет дня\n\n**Солнце** во Льве дает *уверенность*.\n'
+            '1. Прислушайтесь к интуиции\n2. Найдите время для отдыха\n'
+            '- Берегите силы\n- Доверьтесь __звездам__\n\n') * 6
+
+
+def stream(text: str, size: int = 8) -> str:
+    cleaner = ResponseCleaner()
+    parts = [cleaner.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    parts.append(cleaner.finish())
+    return ''.join(parts)
+
+
+def main():
+    print(f"{'ответ':<22}{'было, мкс':>12}{'стало, мкс':>12}{'поток, мкс':>12}")
+    for name, text in (('без разметки', PLAIN), ('с markdown', MARKDOWN)):
+        assert clean_response(text) == legacy_clean(text) == stream(text)
+        number = 500
+        legacy = timeit.timeit(lambda: legacy_clean(text), number=number) / number * 1e6
+        current = timeit.timeit(lambda: clean_response(text), number=number) / number * 1e6
+        streamed = timeit.timeit(lambda: stream(text), number=number) / number * 1e6
+        print(f"{name:<22}{legacy:>12.1f}{current:>12.1f}{streamed:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Время импорта приложения (python -X importtime)
+
+В отдельном процессе выполняет django.setup() и импортирует URL-ы и views
+(как при запуске воркера или команды manage.py), печатает самые тяжелые
+модули и завершается с кодом 1, если суммарное время превысило бюджет или
+загрузились модули, которые должны импортироваться лениво (LangChain, LangGraph).
+
+Запуск:
+    python benchmarks/bench_importtime.py
+    python benchmarks/bench_importtime.py --budget-ms 300 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые загружаются только при первом AI запросе
+LAZY_PREFIXES = ('langchain', 'langgraph')
+
+SCRIPT = 'import django; django.setup(); import core.urls'
+
+
+def measure():
+    """[(собственное время мкс, накопленное мкс, глубина, модуль)] в порядке импорта"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='soulmirror.settings')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SCRIPT],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((int(own), int(cumulative), depth, name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--budget-ms', type=float, default=400, help='Допустимое суммарное время импорта')
+    parser.add_argument('--top', type=int, default=10, help='Сколько самых тяжелых модулей показать')
+    args = parser.parse_args()
+
+    rows = measure()
+    total_ms = sum(own for own, _, _, _ in rows) / 1000
+    lazy = sorted({name for _, _, _, name in rows if name.startswith(LAZY_PREFIXES)})
+
+    print(f'{"модуль":<50}{"накоплено, мс":>15}')
+    top_level = [row for row in rows if row[2] <= 1]
+    for _, cumulative, _, name in sorted(top_level, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f'{name:<50}{cumulative / 1000:>15.1f}')
+    print(f'\nВсего: {total_ms:.1f} мс (бюджет {args.budget_ms:.0f} мс), модулей: {len(rows)}')
+
+    failed = False
+    if lazy:
+        print(f'Загружены модули, которые должны импортироваться лениво: {", ".join(lazy[:5])}...')
+        failed = True
+    if total_ms > args.budget_ms:
+        print('Превышен бюджет времени импорта')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
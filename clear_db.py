@@ -9,26 +9,30 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'soulmirror.settings')
 django.setup()
 
 from core.models import (
-    User, DailyEntry, DailyAdvice, Task, TarotReading
+    User, DailyEntry, DailyAdvice, Task, TarotReading, UserStatsRollup
 )
+from core.retention import delete_in_batches
 
 def clear_all_data():
     """Удаляет все данные пользователей из БД"""
     print("Удаление данных...")
 
-    # Удаляем связанные данные
-    TarotReading.objects.all().delete()
+    # Удаляем связанные данные пакетами (без загрузки объектов и сигналов)
+    delete_in_batches(TarotReading.objects.all())
     print("✓ Удалены расклады Таро")
 
-    Task.objects.all().delete()
+    delete_in_batches(Task.objects.all())
     print("✓ Удалены задания")
 
-    DailyAdvice.objects.all().delete()
+    delete_in_batches(DailyAdvice.objects.all())
     print("✓ Удалены ежедневные советы")
 
-    DailyEntry.objects.all().delete()
+    delete_in_batches(DailyEntry.objects.all())
     print("✓ Удалены дневниковые записи")
 
+    # Сводки оставшихся пользователей пересчитаются при следующем обращении
+    delete_in_batches(UserStatsRollup.objects.all())
+
     # Удаляем пользователей (кроме суперпользователей, если хотите их сохранить)
     User.objects.filter(is_superuser=False).delete()
     print("✓ Удалены пользователи")
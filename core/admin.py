@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     User, ZodiacSign, ZodiacProfile, DailyEntry, DailyAdvice,
-    Task, TarotReading, QuizQuestion, QuizAnswer
+    Task, TarotReading, QuizQuestion, QuizAnswer, UserStatsRollup, SignProgress,
+    ExperienceEvent, ArchivedHistory
 )
 
 
@@ -21,11 +22,17 @@ class ZodiacSignAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
+class SignProgressInline(admin.TabularInline):
+    model = SignProgress
+    extra = 0
+
+
 @admin.register(ZodiacProfile)
 class ZodiacProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'birth_sign', 'inner_sign', 'created_at']
     list_filter = ['inner_sign', 'birth_sign']
     search_fields = ['user__username']
+    inlines = [SignProgressInline]
 
 
 @admin.register(DailyEntry)
@@ -58,6 +65,13 @@ class TarotReadingAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
 
 
+@admin.register(UserStatsRollup)
+class UserStatsRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total_entries', 'completed_tasks', 'total_tarot', 'longest_streak', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = [field.name for field in UserStatsRollup._meta.fields]
+
+
 class QuizAnswerInline(admin.TabularInline):
     model = QuizAnswer
     extra = 4
@@ -74,3 +88,20 @@ class QuizQuestionAdmin(admin.ModelAdmin):
 class QuizAnswerAdmin(admin.ModelAdmin):
     list_display = ['question', 'answer_text']
     search_fields = ['answer_text']
+
+
+@admin.register(ExperienceEvent)
+class ExperienceEventAdmin(admin.ModelAdmin):
+    list_display = ['user', 'source', 'amount', 'sign', 'created_at']
+    list_filter = ['source', 'sign']
+    search_fields = ['user__username']
+    date_hierarchy = 'created_at'
+
+
+@admin.register(ArchivedHistory)
+class ArchivedHistoryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'kind', 'month', 'rows', 'updated_at']
+    list_filter = ['kind']
+    search_fields = ['user__username']
+    exclude = ['payload']
+    readonly_fields = [field.name for field in ArchivedHistory._meta.fields if field.name != 'payload']
@@ -1,95 +1,59 @@
 """
 AI Agent для SoulMirror с использованием LangGraph и Ollama
+
+LangChain и LangGraph импортируются при первом обращении к agent.llm или
+agent.graph, а агент процесса создается get_agent() при первом AI запросе,
+поэтому команды manage.py, миграции и запуск воркеров их не загружают.
 """
 import os
 import json
 import requests
 import random
 import hashlib
-from typing import Dict, Any, List, TypedDict, Annotated
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Iterator, Optional, TypedDict, Annotated
 from datetime import datetime, timedelta
-from langchain_community.llms import Ollama
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langgraph.graph import StateGraph, END, START
-from langgraph.graph.message import add_messages
 
+from django.conf import settings
 
-# Определение состояния агента
-class AgentState(TypedDict):
-    """Состояние AI агента"""
-    messages: Annotated[list, add_messages]
-    task_type: str
-    user_profile: Dict[str, Any]
-    result: Dict[str, Any]
+from .. import metrics, profiling
+from . import ephemeris
+from .sanitizer import PromptSanitizer
+from .cassette import Cassette, CassetteMiss
+from .cleaner import ResponseCleaner, clean_response
+from .influence import base_experience, calculate_zodiac_influence
 
 
-def calculate_zodiac_influence(emotion_level: int, event_description: str = "") -> Dict[str, float]:
-    """
-    Рассчитывает влияние события на знаки зодиака с учетом контекста
+logger = logging.getLogger(__name__)
 
-    Args:
-        emotion_level: Уровень эмоции (1-10)
-        event_description: Описание события для контекста
 
-    Returns:
-        dict с влиянием на различные знаки зодиака
-    """
-    influences = {}
-    base_exp = max(10, emotion_level * 5)
-
-    # Анализ контекста события для более точного распределения
-    event_lower = event_description.lower()
-
-    # Ключевые слова для разных знаков
-    keywords = {
-        'aries': ['действие', 'начало', 'инициатива', 'борьба', 'соревнование'],
-        'taurus': ['стабильность', 'терпение', 'материальное', 'комфорт', 'упорство'],
-        'gemini': ['общение', 'обучение', 'информация', 'любопытство', 'разговор'],
-        'cancer': ['семья', 'дом', 'эмоции', 'забота', 'защита'],
-        'leo': ['творчество', 'признание', 'лидерство', 'успех', 'выступление'],
-        'virgo': ['анализ', 'порядок', 'работа', 'детали', 'помощь'],
-        'libra': ['отношения', 'гармония', 'баланс', 'справедливость', 'красота'],
-        'scorpio': ['трансформация', 'глубина', 'страсть', 'тайна', 'изменение'],
-        'sagittarius': ['путешествие', 'философия', 'свобода', 'приключение', 'знание'],
-        'capricorn': ['цель', 'карьера', 'ответственность', 'достижение', 'дисциплина'],
-        'aquarius': ['инновация', 'независимость', 'друзья', 'будущее', 'уникальность'],
-        'pisces': ['интуиция', 'мечта', 'духовность', 'сострадание', 'искусство']
-    }
+# Состояние агента в аннотациях узлов (схема графа - graph_state_schema)
+AgentState = Dict[str, Any]
 
-    # Базовое распределение по эмоциям
-    if emotion_level >= 7:  # Позитивные эмоции
-        influences = {
-            'leo': base_exp * 1.2,
-            'sagittarius': base_exp * 1.1,
-            'aries': base_exp
-        }
-    elif emotion_level <= 3:  # Негативные эмоции - возможность роста
-        influences = {
-            'scorpio': base_exp * 1.2,
-            'capricorn': base_exp * 1.1,
-            'pisces': base_exp
-        }
-    else:  # Нейтральные
-        influences = {
-            'libra': base_exp * 1.1,
-            'virgo': base_exp
-        }
 
-    # Дополнительное влияние на основе ключевых слов
-    for sign, words in keywords.items():
-        for word in words:
-            if word in event_lower:
-                influences[sign] = influences.get(sign, 0) + base_exp * 0.3
+def graph_state_schema() -> type:
+    """Схема состояния графа LangGraph (сообщения объединяются через add_messages)"""
+    from langgraph.graph.message import add_messages
+
+    class GraphState(TypedDict):
+        """Состояние AI агента"""
+        messages: Annotated[list, add_messages]
+        task_type: str
+        user_profile: Dict[str, Any]
+        result: Dict[str, Any]
 
-    return influences
+    return GraphState
 
 
-def generate_tarot_spread(question: str) -> List[Dict[str, str]]:
+def generate_tarot_spread(question: str, rng: random.Random = None) -> List[Dict[str, str]]:
     """
     Генерирует расклад Таро на основе вопроса
 
     Args:
         question: Вопрос пользователя
+        rng: Генератор случайных чисел (по умолчанию - модуль random)
 
     Returns:
         list карт Таро для расклада
@@ -145,13 +109,15 @@ def generate_tarot_spread(question: str) -> List[Dict[str, str]]:
     selected = []
     used_indices = set()
 
+    rng = rng or random
+
     # 70% вероятность выбрать из предпочтительных карт
     for i in range(3):
-        if random.random() < 0.7 and preferred:
-            card = random.choice(preferred)
+        if rng.random() < 0.7 and preferred:
+            card = rng.choice(preferred)
             preferred.remove(card) if card in preferred else None
         else:
-            card = random.choice(available_cards)
+            card = rng.choice(available_cards)
 
         selected.append(card)
         available_cards.remove(card) if card in available_cards else None
@@ -168,23 +134,61 @@ class SoulMirrorAgent:
     AI агент с LangGraph для приложения SoulMirror
     """
 
-    def __init__(self, ollama_url: str = None, model: str = "llama2"):
+    def __init__(self, ollama_url: str = None, model: str = "llama2", sanitizer: PromptSanitizer = None,
+                 cassette: Cassette = None):
         self.ollama_url = ollama_url or os.getenv("OLLAMA_API_URL", "http://localhost:11434")
         self.model = model
 
-        # Инициализация LLM
-        try:
-            self.llm = Ollama(base_url=self.ollama_url, model=self.model)
-        except:
-            self.llm = None
-            print(f"Предупреждение: Ollama недоступна на {self.ollama_url}")
-
-        # Создаем граф для разных типов задач
-        self.graph = self._create_graph()
-
-    def _create_graph(self) -> StateGraph:
+        # Кассета для записи или воспроизведения ответов LLM (см. core/ai/cassette.py)
+        self.cassette = cassette
+
+        # Случайный выбор в промптах; с кассетой - воспроизводимый (одинаковые промпты записи и воспроизведения)
+        self.random = random.Random(cassette.seed if cassette is not None else None)
+
+        # Санитайзер пользовательского ввода (правила настраиваются через PROMPT_SANITIZER)
+        self.sanitizer = sanitizer or PromptSanitizer.from_settings()
+
+        # LLM LangChain и граф создаются при первом обращении
+        self._lock = threading.Lock()
+        self._llm_created = False
+        self._llm = None
+        self._graph = None
+
+    @property
+    def llm(self):
+        """LLM LangChain для узлов графа (None, если Ollama недоступна)"""
+        if not self._llm_created:
+            with self._lock:
+                if not self._llm_created:
+                    try:
+                        from langchain_community.llms import Ollama
+
+                        self._llm = Ollama(base_url=self.ollama_url, model=self.model)
+                    except Exception:
+                        self._llm = None
+                        print(f"Предупреждение: Ollama недоступна на {self.ollama_url}")
+                    self._llm_created = True
+        return self._llm
+
+    @llm.setter
+    def llm(self, value):
+        self._llm = value
+        self._llm_created = True
+
+    @property
+    def graph(self):
+        """Скомпилированный граф LangGraph для разных типов задач"""
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = self._create_graph()
+        return self._graph
+
+    def _create_graph(self):
         """Создает граф обработки с LangGraph"""
-        workflow = StateGraph(AgentState)
+        from langgraph.graph import StateGraph, END, START
+
+        workflow = StateGraph(graph_state_schema())
 
         # Добавляем узлы для разных задач
         workflow.add_node("analyze_context", self._analyze_context)
@@ -227,6 +231,8 @@ class SoulMirrorAgent:
         # Извлекаем информацию о событии
         event_info = messages[-1].content if messages else ""
 
+        from langchain_core.messages import SystemMessage
+
         # Добавляем системное сообщение с контекстом
         state["messages"].append(
             SystemMessage(content=f"Пользователь: {user_profile.get('inner_sign', 'неизвестный знак')}, уровень {user_profile.get('level', 1)}")
@@ -238,10 +244,12 @@ class SoulMirrorAgent:
         """Генерирует совет через LLM"""
         messages = state["messages"]
 
-        if self.llm:
+        if self._llm_available:
             try:
-                response = self.llm.invoke(str(messages[-1].content))
+                response = self._invoke_llm(str(messages[-1].content), state.get("task_type", "generic"))
                 state["result"] = {"advice": response}
+            except CassetteMiss:
+                raise
             except:
                 state["result"] = {"advice": self._get_fallback_response("совет")}
         else:
@@ -253,10 +261,12 @@ class SoulMirrorAgent:
         """Интерпретирует расклад Таро"""
         messages = state["messages"]
 
-        if self.llm:
+        if self._llm_available:
             try:
-                response = self.llm.invoke(str(messages[-1].content))
+                response = self._invoke_llm(str(messages[-1].content), state.get("task_type", "generic"))
                 state["result"] = {"interpretation": response}
+            except CassetteMiss:
+                raise
             except:
                 state["result"] = {"interpretation": self._get_fallback_response("таро")}
         else:
@@ -268,10 +278,12 @@ class SoulMirrorAgent:
         """Создает рекомендацию по задаче"""
         messages = state["messages"]
 
-        if self.llm:
+        if self._llm_available:
             try:
-                response = self.llm.invoke(str(messages[-1].content))
+                response = self._invoke_llm(str(messages[-1].content), state.get("task_type", "generic"))
                 state["result"] = {"task": response}
+            except CassetteMiss:
+                raise
             except:
                 state["result"] = {"task": self._get_fallback_response("задача")}
         else:
@@ -283,10 +295,12 @@ class SoulMirrorAgent:
         """Интерпретирует натальную карту"""
         messages = state["messages"]
 
-        if self.llm:
+        if self._llm_available:
             try:
-                response = self.llm.invoke(str(messages[-1].content))
+                response = self._invoke_llm(str(messages[-1].content), state.get("task_type", "generic"))
                 state["result"] = {"natal_interpretation": response}
+            except CassetteMiss:
+                raise
             except:
                 state["result"] = {"natal_interpretation": self._get_fallback_response("натальная карта")}
         else:
@@ -298,71 +312,59 @@ class SoulMirrorAgent:
         """
         Защита от prompt injection - очищает пользовательский ввод
         """
-        if not text or not isinstance(text, str):
-            return ""
-
-        # Список опасных паттернов для удаления/замены
-        dangerous_patterns = [
-            r'(?i)ты\s+[-–—]\s+',  # "Ты - "
-            r'(?i)ты\s+теперь\s+',  # "Ты теперь"
-            r'(?i)игнорируй\s+',  # "Игнорируй"
-            r'(?i)забудь\s+',  # "Забудь"
-            r'(?i)system\s*:',  # "system:"
-            r'(?i)assistant\s*:',  # "assistant:"
-            r'(?i)prompt\s*:',  # "prompt:"
-            r'(?i)инструкция\s*:',  # "инструкция:"
-            r'(?i)новая\s+роль',  # "новая роль"
-            r'(?i)притворись\s+',  # "притворись"
-            r'(?i)веди\s+себя\s+как',  # "веди себя как"
-            r'(?i)представь\s+что\s+ты',  # "представь что ты"
-        ]
-
-        import re
-        sanitized = text
-        for pattern in dangerous_patterns:
-            sanitized = re.sub(pattern, '', sanitized)
-
-        # Ограничиваем длину
-        max_length = 2000
-        if len(sanitized) > max_length:
-            sanitized = sanitized[:max_length]
-
-        return sanitized.strip()
+        result = self.sanitizer.scan(text)
+        if result.fired:
+            # debug: клиент может присылать такие строки в каждом запросе
+            logger.debug("В пользовательском вводе удалены паттерны %s", result.fired)
+        return result.text
 
     def _clean_ai_response(self, text: str) -> str:
         """
         Очищает ответ от лишних символов форматирования
         """
-        import re
-
-        # Удаляем markdown заголовки (# ## ###)
-        text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
-
-        # Удаляем жирный текст (**текст** или __текст__)
-        text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
-        text = re.sub(r'__(.+?)__', r'\1', text)
-
-        # Удаляем курсив (*текст* или _текст_)
-        text = re.sub(r'\*(.+?)\*', r'\1', text)
-        text = re.sub(r'_(.+?)_', r'\1', text)
-
-        # Удаляем нумерованные списки в начале строк (1. 2. 3. и т.д.)
-        text = re.sub(r'^\d+\.\s+', '', text, flags=re.MULTILINE)
+        return clean_response(text)
 
-        # Удаляем маркеры списков (- * +)
-        text = re.sub(r'^[-*+]\s+', '', text, flags=re.MULTILINE)
+    @property
+    def _replaying(self) -> bool:
+        return self.cassette is not None and self.cassette.replaying
 
-        # Удаляем множественные пробелы
-        text = re.sub(r'\s+', ' ', text)
+    @property
+    def _llm_available(self) -> bool:
+        """LLM для узлов графа: Ollama или кассета в режиме воспроизведения"""
+        return self.llm is not None or self._replaying
 
-        # Удаляем пробелы в начале и конце
-        text = text.strip()
-
-        return text
-
-    def _call_ollama(self, prompt: str, num_predict: int = 512) -> str:
+    def _invoke_llm(self, prompt: str, task: str = "generic") -> str:
+        """Вызов LLM из узла графа (с записью или воспроизведением через кассету)"""
+        started = time.monotonic()
+        outcome = "fallback"
+        try:
+            if self._replaying:
+                response = self.cassette.replay("llm", prompt, task=task)
+            else:
+                response = self.llm.invoke(prompt)
+                if self.cassette is not None:
+                    self.cassette.record(
+                        "llm", prompt, response, time.monotonic() - started,
+                        options={"model": self.model}, task=task
+                    )
+            outcome = "ok"
+            return response
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.llm_requests.inc(task=task, mode="llm", outcome=outcome)
+            metrics.llm_latency.observe(elapsed, task=task, mode="llm")
+            profiling.add("llm", elapsed)
+
+    def _call_ollama(self, prompt: str, num_predict: int = 512, task: str = "generic") -> str:
         """Вызывает Ollama API напрямую"""
+        started = time.monotonic()
+        outcome = "fallback"
         try:
+            if self._replaying:
+                result = self._clean_ai_response(self.cassette.replay("generate", prompt, num_predict, task=task).strip())
+                outcome = "ok"
+                return result
+
             response = requests.post(
                 f"{self.ollama_url}/api/generate",
                 json={
@@ -378,30 +380,127 @@ class SoulMirrorAgent:
             )
 
             if response.status_code == 200:
-                result = response.json().get("response", "").strip()
+                data = response.json()
+                metrics.observe_ollama(task, "generate", data)
+                result = data.get("response", "").strip()
+                if self.cassette is not None:
+                    self.cassette.record(
+                        "generate", prompt, result, time.monotonic() - started,
+                        num_predict=num_predict, options={"model": self.model, "temperature": 0.8}, task=task
+                    )
                 # Очищаем от лишних символов форматирования
                 result = self._clean_ai_response(result)
+                outcome = "ok"
                 return result
             else:
                 return self._get_fallback_response(prompt)
+        except CassetteMiss:
+            # Воспроизведение без записи - ошибка кассеты, а не повод для заготовки
+            raise
         except Exception as e:
             print(f"Ошибка при вызове Ollama: {e}")
             return self._get_fallback_response(prompt)
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.llm_requests.inc(task=task, mode="generate", outcome=outcome)
+            metrics.llm_latency.observe(elapsed, task=task, mode="generate")
+            profiling.add("llm", elapsed)
+
+    def _ollama_chunks(self, prompt: str, num_predict: int, task: str) -> Iterator[str]:
+        """Сырые фрагменты потокового ответа Ollama (или кассеты)"""
+        if self._replaying:
+            text = self.cassette.replay("stream", prompt, num_predict, task=task)
+            # Фрагменты по словам, как их отдает Ollama
+            for word in text.split(" "):
+                yield word + " "
+            return
+
+        started = time.monotonic()
+        chunks = []
+        with requests.post(
+            f"{self.ollama_url}/api/generate",
+            json={
+                "model": self.model,
+                "prompt": prompt,
+                "stream": True,
+                "options": {
+                    "temperature": 0.8,
+                    "num_predict": num_predict
+                }
+            },
+            timeout=90,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                return
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                chunks.append(data.get("response", ""))
+                yield chunks[-1]
+                if data.get("done"):
+                    # Финальный фрагмент содержит счетчики токенов и длительности
+                    metrics.observe_ollama(task, "stream", data)
+                    break
+
+        if self.cassette is not None:
+            self.cassette.record(
+                "stream", prompt, "".join(chunks).strip(), time.monotonic() - started,
+                num_predict=num_predict, options={"model": self.model, "temperature": 0.8}, task=task
+            )
+
+    def _stream_ollama(self, prompt: str, num_predict: int = 512, task: str = "generic") -> Iterator[str]:
+        """
+        Вызывает Ollama API в потоковом режиме и отдает очищенный текст по мере генерации
+        """
+        cleaner = ResponseCleaner()
+        started = time.monotonic()
+        streamed = False
+        try:
+            for chunk in self._ollama_chunks(prompt, num_predict, task):
+                cleaned = cleaner.feed(chunk)
+                if cleaned:
+                    if not streamed:
+                        metrics.llm_first_token.observe(time.monotonic() - started, task=task, mode="stream")
+                    streamed = True
+                    yield cleaned
+        except CassetteMiss:
+            raise
+        except Exception as e:
+            print(f"Ошибка при потоковом вызове Ollama: {e}")
+
+        tail = cleaner.finish()
+        if tail:
+            streamed = True
+            yield tail
+
+        elapsed = time.monotonic() - started
+        metrics.llm_requests.inc(task=task, mode="stream", outcome="ok" if streamed else "fallback")
+        metrics.llm_latency.observe(elapsed, task=task, mode="stream")
+        profiling.add("llm", elapsed)
+        if not streamed:
+            yield self._get_fallback_response(prompt)
+
+    FALLBACK_RESPONSES = {
+        "событие": "Каждое переживание - это шаг на пути самопознания. Примите свои чувства и используйте этот опыт для внутреннего роста.",
+        "совет": "Сегодня звезды советуют прислушаться к своему внутреннему голосу. Доверьтесь интуиции.",
+        "таро": "Карты указывают на период трансформации. Будьте открыты новым возможностям и доверьтесь своей мудрости.",
+        "задача": "Рекомендация: Исследуйте произведения, которые резонируют с вашей душой."
+    }
+    DEFAULT_FALLBACK = "Звезды благосклонны к вашему пути самопознания."
 
     def _get_fallback_response(self, context: str) -> str:
         """Возвращает fallback ответ"""
-        fallbacks = {
-            "событие": "Каждое переживание - это шаг на пути самопознания. Примите свои чувства и используйте этот опыт для внутреннего роста.",
-            "совет": "Сегодня звезды советуют прислушаться к своему внутреннему голосу. Доверьтесь интуиции.",
-            "таро": "Карты указывают на период трансформации. Будьте открыты новым возможностям и доверьтесь своей мудрости.",
-            "задача": "Рекомендация: Исследуйте произведения, которые резонируют с вашей душой."
-        }
-
-        for key, value in fallbacks.items():
+        for key, value in self.FALLBACK_RESPONSES.items():
             if key in context.lower():
                 return value
 
-        return "Звезды благосклонны к вашему пути самопознания."
+        return self.DEFAULT_FALLBACK
+
+    def is_fallback(self, text: str) -> bool:
+        """Ответ - заготовка, а не текст LLM"""
+        return text == self.DEFAULT_FALLBACK or text in self.FALLBACK_RESPONSES.values()
 
     def process_daily_entry(self, event_description: str, emotion_level: int, user_profile: Dict) -> Dict[str, Any]:
         """
@@ -445,12 +544,10 @@ class SoulMirrorAgent:
 Только текст. Профессионально и эмпатично.
 Ответь на русском языке."""
 
-        advice = self._call_ollama(prompt)
-        base_experience = max(10, emotion_level * 5)
-
+        advice = self._call_ollama(prompt, task="event")
         return {
             "advice": advice,
-            "experience_gained": int(base_experience),
+            "experience_gained": base_experience(emotion_level),
             "sign_influences": influences
         }
 
@@ -471,7 +568,7 @@ class SoulMirrorAgent:
             ('баланс', 'найди гармонию между делом и отдыхом, позаботься о себе'),
             ('творчество', 'дай волю креативности, попробуй что-то новое')
         ]
-        theme_name, theme_action = random.choice(themes)
+        theme_name, theme_action = self.random.choice(themes)
 
         prompt = f"""Ты - опытный астролог. Дай короткий вдохновляющий совет на день для знака {inner_sign}.
 
@@ -487,6 +584,8 @@ class SoulMirrorAgent:
 
         # Используем LangGraph для генерации
         try:
+            from langchain_core.messages import HumanMessage
+
             initial_state = {
                 "messages": [HumanMessage(content=prompt)],
                 "task_type": "daily_advice",
@@ -496,9 +595,11 @@ class SoulMirrorAgent:
 
             final_state = self.graph.invoke(initial_state)
             return final_state.get("result", {}).get("advice", self._get_fallback_response("совет"))
+        except CassetteMiss:
+            raise
         except Exception as e:
             print(f"Ошибка при генерации совета через LangGraph: {e}")
-            return self._call_ollama(prompt)
+            return self._call_ollama(prompt, task="daily_advice")
 
     def interpret_tarot_reading(self, question: str, cards: List[Dict], user_profile: Dict = None) -> str:
         """
@@ -529,6 +630,8 @@ class SoulMirrorAgent:
 
         # Используем LangGraph для интерпретации Таро
         try:
+            from langchain_core.messages import HumanMessage
+
             initial_state = {
                 "messages": [HumanMessage(content=prompt)],
                 "task_type": "tarot",
@@ -537,10 +640,12 @@ class SoulMirrorAgent:
             }
 
             final_state = self.graph.invoke(initial_state)
-            return final_state.get("result", {}).get("interpretation", self._call_ollama(prompt))
+            return final_state.get("result", {}).get("interpretation") or self._call_ollama(prompt, task="tarot")
+        except CassetteMiss:
+            raise
         except Exception as e:
             print(f"Ошибка при интерпретации Таро через LangGraph: {e}")
-            return self._call_ollama(prompt)
+            return self._call_ollama(prompt, task="tarot")
 
     def generate_task_recommendation(self, user_profile: Dict, target_sign: str, existing_titles: set = None) -> Dict[str, Any]:
         """
@@ -559,7 +664,7 @@ class SoulMirrorAgent:
             existing_titles = set()
 
         task_types = ['book', 'movie', 'series']
-        task_type = random.choice(task_types)
+        task_type = self.random.choice(task_types)
 
         type_names = {
             'book': 'книгу',
@@ -645,10 +750,10 @@ class SoulMirrorAgent:
 
         # Случайный выбор варианта качеств для разнообразия
         qualities_list = sign_qualities_variants.get(target_sign_safe, ['самопознание'])
-        qualities = random.choice(qualities_list)
+        qualities = self.random.choice(qualities_list)
 
         # Разные фокусы описания для разнообразия
-        description_focus = random.choice([
+        description_focus = self.random.choice([
             'сюжет и персонажи',
             'уроки и выводы',
             'эмоциональное воздействие',
@@ -696,7 +801,7 @@ class SoulMirrorAgent:
 
 Ответь на русском языке."""
 
-        response = self._call_ollama(prompt)
+        response = self._call_ollama(prompt, task="task_recommendation")
 
         # Улучшенный парсинг ответа
         lines = [line.strip() for line in response.strip().split('\n') if line.strip()]
@@ -807,65 +912,29 @@ class SoulMirrorAgent:
             "target_sign": target_sign
         }
 
-    def generate_natal_chart(self, birth_date, birth_sign: str) -> Dict[str, Any]:
-        """
-        Генерирует упрощенную натальную карту на основе даты рождения и знака зодиака
+    def generate_natal_chart(self, birth_date, birth_sign: str, birth_time=None) -> Dict[str, Any]:
         """
-        # Упрощенная система: используем знак зодиака и дату рождения для вариативности
-        # В реальной астрологии нужны точные координаты и время рождения
-
-        # Планеты в знаках (упрощенная версия)
-        zodiac_signs = ['aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo',
-                       'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius', 'pisces']
-
-        sign_index = zodiac_signs.index(birth_sign.lower()) if birth_sign.lower() in zodiac_signs else 0
-
-        # Используем дату рождения для создания уникального смещения домов
-        # Это даст разные дома для разных дат, даже при одном знаке зодиака
-        birth_hash = (birth_date.year + birth_date.month * 31 + birth_date.day) % 12
-
-        # Генерируем позиции планет с учетом даты рождения
-        # Используем дату для вариативности позиций планет
-        planet_seed = birth_date.year * 10000 + birth_date.month * 100 + birth_date.day
-        random.seed(planet_seed)  # Устанавливаем seed для воспроизводимости
-
-        planets = {
-            'Солнце': {'sign': birth_sign, 'house': 1, 'degree': random.randint(0, 29)},
-            'Луна': {'sign': zodiac_signs[(sign_index + random.randint(3, 5)) % 12], 'house': random.randint(1, 12), 'degree': random.randint(0, 29)},
-            'Меркурий': {'sign': zodiac_signs[(sign_index + random.choice([-1, 0, 1])) % 12], 'house': random.randint(1, 12), 'degree': random.randint(0, 29)},
-            'Венера': {'sign': zodiac_signs[(sign_index + random.choice([-2, -1, 0, 1, 2])) % 12], 'house': random.randint(1, 12), 'degree': random.randint(0, 29)},
-            'Марс': {'sign': zodiac_signs[(sign_index + random.randint(0, 11)) % 12], 'house': random.randint(1, 12), 'degree': random.randint(0, 29)},
-            'Юпитер': {'sign': zodiac_signs[(sign_index + random.randint(0, 11)) % 12], 'house': random.randint(1, 12), 'degree': random.randint(0, 29)},
-            'Сатурн': {'sign': zodiac_signs[(sign_index + random.randint(0, 11)) % 12], 'house': random.randint(1, 12), 'degree': random.randint(0, 29)},
-        }
-
-        # Сбрасываем seed для последующих случайных генераций
-        random.seed()
-
-        # Дома со знаками - используем birth_hash для уникального распределения
-        houses = {}
-        for i in range(1, 13):
-            # Комбинируем sign_index и birth_hash для уникальности
-            house_sign_index = (sign_index + birth_hash + i - 1) % 12
-            houses[str(i)] = zodiac_signs[house_sign_index]
+        Рассчитывает натальную карту по дате и времени рождения
 
-        return {
-            'planets': planets,
-            'houses': houses,
-            'aspects': []
-        }
-
-    def interpret_natal_chart(self, birth_sign: str, planets: Dict, user_profile: Dict) -> Dict[str, str]:
-        """
-        Создает AI интерпретацию натальной карты
+        Позиции планет, дома и аспекты считаются детерминированно упрощенной
+        эфемеридой (см. core.ai.ephemeris). birth_sign оставлен для совместимости:
+        знак Солнца определяется датой рождения.
         """
-        planets_info = "\n".join([
-            f"- {planet}: в знаке {data['sign']}, {data['house']} дом"
-            for planet, data in planets.items()
-        ])
+        charts = ephemeris.compute_charts([birth_date], [birth_time])
+        return ephemeris.chart_to_dict(charts, 0)
+
+    # Разделы интерпретации натальной карты (поле NatalChart -> заголовок)
+    NATAL_SECTIONS = {
+        'personality_reading': 'Общая интерпретация личности',
+        'career_reading': 'Карьера и профессиональное призвание',
+        'relationships_reading': 'Отношения и любовь',
+        'life_purpose_reading': 'Жизненное предназначение',
+    }
 
-        # Общая интерпретация
-        general_prompt = f"""Ты - астролог. Опиши личность по натальной карте.
+    def _natal_section_prompt(self, section: str, birth_sign: str, planets: Dict) -> str:
+        """Формирует промпт для одного раздела натальной карты"""
+        if section == 'personality_reading':
+            return f"""Ты - астролог. Опиши личность по натальной карте.
 
 Натальная карта:
 - Солнце в {birth_sign}
@@ -885,10 +954,8 @@ class SoulMirrorAgent:
 Только текст. Конкретно и понятно.
 Ответь на русском языке."""
 
-        general_interpretation = self._call_ollama(general_prompt, num_predict=800)
-
-        # Карьера
-        career_prompt = f"""Ты - карьерный астролог. Раскрой профессиональный потенциал.
+        if section == 'career_reading':
+            return f"""Ты - карьерный астролог. Раскрой профессиональный потенциал.
 
 Натальная карта:
 - Солнце в {birth_sign}
@@ -907,10 +974,8 @@ class SoulMirrorAgent:
 Только текст. Практично и понятно.
 Ответь на русском языке."""
 
-        career_reading = self._call_ollama(career_prompt, num_predict=800)
-
-        # Отношения
-        relationships_prompt = f"""Ты - астролог по отношениям. Раскрой любовную сферу.
+        if section == 'relationships_reading':
+            return f"""Ты - астролог по отношениям. Раскрой любовную сферу.
 
 Натальная карта:
 - Солнце в {birth_sign}
@@ -928,10 +993,8 @@ class SoulMirrorAgent:
 Только текст. Честно и понятно.
 Ответь на русском языке."""
 
-        relationships_reading = self._call_ollama(relationships_prompt, num_predict=800)
-
-        # Жизненное предназначение
-        purpose_prompt = f"""Ты - духовный астролог. Раскрой предназначение души.
+        if section == 'life_purpose_reading':
+            return f"""Ты - духовный астролог. Раскрой предназначение души.
 
 Натальная карта:
 - Солнце в {birth_sign}
@@ -949,11 +1012,59 @@ class SoulMirrorAgent:
 Только текст. Вдохновляюще и понятно.
 Ответь на русском языке."""
 
-        life_purpose_reading = self._call_ollama(purpose_prompt, num_predict=800)
+        raise ValueError(f"Неизвестный раздел натальной карты: {section}")
+
+    def interpret_natal_section(self, section: str, birth_sign: str, planets: Dict, user_profile: Dict = None) -> str:
+        """
+        Создает AI интерпретацию одного раздела натальной карты
+
+        Args:
+            section: Поле раздела из NATAL_SECTIONS (например, 'career_reading')
+            birth_sign: Знак рождения (отображаемое название)
+            planets: Позиции планет натальной карты
+            user_profile: Профиль пользователя
+        """
+        prompt = self._natal_section_prompt(section, birth_sign, planets)
+        return self._call_ollama(prompt, num_predict=800, task="natal_section")
+
+    def stream_natal_section(self, section: str, birth_sign: str, planets: Dict,
+                             user_profile: Dict = None) -> Iterator[str]:
+        """
+        То же, что interpret_natal_section, но отдает очищенный текст кусками по мере генерации
+        """
+        prompt = self._natal_section_prompt(section, birth_sign, planets)
+        return self._stream_ollama(prompt, num_predict=800, task="natal_section")
+
+    def interpret_natal_chart(self, birth_sign: str, planets: Dict, user_profile: Dict) -> Dict[str, str]:
+        """
+        Создает AI интерпретацию натальной карты по всем разделам сразу
+        """
+        readings = {
+            section: self.interpret_natal_section(section, birth_sign, planets, user_profile)
+            for section in self.NATAL_SECTIONS
+        }
 
         return {
-            'interpretation': general_interpretation,
-            'career_reading': career_reading,
-            'relationships_reading': relationships_reading,
-            'life_purpose_reading': life_purpose_reading
+            'interpretation': readings['personality_reading'],
+            'career_reading': readings['career_reading'],
+            'relationships_reading': readings['relationships_reading'],
+            'life_purpose_reading': readings['life_purpose_reading']
         }
+
+
+_agent: Optional[SoulMirrorAgent] = None
+_agent_lock = threading.Lock()
+
+
+def get_agent() -> SoulMirrorAgent:
+    """Агент процесса: создается при первом вызове с настройками OLLAMA_* и LLM_CASSETTE"""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = SoulMirrorAgent(
+                    ollama_url=settings.OLLAMA_API_URL,
+                    model=settings.OLLAMA_MODEL,
+                    cassette=Cassette.from_settings()
+                )
+    return _agent
@@ -0,0 +1,167 @@
+"""
+Запись и воспроизведение ответов LLM (кассеты)
+
+В режиме record агент выполняет настоящие запросы к Ollama и дописывает
+в кассету промпт (начало), параметры, сырой ответ и время ответа.
+В режиме replay ответы берутся из кассеты по ключу (вид вызова, промпт,
+num_predict) без обращения к Ollama, поэтому представления, разбор ответов
+и рендеринг работают детерминированно и с полной скоростью.
+
+Промпты совета дня, рекомендаций и раскладов содержат случайный выбор
+(тема, тип произведения, карты). Агент с кассетой берет его из генератора,
+засеянного SEED кассеты, поэтому при том же порядке вызовов промпты записи
+и воспроизведения совпадают. Если промпта нет в кассете (другой порядок
+или больше вызовов, чем записано), отдаются по очереди записи той же задачи
+(task) - счетчик substituted. Промах без записей задачи - CassetteMiss.
+
+Кассета - JSON Lines, сжатый gzip, если путь оканчивается на .gz.
+Несколько записей с одним ключом воспроизводятся по кругу.
+
+Настройки (settings.LLM_CASSETTE): PATH, MODE ('record' или 'replay'),
+LATENCY - задержка воспроизведения: None (без задержки), 'recorded'
+(как при записи) или число - множитель записанной задержки, SEED - зерно
+случайного выбора в промптах.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from django.conf import settings
+
+
+MODES = ('record', 'replay')
+
+# Сколько символов промпта сохранять для чтения кассеты человеком
+PROMPT_PREVIEW = 120
+
+
+class CassetteMiss(LookupError):
+    """В кассете нет ответа на запрос"""
+
+
+def cassette_key(kind: str, prompt: str, num_predict: Optional[int] = None) -> str:
+    """Ключ записи: вид вызова (generate, stream, llm), промпт и лимит токенов"""
+    raw = json.dumps([kind, prompt, num_predict], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = 'replay', latency: Union[None, str, float] = None, seed: int = 0):
+        if mode not in MODES:
+            raise ValueError(f"Режим кассеты должен быть одним из {', '.join(MODES)}")
+        self.path = str(path)
+        self.mode = mode
+        self.latency = latency
+        self.seed = int(seed)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        # Записи по (вид вызова, задача) в порядке записи - для промптов, которых нет в кассете
+        self._tasks: Dict[Tuple[str, str], List[dict]] = {}
+        self._task_cursor: Dict[Tuple[str, str], int] = {}
+        self.recorded = self.replayed = self.substituted = self.misses = 0
+        if mode == 'replay':
+            self._load()
+
+    @classmethod
+    def from_settings(cls) -> Optional['Cassette']:
+        """Кассета из settings.LLM_CASSETTE (None, если путь не задан)"""
+        config = getattr(settings, 'LLM_CASSETTE', {})
+        if not config.get('PATH'):
+            return None
+        return cls(config['PATH'], config.get('MODE', 'replay'), config.get('LATENCY'), config.get('SEED') or 0)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def _open(self, mode: str):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode + 't', encoding='utf-8')
+        return open(self.path, mode, encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Кассета не найдена: {self.path}")
+        with self._open('r') as f:
+            for line in f:
+                if line.strip():
+                    self._add(json.loads(line))
+
+    def _add(self, entry: dict):
+        self._entries.setdefault(entry['k'], []).append(entry)
+        if entry.get('a'):
+            self._tasks.setdefault((entry['t'], entry['a']), []).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def record(self, kind: str, prompt: str, response: str, seconds: float,
+               num_predict: Optional[int] = None, options: dict = None, task: str = None):
+        """Дописывает ответ в кассету (сразу в файл, чтобы запись не терялась при падении)"""
+        entry = {
+            'k': cassette_key(kind, prompt, num_predict),
+            't': kind,
+            'a': task,
+            'p': prompt[:PROMPT_PREVIEW],
+            'o': options or {},
+            'r': response,
+            's': round(seconds, 3),
+        }
+        with self._lock:
+            with self._open('a') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._add(entry)
+            self.recorded += 1
+
+    def replay(self, kind: str, prompt: str, num_predict: Optional[int] = None, task: str = None) -> str:
+        """
+        Ответ из кассеты (с задержкой по настройке LATENCY)
+
+        Без записи промпта - следующая запись той же задачи; без записей задачи - CassetteMiss
+        """
+        key = cassette_key(kind, prompt, num_predict)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries and task and (kind, task) in self._tasks:
+                key = (kind, task)
+                entries = self._tasks[key]
+                position = self._task_cursor.get(key, 0)
+                self._task_cursor[key] = position + 1
+                self.substituted += 1
+            elif not entries:
+                self.misses += 1
+                raise CassetteMiss(f"Нет записи в кассете для {kind} ({task}): {prompt[:60]!r}")
+            else:
+                position = self._cursor.get(key, 0)
+                self._cursor[key] = position + 1
+            self.replayed += 1
+            entry = entries[position % len(entries)]
+
+        delay = self.delay(entry['s'])
+        if delay:
+            time.sleep(delay)
+        return entry['r']
+
+    def delay(self, recorded_seconds: float) -> float:
+        """Задержка воспроизведения для записанного времени ответа"""
+        if self.latency in (None, '', 0):
+            return 0
+        if self.latency == 'recorded':
+            return recorded_seconds
+        return recorded_seconds * float(self.latency)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'entries': len(self),
+                'recorded': self.recorded,
+                'replayed': self.replayed,
+                'substituted': self.substituted,
+                'misses': self.misses,
+            }
@@ -0,0 +1,299 @@
+"""
+Однопроходная очистка ответов LLM от markdown-разметки
+
+Результат совпадает с прежней цепочкой из 8 регулярных выражений
+(заголовки, жирный/курсив, нумерация, маркеры списков, схлопывание пробелов),
+но текст обрабатывается построчно за один проход и может подаваться
+кусками по мере стриминга: ResponseCleaner хранит состояние между кусками
+и отдает очищенный текст, как только он перестает зависеть от продолжения.
+
+Все правила, кроме выделения, действуют только в начале строки, а выделение
+не переходит через перевод строки, поэтому строку можно обработать целиком,
+как только она закончилась. Незаконченную строку можно отдавать до первого
+символа '*' или '_', если начало строки уже однозначно разобрано.
+"""
+import re
+from typing import Callable, List, Optional
+
+
+# Выделение (**текст**, __текст__, *текст*, _текст_) снимается в том же
+# порядке, что и раньше; выражение применяется только к строкам, где есть его маркер
+_EMPHASIS_PATTERNS = [
+    ('**', re.compile(r'\*\*(.+?)\*\*')),
+    ('__', re.compile(r'__(.+?)__')),
+    ('*', re.compile(r'\*(.+?)\*')),
+    ('_', re.compile(r'_(.+?)_')),
+]
+
+
+def _header_marker(line: str) -> int:
+    """Длина маркера заголовка (# ... ######) в начале строки или 0"""
+    if line[:1] != '#':
+        return 0
+    count = len(line) - len(line.lstrip('#'))
+    return count if 1 <= count <= 6 else 0
+
+
+def _header_incomplete(prefix: str) -> bool:
+    """Начало строки еще может оказаться маркером заголовка"""
+    return len(prefix) <= 6 and prefix.strip('#') == ''
+
+
+def _number_marker(line: str) -> int:
+    """Длина маркера нумерованного списка (1. 2. ...) в начале строки или 0"""
+    if not line[:1].isdecimal():
+        return 0
+    digits = 1
+    while digits < len(line) and line[digits].isdecimal():
+        digits += 1
+    if digits and line[digits:digits + 1] == '.':
+        return digits + 1
+    return 0
+
+
+def _number_incomplete(prefix: str) -> bool:
+    """Начало строки еще может оказаться маркером нумерованного списка"""
+    return prefix.isdecimal() or (prefix.endswith('.') and prefix[:-1].isdecimal())
+
+
+def _bullet_marker(line: str) -> int:
+    """Длина маркера списка (- * +) в начале строки или 0"""
+    return 1 if line[:1] in ('-', '*', '+') else 0
+
+
+def _bullet_incomplete(prefix: str) -> bool:
+    """Начало строки еще может оказаться маркером списка"""
+    return prefix in ('-', '*', '+')
+
+
+def _strip_emphasis(line: str) -> str:
+    """Снимает выделение в пределах одной строки"""
+    for marker, pattern in _EMPHASIS_PATTERNS:
+        if marker in line:
+            line = pattern.sub(r'\1', line)
+    return line
+
+
+class _LineStartRule:
+    """
+    Правило вида ^МАРКЕР\\s+ в режиме MULTILINE
+
+    \\s+ после маркера может захватить перевод строки и пробелы следующих
+    строк - тогда следующая строка "приклеивается" на место удаленного маркера.
+    Само правило снова срабатывает на ней, только если у нее нет отступа
+    (иначе позиция уже не является началом строки).
+    """
+
+    def __init__(self, marker: Callable[[str], int], incomplete: Callable[[str], bool]):
+        self.marker = marker
+        self.incomplete = incomplete
+        self.consuming = False
+
+    def process(self, line: str, terminated: bool) -> Optional[str]:
+        """Обрабатывает законченную строку; None - строка поглощена вместе с переводом строки"""
+        if self.consuming:
+            stripped = line.lstrip()
+            if not stripped:
+                # Пробелы и перевод строки поглощаются предыдущим совпадением
+                self.consuming = terminated
+                return None if terminated else ''
+            self.consuming = False
+            if len(stripped) != len(line):
+                return stripped
+
+        length = self.marker(line)
+        if not length:
+            return line
+
+        rest = line[length:]
+        if rest and not rest[0].isspace():
+            return line
+
+        stripped = rest.lstrip()
+        if stripped:
+            return stripped
+        if terminated:
+            self.consuming = True
+            return None
+        # В конце текста маркер без пробела после него не совпадает
+        return '' if rest else line
+
+    def settle(self, prefix: str) -> Optional[int]:
+        """
+        Смещение начала контента для незаконченной строки или None,
+        если начало строки еще зависит от продолжения
+        """
+        offset = 0
+        if self.consuming:
+            stripped = prefix.lstrip()
+            if not stripped:
+                return None
+            offset = len(prefix) - len(stripped)
+            if offset:
+                return offset
+
+        if self.incomplete(prefix):
+            return None
+
+        length = self.marker(prefix)
+        if not length or not prefix[length].isspace():
+            return 0
+
+        stripped = prefix[length:].lstrip()
+        if not stripped:
+            return None
+        return len(prefix) - len(stripped)
+
+
+class ResponseCleaner:
+    """
+    Потоковый очиститель ответа LLM
+
+    Пример:
+        cleaner = ResponseCleaner()
+        for chunk in chunks:
+            output += cleaner.feed(chunk)
+        output += cleaner.finish()
+    """
+
+    def __init__(self):
+        self._header = _LineStartRule(_header_marker, _header_incomplete)
+        self._number = _LineStartRule(_number_marker, _number_incomplete)
+        self._bullet = _LineStartRule(_bullet_marker, _bullet_incomplete)
+
+        self._buffer = ''  # Незаконченная строка
+        self._partial_emitted = 0  # Сколько символов очищенной строки уже отдано
+        self._partial_offset = None  # Смещение контента незаконченной строки
+        self._partial_held = False  # В незаконченной строке встретилось выделение
+        self._started = False  # Был ли уже отдан непробельный текст
+        self._pending_space = False  # Нужно ли вставить пробел перед следующим словом
+
+    def feed(self, chunk: str) -> str:
+        """Принимает очередной кусок ответа и возвращает готовую очищенную часть"""
+        if not chunk:
+            return ''
+
+        self._buffer += chunk
+        output: List[str] = []
+
+        if '\n' in chunk:
+            *lines, self._buffer = self._buffer.split('\n')
+            # Законченные строки собираются вместе и схлопываются за один раз
+            ready = []
+            for line in lines:
+                processed = self._finish_line(line, True)
+                if processed is not None:
+                    ready.append(processed)
+                    ready.append('\n')
+            self._write(''.join(ready), output)
+
+        self._emit_partial(output)
+        return ''.join(output)
+
+    def finish(self) -> str:
+        """Завершает поток и возвращает остаток очищенного текста"""
+        output: List[str] = []
+        processed = self._finish_line(self._buffer, False)
+        if processed is not None:
+            self._write(processed, output)
+        self._buffer = ''
+        return ''.join(output)
+
+    def _process_line(self, line: str, terminated: bool) -> Optional[str]:
+        """Прогоняет строку через правила в прежнем порядке"""
+        first = line[:1]
+        if not (first in '#-*+' or first.isdecimal() or '*' in line or '_' in line
+                or self._header.consuming or self._number.consuming or self._bullet.consuming):
+            # Обычная строка текста без разметки
+            return line
+
+        line = self._header.process(line, terminated)
+        if line is None:
+            return None
+        line = _strip_emphasis(line)
+        line = self._number.process(line, terminated)
+        if line is None:
+            return None
+        return self._bullet.process(line, terminated)
+
+    def _finish_line(self, line: str, terminated: bool) -> Optional[str]:
+        """Обрабатывает законченную строку и возвращает еще не отданную ее часть"""
+        processed = self._process_line(line, terminated)
+        if processed is not None:
+            processed = processed[self._partial_emitted:]
+        self._partial_emitted = 0
+        self._partial_offset = None
+        self._partial_held = False
+        return processed
+
+    def _emit_partial(self, output: List[str]):
+        """Отдает начало незаконченной строки, если оно уже не изменится"""
+        line = self._buffer
+        if not line or self._partial_held:
+            return
+
+        if self._partial_offset is None:
+            # Правила начала строки смотрят только на текст до первого маркера выделения:
+            # дальше строка еще может измениться
+            prefix = line[:self._first_emphasis(line, 0)]
+            self._partial_offset = self._settle(prefix)
+            if self._partial_offset is None:
+                self._partial_held = len(prefix) < len(line)
+                return
+
+        start = self._partial_offset + self._partial_emitted
+        cut = self._first_emphasis(line, start)
+        if cut < len(line):
+            # Выделение может закрыться позже - держим строку с первого маркера
+            self._partial_held = True
+
+        if cut > start:
+            self._write(line[start:cut], output)
+            self._partial_emitted += cut - start
+
+    @staticmethod
+    def _first_emphasis(line: str, start: int) -> int:
+        """Позиция первого символа '*' или '_' начиная со start (или длина строки)"""
+        cut = len(line)
+        for marker in ('*', '_'):
+            position = line.find(marker, start, cut)
+            if position != -1:
+                cut = position
+        return cut
+
+    def _settle(self, prefix: str) -> Optional[int]:
+        """
+        Смещение контента незаконченной строки после правил начала строки
+        или None, если оно зависит от продолжения
+        """
+        total = 0
+        for rule in (self._header, self._number, self._bullet):
+            if total >= len(prefix):
+                return None
+            offset = rule.settle(prefix[total:])
+            if offset is None:
+                return None
+            total += offset
+        return total
+
+    def _write(self, text: str, output: List[str]):
+        """Схлопывает пробельные символы и обрезает пробелы по краям"""
+        if not text:
+            return
+        words = text.split()
+        if not words:
+            self._pending_space = True
+            return
+        if text[0].isspace():
+            self._pending_space = True
+        if self._pending_space and self._started:
+            output.append(' ')
+        output.append(' '.join(words))
+        self._started = True
+        self._pending_space = text[-1].isspace()
+
+
+def clean_response(text: str) -> str:
+    """Очищает полный ответ LLM от markdown-разметки"""
+    cleaner = ResponseCleaner()
+    return cleaner.feed(text) + cleaner.finish()
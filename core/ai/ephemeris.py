@@ -0,0 +1,275 @@
+"""
+Упрощенная векторизованная эфемерида для натальных карт
+
+Позиции планет считаются по упрощенным кеплеровым элементам орбит
+(Standish, JPL, эпоха J2000, точность порядка градуса для 1800-2050 гг.),
+Луна - по короткому ряду основных периодических членов. Все функции
+работают с массивами дат и считают сразу много карт за один вызов,
+глобальный генератор случайных чисел не используется.
+"""
+from datetime import date, time
+from typing import Dict, Any, List, Sequence, Optional
+
+import numpy as np
+
+
+ZODIAC_SIGNS = ['aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo',
+                'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius', 'pisces']
+
+# Порядок планет в массивах эфемериды
+PLANETS = ['Солнце', 'Луна', 'Меркурий', 'Венера', 'Марс', 'Юпитер', 'Сатурн']
+
+# Аспекты: (тип, угол, допустимый орбис в градусах)
+ASPECTS = [
+    ('conjunction', 0.0, 8.0),
+    ('sextile', 60.0, 6.0),
+    ('square', 90.0, 8.0),
+    ('trine', 120.0, 8.0),
+    ('opposition', 180.0, 8.0),
+]
+
+# Место рождения по умолчанию (Москва), если координаты неизвестны
+DEFAULT_LATITUDE = 55.7558
+DEFAULT_LONGITUDE = 37.6173
+DEFAULT_UTC_OFFSET = 3.0
+
+# Время рождения по умолчанию, если оно не указано
+DEFAULT_BIRTH_TIME = time(12, 0)
+
+J2000 = 2451545.0
+_J2000_DATETIME = np.datetime64('2000-01-01T12:00:00', 's')
+
+# Кеплеровы элементы: a (а.е.), e, I, L, долгота перигелия, долгота узла (град.)
+# и их скорости изменения за юлианское столетие
+_ELEMENTS = {
+    'Меркурий': ((0.38709927, 0.20563593, 7.00497902, 252.25032350, 77.45779628, 48.33076593),
+                 (0.00000037, 0.00001906, -0.00594749, 149472.67411175, 0.16047689, -0.12534081)),
+    'Венера': ((0.72333566, 0.00677672, 3.39467605, 181.97909950, 131.60246718, 76.67984255),
+               (0.00000390, -0.00004107, -0.00078890, 58517.81538729, 0.00268329, -0.27769418)),
+    'Земля': ((1.00000261, 0.01671123, -0.00001531, 100.46457166, 102.93768193, 0.0),
+              (0.00000562, -0.00004392, -0.01294668, 35999.37244981, 0.32327364, 0.0)),
+    'Марс': ((1.52371034, 0.09339410, 1.84969142, -4.55343205, -23.94362959, 49.55953891),
+             (0.00001847, 0.00007882, -0.00813131, 19140.30268499, 0.44441088, -0.29257343)),
+    'Юпитер': ((5.20288700, 0.04838624, 1.30439695, 34.39644051, 14.72847983, 100.47390909),
+               (-0.00011607, -0.00013253, -0.00183714, 3034.74612775, 0.21252668, 0.20469106)),
+    'Сатурн': ((9.53667594, 0.05386179, 2.48599187, 49.95424423, 92.59887831, 113.66242448),
+               (-0.00125060, -0.00050991, 0.00193609, 1222.49362201, -0.41897216, -0.28867794)),
+}
+
+# Общая прецессия по долготе (град. за столетие) для перехода к эклиптике даты
+_PRECESSION_PER_CENTURY = 1.396971
+
+# Основные члены ряда для долготы Луны: (амплитуда, фаза, скорость за столетие)
+_MOON_TERMS = np.array([
+    (6.29, 134.9, 477198.85),
+    (-1.27, 259.2, -413335.38),
+    (0.66, 235.7, 890534.23),
+    (0.21, 269.9, 954397.70),
+    (-0.19, 357.5, 35999.05),
+    (-0.11, 186.6, 966404.05),
+])
+
+
+def julian_day(birth_dates: Sequence[date], birth_times: Sequence[Optional[time]] = None,
+               utc_offset: float = DEFAULT_UTC_OFFSET) -> np.ndarray:
+    """
+    Переводит местные даты и время рождения в юлианские дни (UT)
+
+    Args:
+        birth_dates: Даты рождения
+        birth_times: Время рождения (None - полдень)
+        utc_offset: Смещение местного времени от UTC в часах
+
+    Returns:
+        массив юлианских дней формы (n,)
+    """
+    if birth_times is None:
+        birth_times = [None] * len(birth_dates)
+
+    days = np.array([np.datetime64(d, 'D') for d in birth_dates], dtype='datetime64[D]')
+    seconds = np.array([
+        (t or DEFAULT_BIRTH_TIME).hour * 3600 + (t or DEFAULT_BIRTH_TIME).minute * 60
+        for t in birth_times
+    ], dtype=np.int64)
+
+    moments = days.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+    elapsed = (moments - _J2000_DATETIME).astype(np.float64) / 86400.0
+    return J2000 + elapsed - utc_offset / 24.0
+
+
+def _solve_kepler(mean_anomaly: np.ndarray, eccentricity: np.ndarray) -> np.ndarray:
+    """Решает уравнение Кеплера методом Ньютона (радианы, векторно)"""
+    eccentric = mean_anomaly + eccentricity * np.sin(mean_anomaly)
+    for _ in range(6):
+        delta = (eccentric - eccentricity * np.sin(eccentric) - mean_anomaly) / (1 - eccentricity * np.cos(eccentric))
+        eccentric = eccentric - delta
+    return eccentric
+
+
+def _heliocentric(body: str, centuries: np.ndarray) -> np.ndarray:
+    """Гелиоцентрические эклиптические координаты J2000 (форма (n, 3), а.е.)"""
+    base, rate = _ELEMENTS[body]
+    a, e, inc, mean_long, peri, node = (b + r * centuries for b, r in zip(base, rate))
+
+    mean_anomaly = np.radians(np.mod(mean_long - peri + 180.0, 360.0) - 180.0)
+    inc, peri, node = np.radians(inc), np.radians(peri), np.radians(node)
+    arg_peri = peri - node
+
+    eccentric = _solve_kepler(mean_anomaly, e)
+    x_orb = a * (np.cos(eccentric) - e)
+    y_orb = a * np.sqrt(1 - e * e) * np.sin(eccentric)
+
+    cos_w, sin_w = np.cos(arg_peri), np.sin(arg_peri)
+    cos_n, sin_n = np.cos(node), np.sin(node)
+    cos_i, sin_i = np.cos(inc), np.sin(inc)
+
+    x = (cos_w * cos_n - sin_w * sin_n * cos_i) * x_orb + (-sin_w * cos_n - cos_w * sin_n * cos_i) * y_orb
+    y = (cos_w * sin_n + sin_w * cos_n * cos_i) * x_orb + (-sin_w * sin_n + cos_w * cos_n * cos_i) * y_orb
+    z = (sin_w * sin_i) * x_orb + (cos_w * sin_i) * y_orb
+    return np.stack([x, y, z], axis=-1)
+
+
+def planet_longitudes(jd: np.ndarray) -> np.ndarray:
+    """
+    Геоцентрические эклиптические долготы планет (тропический зодиак)
+
+    Returns:
+        массив формы (n, len(PLANETS)) в градусах [0, 360)
+    """
+    jd = np.asarray(jd, dtype=np.float64)
+    centuries = (jd - J2000) / 36525.0
+    earth = _heliocentric('Земля', centuries)
+
+    longitudes = np.empty((jd.shape[0], len(PLANETS)), dtype=np.float64)
+    longitudes[:, 0] = np.degrees(np.arctan2(-earth[:, 1], -earth[:, 0]))
+
+    # Ряд Луны дает долготу на эклиптике даты - приводим к J2000, как остальные планеты
+    amplitude, phase, speed = _MOON_TERMS.T
+    moon_args = np.radians(phase[None, :] + speed[None, :] * centuries[:, None])
+    longitudes[:, 1] = (218.32 + 481267.881 * centuries
+                        + np.sum(amplitude[None, :] * np.sin(moon_args), axis=1)
+                        - _PRECESSION_PER_CENTURY * centuries)
+
+    for index, planet in enumerate(PLANETS[2:], start=2):
+        geocentric = _heliocentric(planet, centuries) - earth
+        longitudes[:, index] = np.degrees(np.arctan2(geocentric[:, 1], geocentric[:, 0]))
+
+    # Переходим от эклиптики J2000 к эклиптике даты
+    longitudes += _PRECESSION_PER_CENTURY * centuries[:, None]
+    return np.mod(longitudes, 360.0)
+
+
+def ascendant(jd: np.ndarray, latitude: float = DEFAULT_LATITUDE,
+              longitude: float = DEFAULT_LONGITUDE) -> np.ndarray:
+    """Эклиптическая долгота асцендента в градусах для массива моментов"""
+    jd = np.asarray(jd, dtype=np.float64)
+    centuries = (jd - J2000) / 36525.0
+
+    sidereal = 280.46061837 + 360.98564736629 * (jd - J2000) + 0.000387933 * centuries ** 2
+    ramc = np.radians(np.mod(sidereal + longitude, 360.0))
+    obliquity = np.radians(23.439291 - 0.0130042 * centuries)
+    phi = np.radians(latitude)
+
+    asc = np.arctan2(np.cos(ramc), -(np.sin(ramc) * np.cos(obliquity) + np.tan(phi) * np.sin(obliquity)))
+    return np.mod(np.degrees(asc), 360.0)
+
+
+def aspect_matrix(longitudes: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Попарная матрица аспектов между планетами для каждой карты
+
+    Args:
+        longitudes: Долготы формы (n, p)
+
+    Returns:
+        dict с массивами формы (n, p, p):
+            'types' - индекс аспекта в ASPECTS или -1,
+            'orbs' - отклонение от точного аспекта в градусах
+    """
+    separation = np.abs(longitudes[:, :, None] - longitudes[:, None, :])
+    separation = np.minimum(separation, 360.0 - separation)
+
+    angles = np.array([angle for _, angle, _ in ASPECTS])
+    orbs_allowed = np.array([orb for _, _, orb in ASPECTS])
+
+    deviation = np.abs(separation[..., None] - angles)
+    within = deviation <= orbs_allowed
+    deviation = np.where(within, deviation, np.inf)
+
+    best = np.argmin(deviation, axis=-1)
+    best_orb = np.take_along_axis(deviation, best[..., None], axis=-1)[..., 0]
+    types = np.where(np.isfinite(best_orb), best, -1)
+
+    # Аспект планеты с самой собой не считается
+    diagonal = np.eye(longitudes.shape[1], dtype=bool)
+    types[:, diagonal] = -1
+
+    return {'types': types, 'orbs': np.where(types >= 0, best_orb, 0.0)}
+
+
+def compute_charts(birth_dates: Sequence[date], birth_times: Sequence[Optional[time]] = None,
+                   latitude: float = DEFAULT_LATITUDE, longitude: float = DEFAULT_LONGITUDE,
+                   utc_offset: float = DEFAULT_UTC_OFFSET) -> Dict[str, np.ndarray]:
+    """
+    Рассчитывает натальные карты для массива дат рождения одним векторным вызовом
+
+    Дома считаются по системе равных домов от асцендента.
+
+    Returns:
+        dict с массивами:
+            'longitudes' (n, p), 'ascendant' (n,), 'planet_houses' (n, p),
+            'house_signs' (n, 12), 'aspect_types' и 'aspect_orbs' (n, p, p)
+    """
+    jd = julian_day(birth_dates, birth_times, utc_offset)
+    longitudes = planet_longitudes(jd)
+    asc = ascendant(jd, latitude, longitude)
+
+    cusps = np.mod(asc[:, None] + 30.0 * np.arange(12)[None, :], 360.0)
+    planet_houses = (np.mod(longitudes - asc[:, None], 360.0) // 30).astype(np.int64) + 1
+    aspects = aspect_matrix(longitudes)
+
+    return {
+        'longitudes': longitudes,
+        'ascendant': asc,
+        'planet_houses': planet_houses,
+        'house_signs': (cusps // 30).astype(np.int64),
+        'aspect_types': aspects['types'],
+        'aspect_orbs': aspects['orbs'],
+    }
+
+
+def chart_to_dict(charts: Dict[str, np.ndarray], index: int) -> Dict[str, Any]:
+    """
+    Преобразует одну карту из результата compute_charts в формат NatalChart
+
+    Returns:
+        dict с ключами 'planets', 'houses', 'aspects'
+    """
+    longitudes = charts['longitudes'][index]
+
+    planets = {
+        planet: {
+            'sign': ZODIAC_SIGNS[int(longitudes[i] // 30)],
+            'house': int(charts['planet_houses'][index, i]),
+            'degree': int(longitudes[i] % 30),
+        }
+        for i, planet in enumerate(PLANETS)
+    }
+
+    houses = {
+        str(house + 1): ZODIAC_SIGNS[int(sign)]
+        for house, sign in enumerate(charts['house_signs'][index])
+    }
+
+    aspects: List[Dict[str, Any]] = []
+    types = charts['aspect_types'][index]
+    first, second = np.nonzero(np.triu(types >= 0, k=1))
+    for i, j in zip(first.tolist(), second.tolist()):
+        aspects.append({
+            'planet1': PLANETS[i],
+            'planet2': PLANETS[j],
+            'aspect_type': ASPECTS[types[i, j]][0],
+            'orb': round(float(charts['aspect_orbs'][index, i, j]), 1),
+        })
+
+    return {'planets': planets, 'houses': houses, 'aspects': aspects}
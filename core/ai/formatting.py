@@ -0,0 +1,79 @@
+"""
+Форматирование AI текстов в HTML
+
+HTML строится один раз при сохранении текста (см. RenderedTextModel в models.py)
+и хранится рядом с исходным текстом. AI_HTML_VERSION увеличивается при любом
+изменении разметки - сохраненный HTML старой версии считается устаревшим и
+пересобирается командой rebuild_ai_html.
+"""
+import re
+
+from django.utils.html import escape
+
+
+# Версия разметки: увеличить при изменении format_paragraphs/highlight_keywords
+AI_HTML_VERSION = 1
+
+# Ключевые астрологические термины для подсветки
+HIGHLIGHT_KEYWORDS = [
+    'Солнце', 'Луна', 'Меркурий', 'Венера', 'Марс', 'Юпитер', 'Сатурн',
+    'Овен', 'Телец', 'Близнецы', 'Рак', 'Лев', 'Дева',
+    'Весы', 'Скорпион', 'Стрелец', 'Козерог', 'Водолей', 'Рыбы'
+]
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+
+# Все термины в одном выражении: текст сканируется один раз, а не 19 раз.
+# Подсвечиваются только целые слова, поэтому порядок альтернатив не важен
+_KEYWORDS_PATTERN = re.compile(
+    r'\b(' + '|'.join(re.escape(keyword) for keyword in HIGHLIGHT_KEYWORDS) + r')\b',
+    re.IGNORECASE
+)
+
+
+def format_paragraphs(text: str) -> str:
+    """
+    Разбивает текст на абзацы по 2-3 предложения
+
+    Returns:
+        HTML из <p class="ai-paragraph">...</p>
+    """
+    if not text:
+        return ""
+
+    # Удаляем лишние пробелы и переносы строк
+    sentences = _SENTENCE_SPLIT.split(text.strip())
+
+    # Группируем по 2-3 предложения в абзац
+    paragraphs = []
+    current_paragraph = []
+
+    for i, sentence in enumerate(sentences):
+        current_paragraph.append(sentence)
+
+        # Создаем абзац каждые 2-3 предложения
+        if len(current_paragraph) >= 2 and (i == len(sentences) - 1 or len(current_paragraph) >= 3):
+            paragraphs.append(' '.join(current_paragraph))
+            current_paragraph = []
+
+    # Добавляем остаток, если есть
+    if current_paragraph:
+        paragraphs.append(' '.join(current_paragraph))
+
+    return ''.join([f'<p class="ai-paragraph">{p}</p>' for p in paragraphs])
+
+
+def highlight_keywords(text: str) -> str:
+    """Выделяет ключевые астрологические термины одним проходом"""
+    if not text:
+        return ""
+    return _KEYWORDS_PATTERN.sub(r'<span class="keyword-highlight">\1</span>', text)
+
+
+def render_ai_html(text: str) -> str:
+    """
+    Готовый HTML для AI текста: экранирование, абзацы и подсветка терминов
+    """
+    if not text:
+        return ""
+    return highlight_keywords(format_paragraphs(escape(text)))
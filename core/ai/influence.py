@@ -0,0 +1,273 @@
+"""
+Расчет влияния записей дневника на знаки зодиака
+
+Для каждого ключевого слова строятся его словоформы: основа плюс падежные
+окончания его типа склонения (семья -> семья, семьи, семье, семьей, семей...).
+Все формы собираются в одно скомпилированное выражение-дерево и ищутся как
+целые слова. Поэтому "семье" и "семьей" засчитываются как "семья", а "семь"
+и "семьдесят" - нет, и текст сканируется один раз, а не по разу на каждое
+из 60 ключевых слов.
+
+Для пересчета истории есть пакетный режим: влияние тысяч записей считается
+одним вызовом и собирается в матрицу NumPy (записи x знаки), базовое
+распределение по эмоциям при этом вычисляется векторно.
+"""
+import re
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+# Порядок знаков - столбцы матрицы влияний
+SIGN_ORDER = [
+    'aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo',
+    'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius', 'pisces',
+]
+
+# Ключевые слова для разных знаков
+SIGN_KEYWORDS: Dict[str, List[str]] = {
+    'aries': ['действие', 'начало', 'инициатива', 'борьба', 'соревнование'],
+    'taurus': ['стабильность', 'терпение', 'материальное', 'комфорт', 'упорство'],
+    'gemini': ['общение', 'обучение', 'информация', 'любопытство', 'разговор'],
+    'cancer': ['семья', 'дом', 'эмоции', 'забота', 'защита'],
+    'leo': ['творчество', 'признание', 'лидерство', 'успех', 'выступление'],
+    'virgo': ['анализ', 'порядок', 'работа', 'детали', 'помощь'],
+    'libra': ['отношения', 'гармония', 'баланс', 'справедливость', 'красота'],
+    'scorpio': ['трансформация', 'глубина', 'страсть', 'тайна', 'изменение'],
+    'sagittarius': ['путешествие', 'философия', 'свобода', 'приключение', 'знание'],
+    'capricorn': ['цель', 'карьера', 'ответственность', 'достижение', 'дисциплина'],
+    'aquarius': ['инновация', 'независимость', 'друзья', 'будущее', 'уникальность'],
+    'pisces': ['интуиция', 'мечта', 'духовность', 'сострадание', 'искусство'],
+}
+
+# Базовое распределение по эмоциям: множители базового опыта по знакам
+POSITIVE_WEIGHTS = {'leo': 1.2, 'sagittarius': 1.1, 'aries': 1.0}  # Эмоция 7-10
+NEGATIVE_WEIGHTS = {'scorpio': 1.2, 'capricorn': 1.1, 'pisces': 1.0}  # Эмоция 1-3 - возможность роста
+NEUTRAL_WEIGHTS = {'libra': 1.1, 'virgo': 1.0}  # Эмоция 4-6
+
+# Доля базового опыта за каждое найденное ключевое слово
+KEYWORD_WEIGHT = 0.3
+
+# Окончания словоформ по окончанию словарной формы (сначала длинные);
+# ключевое слово без подходящего окончания склоняется как "дом"
+_CONSONANT_ENDINGS = ('', 'а', 'у', 'е', 'ом', 'ы', 'и', 'ов', 'ам', 'ами', 'ах')
+_IA_ENDINGS = ('ия', 'ии', 'ию', 'ией', 'ий', 'иям', 'иями', 'иях')
+_IE_ENDINGS = ('ие', 'ия', 'ию', 'ием', 'ии', 'ий', 'иям', 'иями', 'иях')
+_SOFT_SIGN_ENDINGS = ('ь', 'и', 'ью', 'ей', 'ям', 'ями', 'ях')
+_PARADIGMS = (
+    ('ие', _IE_ENDINGS),
+    ('ия', _IA_ENDINGS),
+    ('ья', ('ья', 'ьи', 'ье', 'ью', 'ьей', 'ей', 'ьям', 'ьями', 'ьях')),
+    ('ое', ('ое', 'ого', 'ому', 'ым', 'ом', 'ая', 'ой', 'ую', 'ый', 'ые', 'ых', 'ыми')),
+    ('ее', ('ее', 'его', 'ему', 'им', 'ем', 'яя', 'ей', 'юю', 'ий', 'ие', 'их', 'ими')),
+    ('а', ('а', 'ы', 'и', 'е', 'у', 'ой', 'ою', '', 'ам', 'ами', 'ах')),
+    ('о', ('о', 'а', 'у', 'е', 'ом', '', 'ам', 'ами', 'ах')),
+    ('ь', _SOFT_SIGN_ENDINGS),
+)
+
+# Слова, которые не склоняются по окончанию словарной формы: основа и окончания
+_IRREGULAR = {
+    'дом': ('дом', _CONSONANT_ENDINGS + ('ой',)),
+    'порядок': ('поряд', ('ок', 'ка', 'ку', 'ке', 'ком', 'ки', 'ков', 'кам', 'ками', 'ках')),
+    'детали': ('детал', _SOFT_SIGN_ENDINGS),
+    'эмоции': ('эмоц', _IA_ENDINGS),
+    'отношения': ('отношен', _IE_ENDINGS),
+}
+
+
+def keyword_forms(word: str) -> List[str]:
+    """Словоформы ключевого слова: основа и падежные окончания его типа склонения"""
+    word = _normalize(word)
+    if word in _IRREGULAR:
+        stem, endings = _IRREGULAR[word]
+    else:
+        stem, endings = word, _CONSONANT_ENDINGS
+        for ending, paradigm in _PARADIGMS:
+            if word.endswith(ending):
+                stem, endings = word[:-len(ending)], paradigm
+                break
+    return sorted({stem + ending for ending in endings} | {word})
+
+
+def base_experience(emotion_level: int) -> int:
+    """Опыт за запись дневника (и база влияния на знаки)"""
+    return max(10, emotion_level * 5)
+
+
+def _normalize(text: str) -> str:
+    """Текст для поиска основ: нижний регистр, ё -> е"""
+    return text.lower().replace('ё', 'е')
+
+
+def _trie_pattern(stems: Sequence[str]) -> str:
+    """
+    Регулярное выражение-дерево по общим префиксам словоформ
+
+    Вместо плоской альтернации "работа|радость|разговор" строится "ра(?:бота|дость|зговор)":
+    regex-движок проверяет каждую букву один раз, а не перебирает все словоформы.
+    """
+    trie = {}
+    for stem in stems:
+        node = trie
+        for char in stem:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Форма может закончиться здесь, но совпадение продолжается жадно до более длинной
+        return '(?:' + pattern + ')?' if '' in node else pattern
+
+    return build(trie)
+
+
+class InfluenceScorer:
+    """
+    Скомпилированная таблица ключевых слов
+
+    Пример:
+        scorer = InfluenceScorer()
+        scorer.score(8, 'Ужин с семьей')  # {'leo': 48.0, ..., 'cancer': 12.0}
+        scorer.score_many(levels, descriptions)  # np.ndarray (n, 12)
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]] = None):
+        self.keywords = keywords if keywords is not None else SIGN_KEYWORDS
+
+        # Плоский список ключевых слов: индекс слова -> столбец знака
+        words = []
+        signs = []
+        for sign, sign_words in self.keywords.items():
+            for word in sign_words:
+                words.append(word)
+                signs.append(SIGN_ORDER.index(sign))
+        self.words = words
+        self._word_signs = signs
+        self._word_columns = np.array(signs, dtype=np.intp)
+
+        # Словоформа -> ключевые слова, к которым она относится
+        self._form_words: Dict[str, List[int]] = {}
+        for index, word in enumerate(words):
+            for form in keyword_forms(word):
+                self._form_words.setdefault(form, []).append(index)
+        # Форма засчитывается только целым словом: "семь" и "домофон" не совпадают
+        self._pattern = re.compile(r'\b' + _trie_pattern(self._form_words) + r'\b') if words else None
+
+        self._emotion_weights = np.zeros((3, len(SIGN_ORDER)))
+        for row, weights in enumerate((NEGATIVE_WEIGHTS, NEUTRAL_WEIGHTS, POSITIVE_WEIGHTS)):
+            for sign, weight in weights.items():
+                self._emotion_weights[row, SIGN_ORDER.index(sign)] = weight
+
+    @staticmethod
+    def emotion_weights(emotion_level: int) -> Dict[str, float]:
+        """Множители базового опыта для уровня эмоции"""
+        if emotion_level >= 7:
+            return POSITIVE_WEIGHTS
+        if emotion_level <= 3:
+            return NEGATIVE_WEIGHTS
+        return NEUTRAL_WEIGHTS
+
+    def _matched_ids(self, text: str) -> List[int]:
+        """Индексы ключевых слов, найденных в тексте (каждое один раз)"""
+        if not text or self._pattern is None:
+            return []
+        found = set()
+        for form in self._pattern.findall(_normalize(text)):
+            found.update(self._form_words[form])
+        return sorted(found)
+
+    def matched_words(self, text: str) -> List[str]:
+        """Ключевые слова, найденные в тексте"""
+        return [self.words[index] for index in self._matched_ids(text)]
+
+    def score(self, emotion_level: int, event_description: str = "") -> Dict[str, float]:
+        """
+        Влияние одной записи
+
+        Returns:
+            dict {знак: очки} только с затронутыми знаками
+        """
+        base_exp = base_experience(emotion_level)
+        influences = {sign: base_exp * weight for sign, weight in self.emotion_weights(emotion_level).items()}
+
+        # Дополнительное влияние на основе ключевых слов
+        for index in self._matched_ids(event_description):
+            sign = SIGN_ORDER[self._word_signs[index]]
+            influences[sign] = influences.get(sign, 0) + base_exp * KEYWORD_WEIGHT
+
+        return influences
+
+    def score_many(self, emotion_levels: Sequence[int], descriptions: Sequence[str]) -> np.ndarray:
+        """
+        Пакетный расчет влияния
+
+        Args:
+            emotion_levels: Уровни эмоций записей (1-10)
+            descriptions: Описания событий (в том же порядке)
+
+        Returns:
+            np.ndarray формы (n, 12): влияние каждой записи на знаки в порядке SIGN_ORDER
+        """
+        levels = np.asarray(emotion_levels, dtype=np.int64).reshape(-1)
+        count = len(levels)
+        if len(descriptions) != count:
+            raise ValueError("Количество уровней эмоций и описаний должно совпадать")
+
+        base_exp = np.maximum(10, levels * 5).astype(np.float64)
+        # 0 - негативные (<= 3), 1 - нейтральные, 2 - позитивные (>= 7)
+        bucket = np.where(levels >= 7, 2, np.where(levels <= 3, 0, 1))
+        result = self._emotion_weights[bucket] * base_exp[:, None]
+
+        if count and self._pattern is not None:
+            hits = self._keyword_hits(descriptions)
+            result += hits * (base_exp * KEYWORD_WEIGHT)[:, None]
+
+        return result
+
+    def _keyword_hits(self, descriptions: Sequence[str]) -> np.ndarray:
+        """Число разных ключевых слов каждого знака в каждой записи, матрица (n, 12)"""
+        findall = self._pattern.findall
+        form_words = self._form_words
+        rows = []
+        word_ids = []
+        for row, text in enumerate(descriptions):
+            if not text:
+                continue
+            # Каждое ключевое слово засчитывается в записи один раз
+            found = set()
+            for form in set(findall(_normalize(text))):
+                found.update(form_words[form])
+            rows.extend([row] * len(found))
+            word_ids.extend(found)
+
+        hits = np.zeros((len(descriptions), len(SIGN_ORDER)))
+        if word_ids:
+            columns = self._word_columns[np.array(word_ids, dtype=np.intp)]
+            np.add.at(hits, (np.array(rows, dtype=np.intp), columns), 1)
+        return hits
+
+
+def row_to_influences(row: np.ndarray) -> Dict[str, float]:
+    """Строка матрицы влияний -> словарь для DailyEntry.sign_influences"""
+    return {SIGN_ORDER[index]: float(row[index]) for index in np.flatnonzero(row)}
+
+
+# Таблица компилируется один раз на процесс
+default_scorer = InfluenceScorer()
+
+
+def calculate_zodiac_influence(emotion_level: int, event_description: str = "") -> Dict[str, float]:
+    """
+    Рассчитывает влияние события на знаки зодиака с учетом контекста
+
+    Args:
+        emotion_level: Уровень эмоции (1-10)
+        event_description: Описание события для контекста
+
+    Returns:
+        dict с влиянием на различные знаки зодиака
+    """
+    return default_scorer.score(emotion_level, event_description)
@@ -0,0 +1,142 @@
+"""
+Защита от prompt injection: однопроходная очистка пользовательского ввода
+
+Все правила компилируются в одно регулярное выражение-альтернацию, поэтому
+текст сканируется один раз (а не по разу на каждое правило). Текст обрезается
+до максимальной длины ДО сканирования.
+
+Альтернация применяется к тексту в нижнем регистре без флага IGNORECASE:
+так regex-движок использует быстрый поиск по первым символам правил, и
+чистый текст проходит почти без затрат. Поэтому правила записываются
+в нижнем регистре; если в каком-то правиле (например, из EXTRA_RULES)
+есть заглавные буквы, весь текст сканируется с IGNORECASE - медленнее,
+но правило не перестает срабатывать. Какое правило сработало,
+определяется только для найденных совпадений.
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+
+# Правила по умолчанию: (имя правила, регулярное выражение)
+DEFAULT_RULES: List[Tuple[str, str]] = [
+    ('role_assignment', r'ты\s+[-–—]\s+'),  # "Ты - "
+    ('role_switch', r'ты\s+теперь\s+'),  # "Ты теперь"
+    ('ignore', r'игнорируй\s+'),  # "Игнорируй"
+    ('forget', r'забудь\s+'),  # "Забудь"
+    ('system_prefix', r'system\s*:'),  # "system:"
+    ('assistant_prefix', r'assistant\s*:'),  # "assistant:"
+    ('prompt_prefix', r'prompt\s*:'),  # "prompt:"
+    ('instruction_prefix', r'инструкция\s*:'),  # "инструкция:"
+    ('new_role', r'новая\s+роль'),  # "новая роль"
+    ('pretend', r'притворись\s+'),  # "притворись"
+    ('act_as', r'веди\s+себя\s+как'),  # "веди себя как"
+    ('imagine_you', r'представь\s+что\s+ты'),  # "представь что ты"
+]
+
+DEFAULT_MAX_LENGTH = 2000
+
+# Удаление фрагмента может "склеить" новый опасный фрагмент ("заб<игнорируй >удь"),
+# поэтому проход повторяется, пока есть совпадения (но не больше этого числа раз)
+MAX_PASSES = 5
+
+
+class SanitizeResult(NamedTuple):
+    """Результат очистки: текст и сколько раз сработало каждое правило"""
+    text: str
+    fired: Dict[str, int]
+    truncated: bool
+
+
+class PromptSanitizer:
+    """
+    Очищает пользовательский ввод одним скомпилированным выражением
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, str]] = None, max_length: int = DEFAULT_MAX_LENGTH):
+        self.rules = list(rules if rules is not None else DEFAULT_RULES)
+        self.max_length = max_length
+
+        names = [name for name, _ in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("Имена правил санитайзера должны быть уникальны")
+
+        alternation = '|'.join(f'(?:{pattern})' for _, pattern in self.rules)
+        self._pattern = re.compile(alternation) if self.rules else None
+        # Запасной вариант для текста, длина которого меняется при lower() (например, "İ"),
+        # и для правил с заглавными буквами (литералы, [A-Z], \S), которые не совпадут с lower()
+        self._pattern_ci = re.compile(alternation, re.IGNORECASE) if self.rules else None
+        self._lowercase_rules = not any(char.isupper() for _, pattern in self.rules for char in pattern)
+        self._compiled_rules = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in self.rules]
+
+    @classmethod
+    def from_settings(cls) -> 'PromptSanitizer':
+        """
+        Создает санитайзер по настройке PROMPT_SANITIZER из settings.py
+
+        Поддерживаемые ключи: MAX_LENGTH, RULES (заменяет правила по умолчанию),
+        EXTRA_RULES (добавляются к правилам), DISABLED_RULES (имена отключаемых правил)
+        """
+        from django.conf import settings
+
+        config = getattr(settings, 'PROMPT_SANITIZER', {}) if settings.configured else {}
+        rules = [tuple(rule) for rule in config.get('RULES', DEFAULT_RULES)]
+        rules += [tuple(rule) for rule in config.get('EXTRA_RULES', [])]
+        disabled = set(config.get('DISABLED_RULES', []))
+
+        return cls(
+            rules=[rule for rule in rules if rule[0] not in disabled],
+            max_length=config.get('MAX_LENGTH', DEFAULT_MAX_LENGTH)
+        )
+
+    def scan(self, text: str) -> SanitizeResult:
+        """Очищает текст и сообщает, какие правила сработали"""
+        if not text or not isinstance(text, str):
+            return SanitizeResult('', {}, False)
+
+        truncated = len(text) > self.max_length
+        if truncated:
+            text = text[:self.max_length]
+
+        fired = Counter()
+        if self._pattern is not None:
+            for _ in range(MAX_PASSES):
+                text, count = self._remove_matches(text, fired)
+                if not count:
+                    break
+
+        return SanitizeResult(text.strip(), dict(fired), truncated)
+
+    def _remove_matches(self, text: str, fired: Counter) -> Tuple[str, int]:
+        """Один проход: удаляет все совпадения и считает сработавшие правила"""
+        lowered = text.lower()
+        if self._lowercase_rules and len(lowered) == len(text):
+            matches = self._pattern.finditer(lowered)
+        else:
+            lowered = text
+            matches = self._pattern_ci.finditer(text)
+
+        parts = []
+        position = 0
+        for match in matches:
+            start, end = match.span()
+            fired[self._rule_name_at(lowered, start)] += 1
+            parts.append(text[position:start])
+            position = end
+
+        if not parts:
+            return text, 0
+
+        parts.append(text[position:])
+        return ''.join(parts), len(parts) - 1
+
+    def _rule_name_at(self, text: str, position: int) -> str:
+        """Имя первого правила, совпадающего в позиции (как в альтернации)"""
+        for name, rule in self._compiled_rules:
+            if rule.match(text, position):
+                return name
+        return 'unknown'
+
+    def sanitize(self, text: str) -> str:
+        """Очищает текст (только результат)"""
+        return self.scan(text).text
@@ -0,0 +1,266 @@
+"""
+Архив старых записей дневника и раскладов Таро
+
+Записи старше порога переносятся из горячих таблиц в ArchivedHistory:
+по одному блоку на пользователя, вид и месяц, строки блока - JSON,
+сжатый zlib. Горячие таблицы и их индексы остаются небольшими, поэтому
+запросы последних записей и главной страницы не замедляются с ростом БД.
+
+Перенос идет группами (пользователь, месяц): в одной транзакции блок
+дополняется строками группы, а сами строки удаляются одним DELETE без
+сигналов. Архивные строки по-прежнему входят в сводную статистику.
+
+Истории читают оба уровня через history_page: курсоры те же, что у keyset
+пагинации, а архивные строки восстанавливаются несохраненными объектами
+моделей с исходными id (HTML строится на лету).
+
+Настройки (settings.ARCHIVE): пороги в днях по видам и LEVEL - степень сжатия.
+"""
+import json
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import DateField, F, QuerySet
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import fragment_cache
+from .models import ArchivedHistory, DailyEntry, TarotReading, UserStatsRollup
+from .pagination import PAGE_SIZE, KeysetPage, decode_cursor, encode_cursor, keyset_page
+
+
+DEFAULTS = {
+    'entries': 180,
+    'tarot': 180,
+    'LEVEL': 9,
+}
+
+# Вид архива -> модель горячей таблицы
+MODELS = {
+    'entries': DailyEntry,
+    'tarot': TarotReading,
+}
+
+
+def config(name: str):
+    return getattr(settings, 'ARCHIVE', {}).get(name, DEFAULTS[name])
+
+
+def _archived_fields(model) -> List:
+    """Поля, которые попадают в архив (без готового HTML: он строится заново)"""
+    skipped = set(model.RENDERED_FIELDS.values()) | {'html_version'}
+    return [field for field in model._meta.concrete_fields if field.name not in skipped]
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    """Даты с микросекундами: курсоры архивных и горячих строк должны совпадать"""
+
+    def default(self, o):
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _sort_key(row: dict):
+    return row['created_at'], row['id']
+
+
+def pack(rows: List[dict]) -> bytes:
+    return zlib.compress(json.dumps(rows, cls=ArchiveEncoder, ensure_ascii=False).encode(), config('LEVEL'))
+
+
+def unpack(model, payload) -> List[dict]:
+    """Строки блока; created_at разобран для сортировки и сравнения с курсором"""
+    rows = json.loads(zlib.decompress(bytes(payload)))
+    created_at = model._meta.get_field('created_at')
+    for row in rows:
+        row['created_at'] = created_at.to_python(row['created_at'])
+    return rows
+
+
+def restore(model, row: dict):
+    """Несохраненный объект модели из архивной строки (только для чтения)"""
+    values = {}
+    for field in _archived_fields(model):
+        if field.attname in row:
+            values[field.attname] = field.to_python(row[field.attname])
+    instance = model(**values)
+    instance._state.adding = False
+    return instance
+
+
+def _month_bounds(month) -> Tuple[datetime, datetime]:
+    start = timezone.make_aware(datetime(month.year, month.month, 1))
+    next_month = (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return start, timezone.make_aware(datetime(next_month.year, next_month.month, 1))
+
+
+def cutoff(days: int) -> datetime:
+    return timezone.now() - timedelta(days=days)
+
+
+def expired(kind: str, days: int) -> QuerySet:
+    """Строки горячей таблицы старше порога"""
+    rows = MODELS[kind].objects.filter(created_at__lt=cutoff(days))
+    if kind == 'entries':
+        # Запись, ждущая совета (импорт), остается в горячей таблице до backfill_entry_advice
+        rows = rows.filter(advice_pending=False)
+    return rows
+
+
+def _fill_block(block: ArchivedHistory, rows: List[dict]):
+    rows.sort(key=_sort_key, reverse=True)
+    block.payload = pack(rows)
+    block.rows = len(rows)
+    block.first_created_at = rows[-1]['created_at']
+    block.last_created_at = rows[0]['created_at']
+    if block.kind == 'entries':
+        block.emotion_sum = sum(row['emotion_level'] for row in rows)
+        block.days = sorted({str(row['date']) for row in rows})
+
+
+def archive_group(kind: str, user_id: int, month, queryset: QuerySet) -> int:
+    """
+    Переносит строки queryset пользователя за месяц в архивный блок
+
+    Returns:
+        количество перенесенных строк
+    """
+    model = MODELS[kind]
+    start, end = _month_bounds(month)
+    fields = [field.attname for field in _archived_fields(model)]
+
+    with transaction.atomic(using=queryset.db):
+        group = queryset.filter(user_id=user_id, created_at__gte=start, created_at__lt=end)
+        rows = list(group.values(*fields))
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+
+        block = (
+            ArchivedHistory.objects.select_for_update()
+            .filter(user_id=user_id, kind=kind, month=start.date()).first()
+        )
+        if block is None:
+            block = ArchivedHistory(user_id=user_id, kind=kind, month=start.date())
+        else:
+            rows.extend(unpack(model, block.payload))
+        _fill_block(block, rows)
+        block.save()
+
+        # Один DELETE без загрузки объектов и без сигналов: статистика не меняется
+        group.filter(pk__in=ids)._raw_delete(group.db)
+
+    fragment_cache.bump_version(user_id, kind)
+    return len(ids)
+
+
+def archive(kind: str, days: int, progress: Callable[[int, int, int], None] = None) -> int:
+    """
+    Переносит в архив строки старше days дней группами (пользователь, месяц)
+
+    Args:
+        progress: вызывается после каждой группы с (перенесено строк, обработано групп, всего групп)
+
+    Returns:
+        количество перенесенных строк
+    """
+    rows = expired(kind, days)
+    groups = list(
+        rows.annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .order_by('user_id', 'month').values_list('user_id', 'month').distinct()
+    )
+    moved = 0
+    for number, (user_id, month) in enumerate(groups, 1):
+        moved += archive_group(kind, user_id, month, rows)
+        if progress is not None:
+            progress(moved, number, len(groups))
+    return moved
+
+
+def prune(kind: str, before: datetime) -> int:
+    """
+    Удаляет из архива строки старше before (срок хранения) с поправкой сводок
+
+    Returns:
+        количество удаленных строк
+    """
+    model = MODELS[kind]
+    deleted = 0
+    blocks = ArchivedHistory.objects.filter(kind=kind, first_created_at__lt=before).order_by('pk')
+    for block_id in blocks.values_list('pk', flat=True):
+        with transaction.atomic():
+            block = ArchivedHistory.objects.select_for_update().get(pk=block_id)
+            kept = [row for row in unpack(model, block.payload) if row['created_at'] >= before]
+            removed = block.rows - len(kept)
+            if kept:
+                old_emotion = block.emotion_sum
+                _fill_block(block, kept)
+                block.save()
+                emotion = old_emotion - block.emotion_sum
+            else:
+                emotion = block.emotion_sum
+                block.delete()
+
+            if kind == 'entries':
+                # Серии дней пересчитывает rebuild_rollups
+                deltas = {'total_entries': F('total_entries') - removed, 'emotion_sum': F('emotion_sum') - emotion}
+            else:
+                deltas = {'total_tarot': F('total_tarot') - removed}
+            UserStatsRollup.objects.filter(user_id=block.user_id).update(**deltas)
+        fragment_cache.bump_version(block.user_id, kind)
+        deleted += removed
+    return deleted
+
+
+def _archived_page(kind: str, user_id: int, cursor, limit: int) -> List:
+    """До limit архивных объектов после курсора в порядке (-created_at, -id)"""
+    model = MODELS[kind]
+    blocks = ArchivedHistory.objects.filter(user_id=user_id, kind=kind).order_by('-month')
+    if cursor is not None:
+        blocks = blocks.filter(first_created_at__lte=cursor[0])
+
+    items = []
+    for payload in blocks.values_list('payload', flat=True).iterator(chunk_size=4):
+        for row in unpack(model, payload):
+            instance = restore(model, row)
+            if cursor is None or (instance.created_at, instance.pk) < cursor:
+                items.append(instance)
+        # Блоки идут по убыванию месяца: следующие блоки только старше
+        if len(items) >= limit:
+            break
+    return items[:limit]
+
+
+def history_page(kind: str, queryset: QuerySet, user_id: int, cursor: str = None,
+                 page_size: int = PAGE_SIZE) -> KeysetPage:
+    """
+    Страница истории по горячей таблице и архиву в порядке (-created_at, -id)
+
+    Пока строки горячей таблицы новее всего архива (обычный случай), это
+    keyset_page плюс одна проверка по индексу архива.
+    """
+    hot = keyset_page(queryset, 'created_at', cursor, page_size)
+    position = decode_cursor(cursor) if cursor else None
+
+    archive_blocks = ArchivedHistory.objects.filter(user_id=user_id, kind=kind)
+    if hot.next_cursor is not None:
+        # Страница полная: архив нужен, только если в нем есть строки новее ее конца
+        archive_blocks = archive_blocks.filter(last_created_at__gte=hot.items[-1].created_at)
+    elif position is not None:
+        archive_blocks = archive_blocks.filter(first_created_at__lte=position[0])
+    if not archive_blocks.exists():
+        return hot
+
+    archived = _archived_page(kind, user_id, position, page_size + 1)
+    items = sorted(hot.items + archived, key=lambda item: (item.created_at, item.pk), reverse=True)
+    if len(items) <= page_size and hot.next_cursor is None:
+        return KeysetPage(items, None)
+
+    items = items[:page_size]
+    last = items[-1]
+    return KeysetPage(items, encode_cursor(last.created_at, last.pk))
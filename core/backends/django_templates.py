@@ -0,0 +1,27 @@
+"""
+Бэкенд шаблонов Django с учетом времени рендеринга в профиле запроса (core/profiling.py)
+"""
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+from django.template.backends.django import Template as BaseTemplate
+from django.template.backends.django import reraise
+
+from core import profiling
+
+
+class Template(BaseTemplate):
+    def render(self, context=None, request=None):
+        # Вложенные include рендерятся движком напрямую и входят во время внешнего шаблона
+        with profiling.span('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
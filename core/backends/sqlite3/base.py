@@ -0,0 +1,54 @@
+"""
+SQLite для продакшена: PRAGMA при открытии соединения и BEGIN IMMEDIATE
+
+Дополнительные ключи DATABASES[...]['OPTIONS']:
+    pragmas - {имя: значение}, применяются к каждому новому соединению
+              (по умолчанию DEFAULT_PRAGMAS)
+    transaction_mode - режим BEGIN для transaction.atomic: DEFERRED,
+              IMMEDIATE или EXCLUSIVE
+
+При DEFERRED транзакция, которая сначала читает, а потом пишет, получает
+"database is locked" сразу, без ожидания busy_timeout, если другой писатель
+успел зафиксировать изменения. BEGIN IMMEDIATE берет блокировку записи
+в начале транзакции, и писатели выстраиваются в очередь.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+DEFAULT_PRAGMAS = {
+    # Читатели не блокируют писателя и наоборот
+    'journal_mode': 'WAL',
+    # Сколько миллисекунд ждать занятую блокировку вместо ошибки
+    'busy_timeout': 20000,
+    # В WAL режиме NORMAL не теряет целостность, fsync только при checkpoint
+    'synchronous': 'NORMAL',
+    # Отрицательное значение - размер кэша страниц в КиБ
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', DEFAULT_PRAGMAS)
+        self.transaction_mode = (kwargs.pop('transaction_mode', None) or 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode должен быть одним из {', '.join(TRANSACTION_MODES)}"
+            )
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
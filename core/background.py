@@ -0,0 +1,76 @@
+"""
+Фоновое выполнение долгих операций (генерация AI текстов) в пуле потоков процесса
+
+Задача с одним и тем же ключом выполняется не более одного раза одновременно:
+повторная отправка возвращает уже запущенный Future. Дедупликация действует
+в пределах процесса; между процессами от двойной записи защищают
+уникальные ограничения моделей.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import metrics
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: Dict[Hashable, Future] = {}
+_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Пул потоков создается при первой задаче"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+            thread_name_prefix='soulmirror-background'
+        )
+    return _executor
+
+
+def _run(key: Hashable, func: Callable, args, kwargs, submitted: float):
+    """Выполняет задачу в потоке пула и освобождает соединение с БД этого потока"""
+    metrics.queue_wait.observe(
+        time.monotonic() - submitted, task=key[0] if isinstance(key, tuple) else 'task'
+    )
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        print(f"Ошибка фоновой задачи {key}: {e}")
+        raise
+    finally:
+        connection.close()
+        with _lock:
+            _pending.pop(key, None)
+
+
+def submit_once(key: Hashable, func: Callable, *args, **kwargs) -> Future:
+    """
+    Запускает func в фоне, если задача с таким ключом еще не выполняется
+
+    Returns:
+        Future запущенной (новой или уже выполняющейся) задачи
+    """
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _get_executor().submit(_run, key, func, args, kwargs, time.monotonic())
+            _pending[key] = future
+        return future
+
+
+def wait_pending(timeout: Optional[float] = None):
+    """Ждет завершения всех выполняющихся задач (для тестов и нагрузочных прогонов)"""
+    with _lock:
+        futures = list(_pending.values())
+    for future in futures:
+        try:
+            future.result(timeout)
+        except Exception:
+            pass
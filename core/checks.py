@@ -0,0 +1,24 @@
+"""
+Проверки настроек при запуске (manage.py check, runserver, migrate)
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches)
+def check_fragment_cache(app_configs, **kwargs):
+    """Кэш фрагментов должен быть общим: версии увеличивают другие процессы и команды"""
+    alias = getattr(settings, 'FRAGMENT_CACHE', {}).get('ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend != LOCMEM_BACKEND:
+        return []
+    return [Warning(
+        f"Кэш фрагментов '{alias}' хранится в памяти процесса",
+        hint='Изменения из других воркеров и команд управления (archive_history, import_entries, '
+             'apply_retention, ...) не сбросят фрагменты. Задайте CACHE_BACKEND с общим хранилищем '
+             '(FileBasedCache, RedisCache).',
+        id='core.W001',
+    )]
@@ -0,0 +1,272 @@
+"""
+Массовый импорт записей дневника из других приложений (JSONL или CSV)
+
+Записи не проходят через LLM: влияние на знаки считается пакетно
+(InfluenceScorer.score_many), строки вставляются bulk_create, а опыт,
+прогресс знаков и сводная статистика применяются один раз на пользователя
+после всех пакетов. Совет для записи без ai_advice помечается ожидающим
+(advice_pending) и генерируется позже командой backfill_entry_advice
+с ограниченной частотой (core/refresh.py).
+
+Поля строки: event_description, emotion_level (1-10), необязательные
+created_at (дата или дата-время ISO), ai_advice и username (для команды).
+Весь импорт - одна транзакция; некорректные строки пропускаются
+и возвращаются в ImportResult.errors.
+
+Настройки (settings.DIARY_IMPORT): BATCH_SIZE - строк в пакете,
+MAX_ROWS - предел строк для загрузки через /entries-import/.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateField, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import experience, fragment_cache
+from .ai.influence import SIGN_ORDER, base_experience, default_scorer, row_to_influences
+from .models import DailyEntry, User, ZodiacProfile
+from .stats import rebuild_rollup
+
+
+DEFAULTS = {
+    'BATCH_SIZE': 1000,
+    'MAX_ROWS': 10000,
+}
+
+FORMATS = ('jsonl', 'csv')
+
+
+def config(name: str):
+    return getattr(settings, 'DIARY_IMPORT', {}).get(name, DEFAULTS[name])
+
+
+class InvalidRow(ValueError):
+    """Строку импорта нельзя превратить в запись дневника"""
+
+
+class ParsedEntry(NamedTuple):
+    user_id: int
+    event_description: str
+    emotion_level: int
+    created_at: datetime
+    ai_advice: str
+
+
+@dataclass
+class ImportResult:
+    """Итог импорта: создано записей, из них ждут совета, пользователей, ошибки (строка, текст)"""
+    created: int = 0
+    pending: int = 0
+    users: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+
+def read_rows(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """(номер строки, сырая строка JSONL или словарь CSV) без загрузки файла целиком"""
+    if fmt == 'csv':
+        # Первая строка - заголовок
+        for number, row in enumerate(csv.DictReader(lines), 2):
+            yield number, row
+        return
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            yield number, line
+
+
+def _created_at(value) -> datetime:
+    if not value:
+        return timezone.now()
+    value = str(value).strip()
+    # Дата проверяется первой: parse_datetime (fromisoformat) принимает и '2024-02-19' как полночь
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is not None:
+        # Запись без времени - середина дня, чтобы дата не сдвигалась часовым поясом
+        moment = datetime.combine(day, time(12))
+    else:
+        try:
+            moment = parse_datetime(value)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise InvalidRow(f'Некорректная дата: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class _Users:
+    """Пользователи по username (один запрос на имя) или единственный пользователь загрузки"""
+
+    def __init__(self, user=None):
+        self.user = user
+        self._ids: Dict[str, Optional[int]] = {}
+
+    def resolve(self, data: dict) -> int:
+        if self.user is not None:
+            return self.user.pk
+        username = str(data.get('username') or '').strip()
+        if not username:
+            raise InvalidRow('Не указан username')
+        if username not in self._ids:
+            self._ids[username] = User.objects.filter(username=username).values_list('pk', flat=True).first()
+        if self._ids[username] is None:
+            raise InvalidRow(f'Пользователь {username} не найден')
+        return self._ids[username]
+
+
+def parse_row(raw, users: _Users) -> ParsedEntry:
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as e:
+            raise InvalidRow(f'Некорректный JSON: {e}')
+    if not isinstance(raw, dict):
+        raise InvalidRow('Строка должна быть объектом')
+
+    description = str(raw.get('event_description') or '').strip()
+    if not description:
+        raise InvalidRow('Пустое event_description')
+    try:
+        emotion_level = int(raw.get('emotion_level'))
+    except (TypeError, ValueError):
+        raise InvalidRow('emotion_level должен быть числом')
+    if not 1 <= emotion_level <= 10:
+        raise InvalidRow('emotion_level должен быть от 1 до 10')
+
+    return ParsedEntry(
+        user_id=users.resolve(raw),
+        event_description=description,
+        emotion_level=emotion_level,
+        created_at=_created_at(raw.get('created_at') or raw.get('date')),
+        ai_advice=str(raw.get('ai_advice') or '').strip(),
+    )
+
+
+class _UserTotals:
+    """Сумма опыта и влияния на знаки импортированных записей пользователя"""
+
+    def __init__(self):
+        self.experience = 0
+        self.influences = np.zeros(len(SIGN_ORDER))
+
+
+def _insert(batch: List[ParsedEntry], totals: Dict[int, _UserTotals], result: ImportResult):
+    """Вставляет пакет одним bulk_create и одним UPDATE дат"""
+    matrix = default_scorer.score_many(
+        [parsed.emotion_level for parsed in batch],
+        [parsed.event_description for parsed in batch]
+    )
+
+    entries = []
+    for parsed, row in zip(batch, matrix):
+        entry = DailyEntry(
+            user_id=parsed.user_id,
+            event_description=parsed.event_description,
+            emotion_level=parsed.emotion_level,
+            ai_advice=parsed.ai_advice,
+            advice_pending=not parsed.ai_advice,
+            experience_gained=base_experience(parsed.emotion_level),
+            sign_influences=row_to_influences(row),
+        )
+        entry.render_html()
+        entries.append(entry)
+
+        user_totals = totals.setdefault(parsed.user_id, _UserTotals())
+        user_totals.experience += entry.experience_gained
+        user_totals.influences += row
+
+    DailyEntry.objects.bulk_create(entries)
+
+    # created_at и date заполняются auto_now_add при вставке - возвращаем исходные
+    DailyEntry.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+        created_at=Case(
+            *[When(pk=entry.pk, then=Value(parsed.created_at)) for entry, parsed in zip(entries, batch)],
+            output_field=DateTimeField()
+        ),
+        date=Case(
+            *[When(pk=entry.pk, then=Value(timezone.localdate(parsed.created_at)))
+              for entry, parsed in zip(entries, batch)],
+            output_field=DateField()
+        ),
+    )
+    result.created += len(entries)
+    result.pending += sum(1 for entry in entries if entry.advice_pending)
+
+
+def _apply_totals(totals: Dict[int, _UserTotals]):
+    """Опыт, прогресс знаков и сводка: по одному обновлению на пользователя"""
+    users = User.objects.in_bulk(list(totals))
+    profiles = {
+        profile.user_id: profile
+        for profile in ZodiacProfile.objects.filter(user_id__in=list(totals)).select_related('inner_sign')
+    }
+    for user_id, user_totals in totals.items():
+        experience.award(users[user_id], [('entry', user_totals.experience, None)])
+        profile = profiles.get(user_id)
+        if profile is not None:
+            profile.add_sign_progress(row_to_influences(user_totals.influences))
+            profile.follow_closest_sign()
+        # bulk_create не отправляет сигналов: сводка пересчитывается целиком
+        rebuild_rollup(user_id)
+
+
+def import_entries(rows: Iterable[Tuple[int, object]], user=None, batch_size: int = None,
+                   max_rows: int = None, dry_run: bool = False,
+                   progress: Callable[[ImportResult], None] = None) -> ImportResult:
+    """
+    Импортирует записи дневника
+
+    Args:
+        rows: Строки из read_rows
+        user: Все записи этому пользователю (колонка username не нужна)
+        max_rows: Предел корректных строк; при превышении импорт отменяется (InvalidRow)
+        dry_run: Проверить и посчитать без сохранения
+        progress: вызывается после каждого пакета с текущим ImportResult
+
+    Returns:
+        ImportResult
+    """
+    batch_size = batch_size or config('BATCH_SIZE')
+    users = _Users(user)
+    result = ImportResult()
+    totals: Dict[int, _UserTotals] = {}
+
+    with transaction.atomic():
+        batch = []
+        for number, raw in rows:
+            try:
+                batch.append(parse_row(raw, users))
+            except InvalidRow as e:
+                result.errors.append((number, str(e)))
+                continue
+            if max_rows is not None and result.created + len(batch) > max_rows:
+                raise InvalidRow(f'Больше {max_rows} записей за один импорт')
+            if len(batch) >= batch_size:
+                _insert(batch, totals, result)
+                batch = []
+                if progress is not None:
+                    progress(result)
+        if batch:
+            _insert(batch, totals, result)
+            if progress is not None:
+                progress(result)
+
+        _apply_totals(totals)
+        result.users = len(totals)
+        if dry_run:
+            transaction.set_rollback(True)
+
+    if not dry_run:
+        for user_id in totals:
+            fragment_cache.bump_version(user_id, 'entries')
+    return result
@@ -0,0 +1,128 @@
+"""
+Опыт пользователя: журнал начислений и атомарные итоги
+
+Каждое начисление добавляет строки в журнал ExperienceEvent, а итоговые
+User.total_experience и level меняются одним UPDATE через F() в той же
+транзакции. Поэтому одновременные запросы не теряют опыт, а опыт за период
+считается по журналу без пересчета истории.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Greatest, TruncDate
+
+from . import fragment_cache
+from .models import ExperienceEvent, User
+
+
+# Опыт на один общий уровень пользователя
+XP_PER_USER_LEVEL = 100
+
+
+def level_for(total_experience: int) -> int:
+    """Общий уровень пользователя для суммарного опыта"""
+    return total_experience // XP_PER_USER_LEVEL + 1
+
+
+@dataclass
+class AwardResult:
+    """Итог начисления опыта"""
+    amount: int
+    total_experience: int
+    level: int
+    leveled_up: bool
+
+
+def award(user, events: Iterable[Tuple[str, int, Optional[str]]]) -> AwardResult:
+    """
+    Начисляет опыт пользователю
+
+    Args:
+        user: Пользователь; его total_experience и level обновляются из БД
+        events: Начисления (источник, опыт, знак или None)
+
+    Returns:
+        AwardResult с новыми итогами пользователя
+    """
+    rows = [
+        ExperienceEvent(user_id=user.pk, source=source, amount=amount, sign=sign)
+        for source, amount, sign in events if amount
+    ]
+    amount = sum(row.amount for row in rows)
+    if not rows:
+        return AwardResult(0, user.total_experience, user.level, False)
+
+    with transaction.atomic():
+        ExperienceEvent.objects.bulk_create(rows)
+        # Уровень только растет: ручная корректировка в админке не понижает его
+        User.objects.filter(pk=user.pk).update(
+            total_experience=F('total_experience') + amount,
+            level=Greatest(F('level'), (F('total_experience') + amount) / XP_PER_USER_LEVEL + 1)
+        )
+        user.refresh_from_db(fields=['total_experience', 'level'])
+
+    fragment_cache.bump_version(user.pk, 'profile')
+    return AwardResult(
+        amount=amount,
+        total_experience=user.total_experience,
+        level=user.level,
+        leveled_up=user.level > level_for(user.total_experience - amount),
+    )
+
+
+def daily_experience(user, since: Optional[datetime] = None) -> List[dict]:
+    """
+    Опыт пользователя по дням: [{'day', 'amount'}] по возрастанию дат
+
+    Снимки учитываются днем, до которого они свернуты
+    """
+    events = ExperienceEvent.objects.filter(user=user)
+    if since is not None:
+        events = events.filter(created_at__gte=since)
+    return list(
+        events.annotate(day=TruncDate('created_at'))
+        .values('day').annotate(amount=Sum('amount')).order_by('day')
+    )
+
+
+def compact_ledger(before: datetime, batch_size: int = 500) -> Tuple[int, int]:
+    """
+    Сворачивает записи журнала старше before в снимки (пользователь, знак)
+
+    Суммы опыта сохраняются; снимок получает время последней свернутой записи.
+    Пользователи обрабатываются пакетами, каждый пакет - одной транзакцией.
+
+    Returns:
+        (удалено записей, создано снимков)
+    """
+    removed = created = 0
+    old_events = ExperienceEvent.objects.filter(created_at__lt=before)
+    user_ids = list(old_events.order_by('user_id').values_list('user_id', flat=True).distinct())
+
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        with transaction.atomic():
+            events = old_events.filter(user_id__in=batch)
+            groups = list(
+                events.order_by().values('user_id', 'sign')
+                .annotate(total=Sum('amount'), count=Count('id'), last=Max('created_at'))
+            )
+            # Пакет, где каждая группа уже одна запись, свернут ранее
+            if all(group['count'] == 1 for group in groups):
+                continue
+
+            removed += events.delete()[0]
+            snapshots = [
+                ExperienceEvent(
+                    user_id=group['user_id'], source='snapshot', amount=group['total'],
+                    sign=group['sign'], created_at=group['last']
+                )
+                for group in groups if group['total']
+            ]
+            ExperienceEvent.objects.bulk_create(snapshots)
+            created += len(snapshots)
+
+    return removed, created
@@ -0,0 +1,145 @@
+"""
+Потоковая выгрузка данных пользователя (CSV и JSONL)
+
+Строки читаются QuerySet.iterator(chunk_size=...) и архивными блоками по
+одному (core/archive.py), кодируются по одной и отдаются кусками ~64 КБ,
+поэтому память не зависит от размера истории - и в StreamingHttpResponse,
+и при записи файлов командой export_data.
+
+JSONL: все разделы в одном потоке, у каждой строки поле "type" с именем
+раздела. CSV: один раздел на поток (у разделов разные колонки).
+Сначала идут архивные строки, затем строки горячей таблицы.
+"""
+import csv
+import json
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.db.models.functions import Mod
+
+from . import archive
+from .models import ArchivedHistory, DailyEntry, NatalChart, TarotReading, Task
+
+
+CHUNK_SIZE = 500
+BUFFER_SIZE = 64 * 1024
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+@dataclass
+class Section:
+    """Раздел выгрузки: модель, поля (lookups для values_list) и вид архива"""
+    model: type
+    fields: Tuple[str, ...]
+    archive_kind: Optional[str] = None
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        # target_sign__name -> target_sign
+        return tuple(field.split('__')[0] for field in self.fields)
+
+
+SECTIONS = {
+    'entries': Section(DailyEntry, (
+        'id', 'user_id', 'date', 'created_at', 'event_description', 'emotion_level',
+        'ai_advice', 'experience_gained', 'sign_influences',
+    ), archive_kind='entries'),
+    'tasks': Section(Task, (
+        'id', 'user_id', 'task_type', 'title', 'author', 'description', 'target_sign__name',
+        'status', 'experience_reward', 'assigned_at', 'completed_at',
+    )),
+    'tarot': Section(TarotReading, (
+        'id', 'user_id', 'created_at', 'question', 'cards', 'interpretation',
+    ), archive_kind='tarot'),
+    'natal': Section(NatalChart, (
+        'id', 'user_id', 'birth_date', 'birth_time', 'birth_place', 'planets', 'houses', 'aspects',
+        'interpretation', 'personality_reading', 'career_reading', 'relationships_reading',
+        'life_purpose_reading', 'updated_at',
+    )),
+}
+
+
+def _scoped(queryset: QuerySet, user_id: int = None, shard: Tuple[int, int] = None) -> QuerySet:
+    """Строки одного пользователя или шарда (номер, всего) по user_id"""
+    if user_id is not None:
+        return queryset.filter(user_id=user_id)
+    if shard is not None:
+        index, shards = shard
+        return queryset.annotate(export_shard=Mod('user_id', shards)).filter(export_shard=index)
+    return queryset
+
+
+def iter_rows(name: str, user_id: int = None, shard: Tuple[int, int] = None,
+              chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """Строки раздела: сначала архив (по одному блоку), затем горячая таблица"""
+    section = SECTIONS[name]
+    if section.archive_kind is not None:
+        blocks = _scoped(ArchivedHistory.objects.filter(kind=section.archive_kind), user_id, shard)
+        payloads = blocks.order_by('user_id', 'month').values_list('payload', flat=True)
+        for payload in payloads.iterator(chunk_size=1):
+            # В блоке строки от новых к старым
+            for row in reversed(archive.unpack(section.model, payload)):
+                yield {column: row.get(column) for column in section.columns}
+
+    rows = _scoped(section.model.objects.all(), user_id, shard).order_by('user_id', 'pk')
+    for values in rows.values_list(*section.fields).iterator(chunk_size=chunk_size):
+        yield dict(zip(section.columns, values))
+
+
+def jsonl_lines(names: Iterable[str], **scope) -> Iterator[str]:
+    for name in names:
+        for row in iter_rows(name, **scope):
+            yield json.dumps({'type': name, **row}, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Line:
+    """Буфер для csv.writer, который возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(name: str, **scope) -> Iterator[str]:
+    writer = csv.writer(_Line())
+    columns = SECTIONS[name].columns
+    yield writer.writerow(columns)
+    for row in iter_rows(name, **scope):
+        yield writer.writerow([_csv_value(row[column]) for column in columns])
+
+
+def lines(fmt: str, names: Iterable[str], **scope) -> Iterator[str]:
+    """Строки выгрузки в формате fmt; для CSV names - ровно один раздел"""
+    if fmt == 'csv':
+        (name,) = names
+        return csv_lines(name, **scope)
+    return jsonl_lines(names, **scope)
+
+
+def buffered(lines: Iterable[str], size: int = BUFFER_SIZE) -> Iterator[bytes]:
+    """Склеивает строки в куски около size байт (меньше мелких записей в сокет)"""
+    chunk, length = [], 0
+    for line in lines:
+        data = line.encode()
+        chunk.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield b''.join(chunk)
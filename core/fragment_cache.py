@@ -0,0 +1,135 @@
+"""
+Кэш фрагментов шаблонов с версионированными ключами на пользователя
+
+Ключ фрагмента включает версии "областей" данных пользователя (записи,
+задания, Таро, профиль). Обработчики сигналов увеличивают версию области
+при изменении данных, поэтому старые фрагменты просто перестают
+находиться и вытесняются по таймауту - удалять их не нужно.
+
+Настройки (settings.FRAGMENT_CACHE): ALIAS - алиас кэша из CACHES,
+TIMEOUT - время жизни фрагмента в секундах.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+
+# Области данных пользователя, версии которых входят в ключи фрагментов
+SCOPES = ('entries', 'tasks', 'tarot', 'profile')
+
+DEFAULT_TIMEOUT = 24 * 60 * 60
+
+
+def _config() -> dict:
+    return getattr(settings, 'FRAGMENT_CACHE', {})
+
+
+def get_cache():
+    """Бэкенд кэша фрагментов"""
+    return caches[_config().get('ALIAS', 'default')]
+
+
+def _version_key(user_id: int, scope: str) -> str:
+    return f'fragver:{user_id}:{scope}'
+
+
+def bump_version(user_id: int, scope: str):
+    """Делает недействительными все фрагменты пользователя, зависящие от области"""
+    if scope not in SCOPES:
+        raise ValueError(f"Неизвестная область кэша фрагментов: {scope}")
+    cache = get_cache()
+    key = _version_key(user_id, scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Версия могла быть только что задана fragment_key другого процесса - увеличиваем ее
+        _seed_version(cache, key)
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+
+
+def _seed_version(cache, key: str) -> int:
+    """
+    Начальная версия области, которой нет в кэше (еще не было или вытеснена)
+
+    Версия уникальна (время в наносекундах), поэтому после вытеснения ключа
+    версии старые фрагменты с прежними номерами не становятся снова действительными.
+    add не перезапишет версию, уже заданную другим процессом.
+    """
+    cache.add(key, time.time_ns(), None)
+    return cache.get(key)
+
+
+def fragment_key(name: str, user_id: int, scopes: Iterable[str]) -> str:
+    """
+    Ключ фрагмента: имя, пользователь, текущие версии областей и дата
+    (дата нужна фрагментам, которые показывают "сегодня" и серии дней)
+    """
+    scopes = list(scopes)
+    cache = get_cache()
+    keys = [_version_key(user_id, scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if versions.get(key) is None:
+            versions[key] = _seed_version(cache, key)
+    version = '.'.join(str(versions[key]) for key in keys)
+    return f'fragment:{name}:{user_id}:{version}:{date.today().isoformat()}'
+
+
+class FragmentCacheStats:
+    """Счетчики попаданий и промахов по фрагментам (в пределах процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+
+    def record(self, name: str, hit: bool):
+        with self._lock:
+            if hit:
+                self._hits[name] += 1
+            else:
+                self._misses[name] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        """{фрагмент: {'hits', 'misses', 'hit_rate'}}"""
+        with self._lock:
+            names = set(self._hits) | set(self._misses)
+            result = {}
+            for name in sorted(names):
+                hits, misses = self._hits[name], self._misses[name]
+                result[name] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': round(hits / (hits + misses), 3),
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+
+stats = FragmentCacheStats()
+
+
+def get_fragment(name: str, key: str) -> Optional[str]:
+    """Готовый HTML фрагмента или None (попадание/промах учитываются в stats)"""
+    html = get_cache().get(key)
+    stats.record(name, html is not None)
+    metrics.cache_requests.inc(cache='fragment', result='hit' if html is not None else 'miss')
+    return html
+
+
+def set_fragment(key: str, html: str):
+    get_cache().set(key, html, _config().get('TIMEOUT', DEFAULT_TIMEOUT))
@@ -0,0 +1,189 @@
+"""
+Рейтинги пользователей по знакам зодиака
+
+Снимок опыта всех знаков читается одним запросом в столбцовые массивы NumPy
+и сортируется по знакам в списки пар (очки, пользователь). Место и процентиль
+пользователя находятся бинарным поиском (O(log n)), топ-N - срезом. Между
+снимками рейтинг догоняет данные по журналу опыта (ExperienceEvent после
+последнего учтенного id) - пользователь переносится на новое место через
+bisect без копирования всего рейтинга, а запись опыта не выполняет для
+рейтингов никакой дополнительной работы.
+
+Настройки (settings.LEADERBOARD): SNAPSHOT_INTERVAL - секунды между полными
+снимками, REFRESH_INTERVAL - секунды между догонами по журналу,
+TOP_LIMIT - максимальный размер топа в API.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Subquery
+
+from .models import ExperienceEvent, SignProgress, ZodiacProfile, ZodiacSign
+
+
+SIGN_CODES = [code for code, _ in ZodiacSign.SIGNS]
+
+DEFAULTS = {
+    'SNAPSHOT_INTERVAL': 60 * 60,
+    'REFRESH_INTERVAL': 60,
+    'TOP_LIMIT': 100,
+}
+
+
+def config(name: str):
+    return getattr(settings, 'LEADERBOARD', {}).get(name, DEFAULTS[name])
+
+
+def sign_score(level: int, experience: int) -> int:
+    """Суммарный опыт знака: уровни и опыт внутри текущего уровня"""
+    return (level - 1) * ZodiacProfile.XP_PER_LEVEL + experience
+
+
+def score_level(score: int) -> Tuple[int, int]:
+    """(уровень, опыт внутри уровня) для суммарного опыта знака"""
+    return score // ZodiacProfile.XP_PER_LEVEL + 1, score % ZodiacProfile.XP_PER_LEVEL
+
+
+class SignBoard:
+    """
+    Рейтинг одного знака: отсортированный список пар (-очки, user_id),
+    то есть очки по убыванию, при равенстве - по id пользователя
+    """
+
+    def __init__(self, user_ids: np.ndarray, scores: np.ndarray):
+        order = np.lexsort((user_ids, -scores))
+        self._entries: List[Tuple[int, int]] = list(zip((-scores[order]).tolist(), user_ids[order].tolist()))
+        self._scores: Dict[int, int] = dict(zip(user_ids.tolist(), scores.tolist()))
+        # Читатели не должны видеть пользователя снятым со старого места, но еще не поставленным на новое
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def score_of(self, user_id: int) -> int:
+        """Очки пользователя (0, если знаку еще не начислялся опыт)"""
+        return self._scores.get(user_id, 0)
+
+    def rank(self, user_id: int) -> Tuple[int, float]:
+        """
+        Место пользователя (1 - первое, равные очки делят место) и процентиль:
+        доля участников рейтинга с очками не выше, чем у пользователя
+        """
+        with self._lock:
+            total = len(self._entries)
+            # (-очки,) меньше любой пары с теми же очками: считаются только участники с большими очками
+            ahead = bisect.bisect_left(self._entries, (-self.score_of(user_id),))
+        if not total:
+            return 1, 100.0
+        return ahead + 1, round(100 * (total - ahead) / total, 1)
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """[(user_id, очки)] лучших limit пользователей"""
+        with self._lock:
+            entries = self._entries[:limit]
+        return [(user_id, -neg_score) for neg_score, user_id in entries]
+
+    def update(self, user_id: int, score: int):
+        """
+        Переносит пользователя на место, соответствующее новым очкам
+
+        Два бинарных поиска и сдвиг части списка на месте - без копирования рейтинга
+        """
+        with self._lock:
+            if user_id in self._scores:
+                position = bisect.bisect_left(self._entries, (-self._scores[user_id], user_id))
+                del self._entries[position]
+            bisect.insort(self._entries, (-score, user_id))
+            self._scores[user_id] = score
+
+
+class Leaderboard:
+    """Рейтинги всех знаков и отметка последней учтенной записи журнала опыта"""
+
+    def __init__(self, boards: Dict[str, SignBoard], last_event_id: int):
+        self.boards = boards
+        self.last_event_id = last_event_id
+        self.built_at = self.synced_at = time.monotonic()
+
+    @classmethod
+    def build(cls) -> 'Leaderboard':
+        """
+        Полный снимок: один запрос по строкам SignProgress
+
+        Последний id журнала опыта читается тем же SELECT, поэтому снимок
+        согласован с журналом без транзакции (BEGIN IMMEDIATE взял бы
+        блокировку записи SQLite ради чтения).
+        """
+        last_event = ExperienceEvent.objects.order_by('-id').values('id')[:1]
+        rows = list(
+            SignProgress.objects.annotate(last_event_id=Subquery(last_event))
+            .values_list('profile__user_id', 'sign', 'level', 'experience', 'last_event_id')
+        )
+
+        if rows:
+            user_ids, signs, levels, experience, last_ids = (np.array(column) for column in zip(*rows))
+            last_event_id = int(last_ids[0] or 0)
+            scores = (levels.astype(np.int64) - 1) * ZodiacProfile.XP_PER_LEVEL + experience
+            user_ids = user_ids.astype(np.int64)
+        else:
+            user_ids = scores = np.zeros(0, dtype=np.int64)
+            signs = np.zeros(0, dtype=str)
+            last_event_id = ExperienceEvent.objects.aggregate(last=Max('id'))['last'] or 0
+
+        boards = {}
+        for code in SIGN_CODES:
+            mask = signs == code
+            boards[code] = SignBoard(user_ids[mask], scores[mask])
+        return cls(boards, last_event_id)
+
+    def sync(self) -> int:
+        """
+        Учитывает опыт знаков, начисленный после снимка (записи журнала с знаком)
+
+        Returns:
+            количество учтенных записей журнала
+        """
+        events = list(
+            ExperienceEvent.objects.filter(id__gt=self.last_event_id, sign__isnull=False)
+            .exclude(source='snapshot')
+            .order_by('id').values_list('id', 'user_id', 'sign', 'amount')
+        )
+        deltas: Dict[Tuple[str, int], int] = {}
+        for event_id, user_id, sign, amount in events:
+            deltas[sign, user_id] = deltas.get((sign, user_id), 0) + amount
+            self.last_event_id = event_id
+
+        for (sign, user_id), amount in deltas.items():
+            board = self.boards.get(sign)
+            if board is not None:
+                board.update(user_id, board.score_of(user_id) + amount)
+
+        self.synced_at = time.monotonic()
+        return len(events)
+
+
+_leaderboard: Optional[Leaderboard] = None
+_lock = threading.Lock()
+
+
+def get_leaderboard() -> Leaderboard:
+    """Рейтинги процесса: полный снимок раз в SNAPSHOT_INTERVAL, догон по журналу раз в REFRESH_INTERVAL"""
+    global _leaderboard
+    with _lock:
+        now = time.monotonic()
+        if _leaderboard is None or now - _leaderboard.built_at >= config('SNAPSHOT_INTERVAL'):
+            _leaderboard = Leaderboard.build()
+        elif now - _leaderboard.synced_at >= config('REFRESH_INTERVAL'):
+            _leaderboard.sync()
+        return _leaderboard
+
+
+def reset():
+    """Сбрасывает рейтинги процесса (следующий запрос построит новый снимок)"""
+    global _leaderboard
+    with _lock:
+        _leaderboard = None
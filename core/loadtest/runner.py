@@ -0,0 +1,218 @@
+"""
+Сценарии пользователей для нагрузочного тестирования и сводка результатов
+
+Виртуальный пользователь проходит путь: регистрация, опросник, главная,
+запись дневника, Таро, задания (начать и завершить), натальная карта
+с разделом и статистика. Запросы идут либо по HTTP к запущенному серверу
+(HttpTransport), либо в процессе через django.test.Client (ClientTransport).
+"""
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class Sample:
+    """Один запрос: шаг сценария, статус и время ответа в секундах"""
+    endpoint: str
+    status: int
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return 0 < self.status < 400
+
+
+class HttpTransport:
+    """Запросы к запущенному серверу через requests (с CSRF токеном из cookie)"""
+
+    def __init__(self, base_url: str, timeout: float = 120):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def get(self, path: str) -> Tuple[int, str]:
+        response = self.session.get(self.base_url + path, allow_redirects=False, timeout=self.timeout)
+        return response.status_code, response.text
+
+    def post(self, path: str, data: dict) -> Tuple[int, str]:
+        token = self.session.cookies.get('csrftoken')
+        if token is None:
+            # Cookie с токеном выставляет любая страница с формой
+            self.get('/login/')
+            token = self.session.cookies.get('csrftoken', '')
+        response = self.session.post(
+            self.base_url + path, data={**data, 'csrfmiddlewaretoken': token},
+            headers={'X-CSRFToken': token, 'Referer': self.base_url + path},
+            allow_redirects=False, timeout=self.timeout
+        )
+        return response.status_code, response.text
+
+
+class ClientTransport:
+    """Запросы в процессе через django.test.Client"""
+
+    def __init__(self):
+        from django.conf import settings
+        from django.test import Client
+
+        # Имя хоста, которое пропустит ALLOWED_HOSTS (при DEBUG пустой список разрешает localhost)
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        self.client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+
+    def get(self, path: str) -> Tuple[int, str]:
+        response = self.client.get(path)
+        return response.status_code, response.content.decode()
+
+    def post(self, path: str, data: dict) -> Tuple[int, str]:
+        response = self.client.post(path, data)
+        return response.status_code, response.content.decode()
+
+
+QUESTION_RE = re.compile(r'name="question_(\d+)" value="(\d+)"')
+TASK_RE = re.compile(r'startTask\((\d+)\)')
+SIGNS = ('aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo',
+         'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius', 'pisces')
+EVENTS = (
+    'Весь день на работе, закончил сложный проект и почувствовал облегчение',
+    'Поссорился с другом, но вечером мы поговорили и помирились',
+    'Гулял в парке, читал книгу и размышлял о будущем',
+    'Начал изучать новый язык, было трудно, но интересно',
+)
+
+
+class Journey:
+    """Путь одного виртуального пользователя"""
+
+    def __init__(self, transport, record: Callable[[Sample], None], rng: random.Random):
+        self.transport = transport
+        self.record = record
+        self.rng = rng
+
+    def _call(self, endpoint: str, method: str, path: str, data: dict = None) -> Tuple[int, str]:
+        started = time.monotonic()
+        try:
+            if method == 'GET':
+                status, body = self.transport.get(path)
+            else:
+                status, body = self.transport.post(path, data or {})
+        except Exception as e:
+            print(f"Ошибка запроса {endpoint}: {e}")
+            status, body = 0, ''
+        self.record(Sample(endpoint, status, time.monotonic() - started))
+        return status, body
+
+    def run(self):
+        password = uuid.uuid4().hex
+        username = f'load_{uuid.uuid4().hex[:12]}'
+        self._call('register', 'POST', '/register/', {
+            'username': username, 'password': password, 'password_confirm': password,
+        })
+
+        _, quiz = self._call('quiz', 'GET', '/quiz/')
+        answers = {}
+        for question, answer in QUESTION_RE.findall(quiz):
+            answers.setdefault(f'question_{question}', answer)
+        self._call('quiz_submit', 'POST', '/quiz/', {**answers, 'birth_sign': self.rng.choice(SIGNS)})
+
+        self._call('dashboard', 'GET', '/')
+        self._call('daily_entry', 'POST', '/daily-entry/', {
+            'event_description': self.rng.choice(EVENTS), 'emotion_level': self.rng.randint(1, 10),
+        })
+        self._call('tarot', 'POST', '/tarot/', {'question': 'Что меня ждет на этой неделе?'})
+
+        _, tasks = self._call('tasks', 'GET', '/tasks/')
+        task_ids = TASK_RE.findall(tasks)
+        if task_ids:
+            self._call('start_task', 'POST', f'/tasks/{task_ids[0]}/start/')
+            self._call('complete_task', 'POST', f'/tasks/{task_ids[0]}/complete/')
+
+        self._call('natal_chart', 'POST', '/natal-chart/', {
+            'birth_date': f'{self.rng.randint(1960, 2005)}-{self.rng.randint(1, 12):02d}-{self.rng.randint(1, 28):02d}',
+            'birth_time': f'{self.rng.randint(0, 23):02d}:{self.rng.randint(0, 59):02d}',
+            'birth_place': 'Москва',
+        })
+        self._call('natal_section', 'POST', '/natal-chart/section/personality_reading/')
+        self._call('statistics', 'GET', '/statistics/')
+
+
+def run_journeys(transport_factory: Callable[[], object], users: int, concurrency: int,
+                 seed: Optional[int] = None) -> Tuple[List[Sample], float]:
+    """
+    Прогоняет users сценариев в concurrency потоков
+
+    Returns:
+        (все запросы, длительность прогона в секундах)
+    """
+    samples: List[Sample] = []
+    lock = threading.Lock()
+    seeds = random.Random(seed)
+    journey_seeds = [seeds.random() for _ in range(users)]
+
+    def record(sample: Sample):
+        with lock:
+            samples.append(sample)
+
+    def journey(journey_seed):
+        Journey(transport_factory(), record, random.Random(journey_seed)).run()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='loadtest') as executor:
+        list(executor.map(journey, journey_seeds))
+    return samples, time.monotonic() - started
+
+
+def _latency_summary(elapsed: List[float]) -> Dict[str, float]:
+    """Перцентили времени ответа в миллисекундах"""
+    values = np.asarray(elapsed) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'p50_ms': round(float(p50), 1),
+        'p95_ms': round(float(p95), 1),
+        'p99_ms': round(float(p99), 1),
+        'mean_ms': round(float(values.mean()), 1),
+        'max_ms': round(float(values.max()), 1),
+    }
+
+
+def summarize(samples: List[Sample], duration: float, llm: dict = None) -> dict:
+    """Сводка прогона: по шагам сценария, общая и по имитации LLM"""
+    endpoints = {}
+    for name in dict.fromkeys(sample.endpoint for sample in samples):
+        group = [sample for sample in samples if sample.endpoint == name]
+        errors = sum(1 for sample in group if not sample.ok)
+        endpoints[name] = {
+            'requests': len(group),
+            'errors': errors,
+            'error_rate': round(errors / len(group), 4),
+            **_latency_summary([sample.elapsed for sample in group]),
+        }
+
+    errors = sum(1 for sample in samples if not sample.ok)
+    report = {
+        'duration_s': round(duration, 2),
+        'total': {
+            'requests': len(samples),
+            'errors': errors,
+            'error_rate': round(errors / len(samples), 4) if samples else 0,
+            'throughput_rps': round(len(samples) / duration, 2) if duration else 0,
+            **(_latency_summary([sample.elapsed for sample in samples]) if samples else {}),
+        },
+        'endpoints': endpoints,
+    }
+    if llm is not None:
+        # Приложение отвечает запасным текстом на каждый неуспешный ответ LLM
+        report['llm'] = {
+            **llm,
+            'fallback_rate': round(llm['injected_errors'] / llm['requests'], 4) if llm['requests'] else 0,
+        }
+    return report
@@ -0,0 +1,162 @@
+"""
+Имитация Ollama API для нагрузочного тестирования
+
+Отвечает на POST /api/generate (обычный и потоковый режим) с задержкой
+первого токена и скоростью генерации из логнормальных распределений.
+Для запросов рекомендаций отдает ответ в формате "Название/Автор/Описание",
+который разбирает generate_task_recommendation.
+"""
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+WORDS = (
+    'звезды', 'советуют', 'сегодня', 'прислушаться', 'к', 'своей', 'интуиции', 'и', 'доверять',
+    'внутреннему', 'голосу', 'гармония', 'приходит', 'через', 'принятие', 'перемен', 'путь',
+    'самопознания', 'открывает', 'новые', 'возможности', 'для', 'роста',
+)
+
+
+@dataclass
+class StubConfig:
+    """Параметры имитации (медианы логнормальных распределений и их sigma)"""
+    latency_ms: float = 800.0
+    latency_sigma: float = 0.5
+    tokens_per_sec: float = 40.0
+    tokens_sigma: float = 0.3
+    response_tokens: int = 120
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+class StubOllamaServer:
+    """HTTP сервер с API Ollama в отдельном потоке"""
+
+    def __init__(self, config: StubConfig = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or StubConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._streamed = 0
+        self._busy_seconds = 0.0
+        self._titles = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'injected_errors': self._errors,
+                'streamed': self._streamed,
+                'mean_generation_ms': round(1000 * self._busy_seconds / max(self._requests - self._errors, 1), 1),
+            }
+
+    def _plan(self):
+        """(ошибка?, задержка первого токена, секунд на токен, токенов)"""
+        config = self.config
+        with self._lock:
+            self._requests += 1
+            failed = self._random.random() < config.error_rate
+            if failed:
+                self._errors += 1
+            latency = self._random.lognormvariate(0, config.latency_sigma) * config.latency_ms / 1000
+            rate = self._random.lognormvariate(0, config.tokens_sigma) * config.tokens_per_sec
+            tokens = max(1, int(self._random.gauss(config.response_tokens, config.response_tokens / 4)))
+        return failed, latency, 1 / rate, tokens
+
+    def _text(self, prompt: str, tokens: int) -> str:
+        with self._lock:
+            words = [self._random.choice(WORDS) for _ in range(tokens)]
+            self._titles += 1
+            title_number = self._titles
+        text = ' '.join(words).capitalize() + '.'
+        if 'Название:' in prompt:
+            # Уникальное название, чтобы генерация заданий не повторяла попытки
+            return f'Название: Произведение {title_number}\nАвтор: не указано\nОписание: {text}'
+        return text
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, data):
+                body = json.dumps(data, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._json(200, {'models': [{'name': 'stub'}]})
+                else:
+                    self._json(404, {'error': 'not found'})
+
+            def do_POST(self):
+                if self.path != '/api/generate':
+                    self._json(404, {'error': 'not found'})
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                num_predict = (payload.get('options') or {}).get('num_predict') or 512
+                failed, latency, per_token, tokens = stub._plan()
+                if failed:
+                    self._json(500, {'error': 'stub: injected error'})
+                    return
+
+                tokens = min(tokens, num_predict)
+                started = time.monotonic()
+                time.sleep(latency)
+                text = stub._text(payload.get('prompt', ''), tokens)
+
+                # Счетчики и длительности (в наносекундах), как в финальном ответе Ollama
+                totals = {
+                    'prompt_eval_count': len(payload.get('prompt', '').split()),
+                    'prompt_eval_duration': int(latency * 1e9),
+                    'load_duration': 0,
+                    'eval_count': tokens,
+                    'eval_duration': int(per_token * tokens * 1e9),
+                }
+                if payload.get('stream'):
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/x-ndjson')
+                    self.end_headers()
+                    for word in text.split(' '):
+                        time.sleep(per_token)
+                        self.wfile.write(json.dumps({'response': word + ' ', 'done': False}).encode() + b'\n')
+                    self.wfile.write(json.dumps({'response': '', 'done': True, **totals}).encode() + b'\n')
+                    with stub._lock:
+                        stub._streamed += 1
+                else:
+                    time.sleep(per_token * tokens)
+                    self._json(200, {'model': payload.get('model'), 'response': text, 'done': True, **totals})
+
+                with stub._lock:
+                    stub._busy_seconds += time.monotonic() - started
+
+        return Handler
@@ -0,0 +1,69 @@
+"""
+Management команда для удаления AI данных старше срока хранения
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.retention import POLICIES, config
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые советы дня и расклады Таро пакетами по диапазонам первичного ключа'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--policy',
+            action='append',
+            choices=sorted(POLICIES),
+            help='Политика хранения (можно указать несколько раз, по умолчанию - все)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Срок хранения в днях вместо settings.RETENTION для выбранных политик',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=config('BATCH_SIZE'),
+            help='Количество строк в одном DELETE',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько строк будет удалено',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 1:
+            raise CommandError('Срок хранения должен быть не меньше одного дня')
+
+        total = 0
+        for name in options['policy'] or sorted(POLICIES):
+            policy = POLICIES[name]
+            days = options['days'] or config(name)
+            expired = policy.expired(days)
+
+            if options['dry_run']:
+                count = expired.count()
+                batches = -(-count // options['batch_size'])
+                self.stdout.write(
+                    f'{policy.description}: старше {days} дн. (до {policy.cutoff(days)}) '
+                    f'будет удалено {count} в {batches} пакетах'
+                )
+                continue
+
+            def progress(deleted, count, description=policy.description):
+                self.stdout.write(f'{description}: удалено {deleted}/{count}')
+
+            deleted = policy.delete(expired, options['batch_size'], progress)
+            self.stdout.write(f'{policy.description}: старше {days} дн. удалено {deleted}')
+            archived = policy.delete_archived(days)
+            if archived:
+                self.stdout.write(f'{policy.description}: удалено из архива {archived}')
+                deleted += archived
+            total += deleted
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Пробный запуск: данные не изменены'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Сроки хранения применены! Удалено строк: {total}'))
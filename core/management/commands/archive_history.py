@@ -0,0 +1,61 @@
+"""
+Management команда для переноса старых записей дневника и раскладов Таро в архив
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import TruncMonth
+
+from core.archive import MODELS, archive, config, cutoff, expired
+from core.models import ArchivedHistory
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые записи в сжатый архив по пользователям и месяцам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            action='append',
+            choices=sorted(MODELS),
+            help='Что архивировать (можно указать несколько раз, по умолчанию - все)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Возраст переноса в днях вместо settings.ARCHIVE для выбранных видов',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько строк будет перенесено',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 1:
+            raise CommandError('Возраст переноса должен быть не меньше одного дня')
+
+        total = 0
+        for kind in options['kind'] or sorted(MODELS):
+            description = dict(ArchivedHistory.KINDS)[kind]
+            days = options['days'] or config(kind)
+            rows = expired(kind, days)
+
+            if options['dry_run']:
+                groups = rows.annotate(month=TruncMonth('created_at')).order_by().values('user_id', 'month').distinct()
+                count = rows.count()
+                self.stdout.write(
+                    f'{description}: старше {days} дн. (до {cutoff(days):%Y-%m-%d}) '
+                    f'будет перенесено {count} в {groups.count()} блоков'
+                )
+                continue
+
+            def progress(moved, done, groups, description=description):
+                self.stdout.write(f'{description}: перенесено {moved}, групп {done}/{groups}')
+
+            moved = archive(kind, days, progress)
+            self.stdout.write(f'{description}: старше {days} дн. перенесено {moved}')
+            total += moved
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Пробный запуск: данные не изменены'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Архивирование завершено! Перенесено строк: {total}'))
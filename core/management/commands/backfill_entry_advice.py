@@ -0,0 +1,32 @@
+"""
+Management команда генерации советов к импортированным записям дневника
+
+Низкий приоритет: записи обрабатываются по одной с ограниченной частотой,
+поэтому команду можно держать в cron рядом с рабочим сервером.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.refresh import EntryAdviceBackfill, refresh_stale
+
+
+class Command(BaseCommand):
+    help = 'Генерирует советы к записям дневника, ожидающим совета после импорта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=10, help='Обращений к LLM в минуту')
+        parser.add_argument('--limit', type=int, help='Обработать не больше указанного числа записей')
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0:
+            raise CommandError('Частота должна быть больше нуля')
+
+        kind = EntryAdviceBackfill()
+
+        def progress(done, swapped, count):
+            self.stdout.write(f'{kind.description}: обработано {done}/{count}, готово {swapped}')
+
+        swapped, skipped, failed = refresh_stale(kind, options['rate'], options['limit'], progress)
+        left = kind.stale().count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Советов готово: {swapped}, пропущено: {skipped}, ошибок: {failed}, ожидают: {left}'
+        ))
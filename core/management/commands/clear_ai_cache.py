@@ -1,8 +1,17 @@
 """
 Django management команда для очистки старых AI данных из БД
+
+Удаление идет пакетами по диапазонам первичного ключа (core/retention.py),
+удаление по сроку хранения - команда apply_retention.
+
+С --refresh советы дня и натальные карты не удаляются: записи помечаются
+устаревшими, продолжают показываться, и новые версии генерируются с
+ограниченной частотой (core/refresh.py).
 """
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from core.models import DailyAdvice, TarotReading, NatalChart
+from core.refresh import KINDS, refresh_stale
+from core.retention import POLICIES, delete_in_batches
 
 
 class Command(BaseCommand):
@@ -29,17 +38,37 @@ class Command(BaseCommand):
             action='store_true',
             help='Удалить только натальные карты',
         )
+        parser.add_argument(
+            '--refresh',
+            action='store_true',
+            help='Не удалять, а перегенерировать советы дня и натальные карты, показывая старые версии',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=30,
+            help='Обращений к LLM в минуту в режиме --refresh',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Обновить не больше указанного числа записей за запуск',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить обновление уже помеченных записей, не помечая новые',
+        )
 
     def handle(self, *args, **options):
+        if options['refresh']:
+            return self._refresh(options)
+
         if options['all']:
             # Удаляем все
-            advice_count = DailyAdvice.objects.all().count()
-            tarot_count = TarotReading.objects.all().count()
-            natal_count = NatalChart.objects.all().count()
-
-            DailyAdvice.objects.all().delete()
-            TarotReading.objects.all().delete()
-            NatalChart.objects.all().delete()
+            advice_count = POLICIES['advice'].delete(DailyAdvice.objects.all())
+            tarot_count = POLICIES['tarot'].delete(TarotReading.objects.all())
+            natal_count = delete_in_batches(NatalChart.objects.all())
 
             self.stdout.write(
                 self.style.SUCCESS(
@@ -50,20 +79,17 @@ class Command(BaseCommand):
                 )
             )
         elif options['advice']:
-            count = DailyAdvice.objects.all().count()
-            DailyAdvice.objects.all().delete()
+            count = POLICIES['advice'].delete(DailyAdvice.objects.all())
             self.stdout.write(
                 self.style.SUCCESS(f'Удалено советов дня: {count}')
             )
         elif options['tarot']:
-            count = TarotReading.objects.all().count()
-            TarotReading.objects.all().delete()
+            count = POLICIES['tarot'].delete(TarotReading.objects.all())
             self.stdout.write(
                 self.style.SUCCESS(f'Удалено раскладов таро: {count}')
             )
         elif options['natal']:
-            count = NatalChart.objects.all().count()
-            NatalChart.objects.all().delete()
+            count = delete_in_batches(NatalChart.objects.all())
             self.stdout.write(
                 self.style.SUCCESS(f'Удалено натальных карт: {count}')
             )
@@ -73,3 +99,39 @@ class Command(BaseCommand):
                     'Не выбрана опция. Используйте --all, --advice, --tarot или --natal'
                 )
             )
+
+    def _refresh(self, options):
+        if options['tarot']:
+            raise CommandError('Расклады таро не перегенерируются, используйте --tarot без --refresh')
+        if options['rate'] <= 0:
+            raise CommandError('Частота должна быть больше нуля')
+
+        names = [name for name in KINDS if options['all'] or options[name]]
+        if not names:
+            self.stdout.write(
+                self.style.WARNING('Не выбрана опция. Используйте --refresh с --all, --advice или --natal')
+            )
+            return
+
+        total = left_total = 0
+        for name in names:
+            kind = KINDS[name]
+            if not options['resume']:
+                marked = kind.mark_stale()
+                self.stdout.write(f'{kind.description}: помечено устаревшими {marked}')
+
+            def progress(done, swapped, count, description=kind.description):
+                self.stdout.write(f'{description}: обработано {done}/{count}, обновлено {swapped}')
+
+            swapped, skipped, failed = refresh_stale(kind, options['rate'], options['limit'], progress)
+            left = kind.stale().count()
+            self.stdout.write(
+                f'{kind.description}: обновлено {swapped}, пропущено {skipped}, ошибок {failed}, '
+                f'ожидают обновления {left}'
+            )
+            total += swapped
+            left_total += left
+
+        self.stdout.write(self.style.SUCCESS(f'Обновлено записей: {total}'))
+        if left_total:
+            self.stdout.write('Оставшиеся записи обновит повторный запуск с --refresh --resume')
@@ -0,0 +1,34 @@
+"""
+Management команда для сворачивания старых записей журнала опыта в снимки
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.experience import compact_ledger
+
+
+class Command(BaseCommand):
+    help = 'Сворачивает записи ExperienceEvent старше --days дней в снимки по пользователю и знаку'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=90,
+            help='Записи старше этого количества дней сворачиваются',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество пользователей в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        removed, created = compact_ledger(before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Журнал опыта свернут! Удалено записей: {removed}, создано снимков: {created}'
+        ))
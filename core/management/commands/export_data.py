@@ -0,0 +1,111 @@
+"""
+Management команда потоковой выгрузки данных пользователей в CSV или JSONL
+
+С --all пользователи делятся на шарды по user_id % --shards, каждый шард
+пишется в свои файлы и выгружается в своем потоке (--workers). --shard
+выгружает только один шард - так шарды можно запускать отдельными процессами.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import export
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает записи дневника, задания, расклады и натальные карты потоком с постоянной памятью'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Имя пользователя (выгрузка в --output или stdout)')
+        parser.add_argument('--all', action='store_true', help='Все пользователи по шардам в каталог --output')
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='jsonl', help='Формат выгрузки')
+        parser.add_argument(
+            '--section',
+            action='append',
+            choices=sorted(export.SECTIONS),
+            help='Раздел (можно указать несколько раз, по умолчанию - все)',
+        )
+        parser.add_argument('--output', help='Файл (для --user) или каталог (для --all)')
+        parser.add_argument('--shards', type=int, default=1, help='Количество шардов для --all')
+        parser.add_argument('--shard', type=int, help='Выгрузить только шард с этим номером (с нуля)')
+        parser.add_argument('--workers', type=int, default=4, help='Шардов, выгружаемых одновременно')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE, help='Строк в одном чтении из БД')
+
+    def handle(self, *args, **options):
+        sections = options['section'] or sorted(export.SECTIONS)
+        if options['user']:
+            return self._export_user(options, sections)
+        if not options['all']:
+            raise CommandError('Укажите --user или --all')
+        if not options['output']:
+            raise CommandError('Для --all укажите каталог --output')
+        if options['shards'] < 1:
+            raise CommandError('Количество шардов должно быть не меньше одного')
+
+        shards = options['shards']
+        indexes = range(shards) if options['shard'] is None else [options['shard']]
+        if any(not 0 <= index < shards for index in indexes):
+            raise CommandError(f'Номер шарда должен быть от 0 до {shards - 1}')
+
+        os.makedirs(options['output'], exist_ok=True)
+        workers = max(1, min(options['workers'], len(indexes)))
+        if workers == 1:
+            results = [self._export_shard(index, shards, sections, options) for index in indexes]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(
+                    lambda index: self._export_shard(index, shards, sections, options, pooled=True), indexes
+                ))
+
+        for paths, rows in results:
+            for path in paths:
+                self.stdout.write(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгрузка завершена! Шардов: {len(results)}, строк: {sum(rows for _, rows in results)}'
+        ))
+
+    def _export_user(self, options, sections):
+        if options['format'] == 'csv' and len(sections) != 1:
+            raise CommandError('Для CSV укажите один раздел --section')
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        lines = export.lines(options['format'], sections, user_id=user.id, chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(lines)
+            self.stdout.write(self.style.SUCCESS(f'Данные {user.username} сохранены в {options["output"]}'))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+    def _export_shard(self, index, shards, sections, options, pooled=False):
+        """Пишет файлы шарда; возвращает (пути, количество строк)"""
+        scope = {'shard': (index, shards), 'chunk_size': options['chunk_size']}
+        name = f'shard-{index}-of-{shards}'
+        if options['format'] == 'csv':
+            # У разделов разные колонки: по файлу на раздел
+            files = [(f'{section}-{name}.csv', export.csv_lines(section, **scope)) for section in sections]
+        else:
+            files = [(f'{name}.jsonl', export.jsonl_lines(sections, **scope))]
+
+        paths, rows = [], 0
+        try:
+            for filename, lines in files:
+                path = os.path.join(options['output'], filename)
+                with open(path, 'w', encoding='utf-8', newline='') as f:
+                    for line in lines:
+                        f.write(line)
+                        rows += 1
+                if options['format'] == 'csv':
+                    rows -= 1  # Заголовок
+                paths.append(path)
+        finally:
+            if pooled:
+                # Соединения потока пула
+                connections.close_all()
+        return paths, rows
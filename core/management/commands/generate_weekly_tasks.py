@@ -5,8 +5,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 from core.models import User, ZodiacSign, Task, ZodiacProfile
-from core.ai.agent import SoulMirrorAgent
-from django.conf import settings
+from core.ai.agent import get_agent
 import random
 
 
@@ -16,10 +15,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write('Генерация еженедельных заданий...')
 
-        ai_agent = SoulMirrorAgent(
-            ollama_url=settings.OLLAMA_API_URL,
-            model=settings.OLLAMA_MODEL
-        )
+        ai_agent = get_agent()
 
         # Получаем всех активных пользователей
         users = User.objects.filter(completed_initial_quiz=True)
@@ -47,9 +43,10 @@ class Command(BaseCommand):
                 # Можно выбрать случайный или тот, к которому меньше всего прогресса
                 all_signs = ZodiacSign.objects.all()
 
-                if profile.sign_progress:
+                sign_progress = profile.get_sign_progress()
+                if sign_progress:
                     # Выбираем знак с наименьшим прогрессом
-                    min_sign_name = min(profile.sign_progress.items(), key=lambda x: x[1])[0]
+                    min_sign_name = min(sign_progress.items(), key=lambda x: x[1])[0]
                     target_sign = ZodiacSign.objects.get(name=min_sign_name)
                 else:
                     # Случайный знак
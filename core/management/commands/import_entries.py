@@ -0,0 +1,53 @@
+"""
+Management команда массового импорта записей дневника из JSONL или CSV
+
+Советы к записям без ai_advice генерирует позже backfill_entry_advice.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.diary_import import FORMATS, InvalidRow, config, import_entries, read_rows
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = 'Импортирует записи дневника пакетами без обращений к LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL или CSV')
+        parser.add_argument('--format', choices=FORMATS, help='Формат (по умолчанию - по расширению файла)')
+        parser.add_argument('--user', help='Импортировать все записи этому пользователю (без колонки username)')
+        parser.add_argument('--batch-size', type=int, default=config('BATCH_SIZE'), help='Строк в одном INSERT')
+        parser.add_argument('--dry-run', action='store_true', help='Проверить файл без сохранения')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'jsonl')
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        def progress(result):
+            self.stdout.write(f'  Импортировано записей: {result.created}, ошибок: {len(result.errors)}')
+
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as f:
+                result = import_entries(
+                    read_rows(f, fmt), user=user, batch_size=options['batch_size'],
+                    dry_run=options['dry_run'], progress=progress
+                )
+        except (OSError, InvalidRow) as e:
+            raise CommandError(str(e))
+
+        for number, error in result.errors[:20]:
+            self.stdout.write(self.style.WARNING(f'  Строка {number}: {error}'))
+        if len(result.errors) > 20:
+            self.stdout.write(self.style.WARNING(f'  ... и еще {len(result.errors) - 20} ошибок'))
+
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Импорт завершен! Записей: {result.created}, ждут совета: {result.pending}, '
+            f'пользователей: {result.users}, ошибок: {len(result.errors)}'
+        ))
+        if result.pending and not options['dry_run']:
+            self.stdout.write('Советы сгенерирует python manage.py backfill_entry_advice')
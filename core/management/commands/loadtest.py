@@ -0,0 +1,106 @@
+"""
+Management команда нагрузочного тестирования с имитацией Ollama
+
+Без --base-url сценарии выполняются в процессе через django.test.Client
+и пишут в настроенную БД (используйте копию БД). С --base-url запросы идут
+к запущенному серверу, который должен обращаться к имитации:
+OLLAMA_API_URL=http://127.0.0.1:<--stub-port>.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from core import background
+from core.ai.agent import get_agent
+from core.loadtest.runner import ClientTransport, HttpTransport, run_journeys, summarize
+from core.loadtest.stub_ollama import StubConfig, StubOllamaServer
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет сценарии пользователей и сообщает p50/p95/p99 по шагам, пропускную способность и ошибки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Количество виртуальных пользователей')
+        parser.add_argument('--concurrency', type=int, default=4, help='Одновременных пользователей')
+        parser.add_argument('--base-url', help='Адрес запущенного сервера (без него - в процессе)')
+        parser.add_argument('--stub-port', type=int, default=11435, help='Порт имитации Ollama')
+        parser.add_argument('--no-stub', action='store_true', help='Не запускать имитацию (настоящая Ollama)')
+        parser.add_argument('--latency-ms', type=float, default=800, help='Медиана задержки первого токена')
+        parser.add_argument('--latency-sigma', type=float, default=0.5, help='Разброс задержки (sigma логнормали)')
+        parser.add_argument('--tokens-per-sec', type=float, default=40, help='Медиана скорости генерации')
+        parser.add_argument('--tokens-sigma', type=float, default=0.3, help='Разброс скорости генерации')
+        parser.add_argument('--response-tokens', type=int, default=120, help='Средняя длина ответа в токенах')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов имитации с ошибкой 500')
+        parser.add_argument('--seed', type=int, help='Зерно генераторов случайных чисел')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        stub = None
+        previous_url = get_agent().ollama_url
+        if not options['no_stub']:
+            stub = StubOllamaServer(StubConfig(
+                latency_ms=options['latency_ms'],
+                latency_sigma=options['latency_sigma'],
+                tokens_per_sec=options['tokens_per_sec'],
+                tokens_sigma=options['tokens_sigma'],
+                response_tokens=options['response_tokens'],
+                error_rate=options['error_rate'],
+                seed=options['seed'],
+            ), port=options['stub_port'] if options['base_url'] else 0)
+            stub_url = stub.start()
+            self.stdout.write(f'Имитация Ollama: {stub_url}')
+
+        if options['base_url']:
+            base_url = options['base_url']
+            transport_factory = lambda: HttpTransport(base_url)  # noqa: E731
+        else:
+            transport_factory = ClientTransport
+            if stub is not None:
+                self._point_agent(stub.url)
+
+        try:
+            samples, duration = run_journeys(
+                transport_factory, options['users'], options['concurrency'], options['seed']
+            )
+            # Фоновые советы дня тоже обращаются к имитации - дожидаемся их
+            background.wait_pending()
+            report = summarize(samples, duration, stub.stats() if stub else None)
+        finally:
+            self._point_agent(previous_url)
+            if stub is not None:
+                stub.stop()
+
+        report['config'] = {
+            key: options[key] for key in (
+                'users', 'concurrency', 'base_url', 'latency_ms', 'latency_sigma',
+                'tokens_per_sec', 'tokens_sigma', 'response_tokens', 'error_rate', 'seed',
+            )
+        }
+        self._print(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+    def _point_agent(self, url):
+        """Направляет агент процесса (прямые вызовы и узлы графа) на адрес Ollama"""
+        agent = get_agent()
+        agent.ollama_url = url
+        if agent.llm is not None:
+            agent.llm.base_url = url
+
+    def _print(self, report):
+        self.stdout.write(f'{"шаг":<16}{"запросов":>9}{"ошибок":>8}{"p50":>10}{"p95":>10}{"p99":>10}')
+        for name, row in report['endpoints'].items():
+            self.stdout.write(
+                f'{name:<16}{row["requests"]:>9}{row["errors"]:>8}'
+                f'{row["p50_ms"]:>10.1f}{row["p95_ms"]:>10.1f}{row["p99_ms"]:>10.1f}'
+            )
+        total = report['total']
+        self.stdout.write(self.style.SUCCESS(
+            f'Запросов: {total["requests"]}, ошибок: {total["errors"]}, '
+            f'{total["throughput_rps"]} запросов/с за {report["duration_s"]} с'
+        ))
+        if 'llm' in report:
+            llm = report['llm']
+            self.stdout.write(f'LLM: запросов {llm["requests"]}, доля запасных ответов {llm["fallback_rate"]:.2%}')
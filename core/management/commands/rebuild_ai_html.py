@@ -0,0 +1,55 @@
+"""
+Management команда для пересборки сохраненного HTML AI текстов
+
+Нужна после изменения разметки в core/ai/formatting.py (и увеличения AI_HTML_VERSION)
+"""
+from django.core.management.base import BaseCommand
+from core.models import DailyEntry, TarotReading, NatalChart
+from core.ai.formatting import AI_HTML_VERSION
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает HTML советов, раскладов Таро и натальных карт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей, сохраняемых за один bulk_update',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересобрать весь HTML, а не только устаревший',
+        )
+
+    def handle(self, *args, **options):
+        for model in (DailyEntry, TarotReading, NatalChart):
+            total = self._rebuild(model, options['batch_size'], options['all'])
+            self.stdout.write(f'  {model._meta.verbose_name_plural}: {total}')
+
+        self.stdout.write(self.style.SUCCESS(f'HTML пересобран (версия разметки {AI_HTML_VERSION})'))
+
+    def _rebuild(self, model, batch_size, rebuild_all):
+        """Пересобирает HTML одной модели пакетами по id"""
+        queryset = model.objects.all()
+        if not rebuild_all:
+            queryset = queryset.exclude(html_version=AI_HTML_VERSION)
+
+        fields = ['id'] + list(model.RENDERED_FIELDS)
+        total = 0
+        last_id = 0
+        while True:
+            objects = list(queryset.filter(id__gt=last_id).order_by('id').only(*fields)[:batch_size])
+            if not objects:
+                break
+
+            for obj in objects:
+                obj.render_html()
+            model.objects.bulk_update(objects, model.html_update_fields())
+
+            total += len(objects)
+            last_id = objects[-1].id
+
+        return total
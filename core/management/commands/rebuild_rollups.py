@@ -0,0 +1,21 @@
+"""
+Management команда для пересчета сводной статистики пользователей с нуля
+"""
+from django.core.management.base import BaseCommand
+from core.stats import rebuild_all_rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает UserStatsRollup всех пользователей по заданиям, записям и раскладам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета для чтения дат записей и bulk_create',
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_all_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Сводная статистика пересчитана! Пользователей: {total}'))
@@ -0,0 +1,66 @@
+"""
+Management команда для массового пересчета натальных карт эфемеридой
+"""
+from django.core.management.base import BaseCommand
+from core.models import NatalChart
+from core.ai import ephemeris
+from core.ai.agent import SoulMirrorAgent
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает планеты, дома и аспекты всех натальных карт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Количество карт, рассчитываемых за один векторный вызов',
+        )
+        parser.add_argument(
+            '--keep-readings',
+            action='store_true',
+            help='Не сбрасывать сохраненные AI интерпретации разделов',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        sections = list(SoulMirrorAgent.NATAL_SECTIONS)
+        update_fields = ['planets', 'houses', 'aspects']
+        if not options['keep_readings']:
+            update_fields += sections + NatalChart.html_update_fields()
+
+        total = 0
+        last_id = 0
+        while True:
+            charts = list(
+                NatalChart.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'birth_date', 'birth_time')[:batch_size]
+            )
+            if not charts:
+                break
+
+            computed = ephemeris.compute_charts(
+                [chart.birth_date for chart in charts],
+                [chart.birth_time for chart in charts]
+            )
+
+            for index, chart in enumerate(charts):
+                chart_data = ephemeris.chart_to_dict(computed, index)
+                chart.planets = chart_data['planets']
+                chart.houses = chart_data['houses']
+                chart.aspects = chart_data['aspects']
+                if not options['keep_readings']:
+                    # Интерпретации устарели - они будут сгенерированы заново при открытии
+                    for section in sections:
+                        setattr(chart, section, '')
+                    chart.render_html()
+
+            NatalChart.objects.bulk_update(charts, update_fields)
+
+            total += len(charts)
+            last_id = charts[-1].id
+            self.stdout.write(f'  Пересчитано карт: {total}')
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчет завершен! Всего карт: {total}'))
@@ -0,0 +1,98 @@
+"""
+Management команда для пересчета влияния записей дневника на знаки зодиака
+
+Запускается после изменения таблицы ключевых слов (core/ai/influence.py)
+"""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import DailyEntry, ZodiacProfile
+from core.ai.influence import SIGN_ORDER, default_scorer, row_to_influences
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает sign_influences всех записей дневника по текущей таблице ключевых слов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество записей, рассчитываемых за один пакетный вызов',
+        )
+        parser.add_argument(
+            '--update-profiles',
+            action='store_true',
+            help='Перенести разницу старого и нового влияния в прогресс знаков профилей',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, сколько записей изменится, без сохранения',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        # Разница влияния по пользователям: {user_id: {знак: очки}}
+        deltas = defaultdict(lambda: defaultdict(float))
+
+        total = 0
+        changed = 0
+        last_id = 0
+        while True:
+            entries = list(
+                DailyEntry.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'user_id', 'emotion_level', 'event_description', 'sign_influences')[:batch_size]
+            )
+            if not entries:
+                break
+
+            matrix = default_scorer.score_many(
+                [entry.emotion_level for entry in entries],
+                [entry.event_description for entry in entries]
+            )
+
+            updated = []
+            for entry, row in zip(entries, matrix):
+                influences = row_to_influences(row)
+                old = entry.sign_influences or {}
+                if influences == old:
+                    continue
+
+                for sign in SIGN_ORDER:
+                    difference = influences.get(sign, 0) - old.get(sign, 0)
+                    if difference:
+                        deltas[entry.user_id][sign] += difference
+
+                entry.sign_influences = influences
+                updated.append(entry)
+
+            if updated and not dry_run:
+                DailyEntry.objects.bulk_update(updated, ['sign_influences'])
+
+            total += len(entries)
+            changed += len(updated)
+            last_id = entries[-1].id
+            self.stdout.write(f'  Обработано записей: {total}, изменено: {changed}')
+
+        if options['update_profiles'] and deltas and not dry_run:
+            self._update_profiles(deltas)
+
+        prefix = '[dry-run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Пересчет завершен! Записей: {total}, изменено: {changed}, пользователей затронуто: {len(deltas)}'
+        ))
+
+    def _update_profiles(self, deltas):
+        """Добавляет к прогрессу знаков разницу влияний записей каждого пользователя"""
+        with transaction.atomic():
+            profiles = list(ZodiacProfile.objects.filter(user_id__in=list(deltas)).only('id', 'user_id'))
+            for profile in profiles:
+                profile.add_sign_progress(deltas[profile.user_id])
+
+        self.stdout.write(f'  Обновлен прогресс знаков профилей: {len(profiles)}')
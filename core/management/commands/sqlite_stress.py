@@ -0,0 +1,113 @@
+"""
+Management команда для нагрузочной проверки блокировок SQLite
+
+Потоки одновременно выполняют транзакции "прочитать, затем записать" (как
+начисление опыта и создание записи) во временном файле БД: сначала с прежними
+настройками (DEFERRED, без PRAGMA), затем с настройками из DATABASES['default'].
+"""
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as LegacyDatabaseWrapper
+from django.utils.module_loading import import_string
+
+
+MODES = ('legacy', 'production')
+
+
+class Command(BaseCommand):
+    help = 'Проверяет одновременную запись в SQLite с прежними и продакшен настройками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Количество потоков-писателей')
+        parser.add_argument('--iterations', type=int, default=50, help='Транзакций на поток')
+        parser.add_argument(
+            '--mode',
+            choices=MODES + ('both',),
+            default='both',
+            help='Какие настройки проверять',
+        )
+
+    def handle(self, *args, **options):
+        modes = MODES if options['mode'] == 'both' else (options['mode'],)
+        failed = False
+
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as directory:
+                errors, total, elapsed = self._run(
+                    mode, os.path.join(directory, 'stress.sqlite3'), options['threads'], options['iterations']
+                )
+            expected = options['threads'] * options['iterations']
+            self.stdout.write(
+                f'{mode}: транзакций {expected - errors}/{expected}, ошибок блокировки: {errors}, '
+                f'счетчик: {total}, время: {elapsed:.2f} с'
+            )
+            if mode == 'production' and (errors or total != expected):
+                failed = True
+
+        if failed:
+            raise CommandError('С продакшен настройками остались ошибки блокировки')
+        self.stdout.write(self.style.SUCCESS('Нагрузочная проверка SQLite завершена'))
+
+    def _wrapper(self, mode, path):
+        """Соединение Django с настройками режима для временного файла"""
+        settings_dict = dict(connections['default'].settings_dict, NAME=path)
+        if mode == 'legacy':
+            settings_dict.update(ENGINE='django.db.backends.sqlite3', OPTIONS={})
+            return LegacyDatabaseWrapper(settings_dict, alias='stress')
+        wrapper_class = import_string(settings_dict['ENGINE'] + '.base.DatabaseWrapper')
+        return wrapper_class(settings_dict, alias='stress')
+
+    def _run(self, mode, path, threads, iterations):
+        setup = self._wrapper(mode, path)
+        with setup.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)')
+            cursor.execute('CREATE TABLE ledger (id INTEGER PRIMARY KEY, amount INTEGER NOT NULL)')
+            cursor.execute('INSERT INTO counter (id, value) VALUES (1, 0)')
+        setup.close()
+
+        errors = []
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            wrapper = self._wrapper(mode, path)
+            wrapper.ensure_connection()
+            barrier.wait()
+            failures = 0
+            try:
+                for _ in range(iterations):
+                    try:
+                        wrapper._start_transaction_under_autocommit()
+                        with wrapper.cursor() as cursor:
+                            cursor.execute('SELECT value FROM counter WHERE id = 1')
+                            value = cursor.fetchone()[0]
+                            cursor.execute('INSERT INTO ledger (amount) VALUES (1)')
+                            cursor.execute('UPDATE counter SET value = %s WHERE id = 1', [value + 1])
+                        wrapper.commit()
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        failures += 1
+                        wrapper.rollback()
+            finally:
+                wrapper.close()
+                errors.append(failures)
+
+        started = time.monotonic()
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        check = self._wrapper(mode, path)
+        with check.cursor() as cursor:
+            cursor.execute('SELECT value FROM counter WHERE id = 1')
+            total = cursor.fetchone()[0]
+        check.close()
+        return sum(errors), total, elapsed
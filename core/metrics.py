@@ -0,0 +1,269 @@
+"""
+Метрики приложения в текстовом формате Prometheus
+
+Счетчики и гистограммы хранятся в памяти процесса (одна блокировка, без
+обращений к БД и кэшу), поэтому запись метрики стоит микросекунды. Для
+нескольких процессов (gunicorn и т.п.) задайте METRICS['DIR']: каждый процесс
+не чаще раза в FLUSH_INTERVAL секунд сохраняет свои значения в файл <pid>.json,
+а /metrics складывает файлы всех процессов. Каталог очищается при деплое,
+как в multiprocess режиме prometheus_client.
+
+Настройки (settings.METRICS): ENABLED, DIR, FLUSH_INTERVAL, TOKEN - токен
+для Authorization: Bearer (без токена /metrics доступен только персоналу).
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIR': '',
+    'FLUSH_INTERVAL': 5,
+    'TOKEN': '',
+}
+
+# Границы гистограмм (секунды для времени, штуки для запросов к БД)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90)
+QUEUE_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+VIEW_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def config(name: str):
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+class Registry:
+    """Значения всех метрик процесса: {имя: {значения меток: значение}}"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, 'Metric'] = {}
+        self._values: Dict[str, Dict[Tuple[str, ...], list]] = {}
+        self._flushed_at = 0.0
+
+    def register(self, metric: 'Metric') -> 'Metric':
+        self._metrics[metric.name] = metric
+        self._values.setdefault(metric.name, {})
+        return metric
+
+    def add(self, metric: 'Metric', labels: Tuple[str, ...], position: int, amount: float,
+            observed: Optional[float] = None):
+        """
+        Прибавляет amount к ячейке position значения (у счетчика одна ячейка).
+        Для гистограммы observed добавляется к сумме, а количество растет на 1
+        """
+        with self._lock:
+            cells = self._values[metric.name].get(labels)
+            if cells is None:
+                cells = self._values[metric.name][labels] = [0] * metric.cells
+            cells[position] += amount
+            if observed is not None:
+                cells[-2] += observed
+                cells[-1] += 1
+        self._maybe_flush()
+
+    def snapshot(self) -> Dict[str, Dict[Tuple[str, ...], list]]:
+        with self._lock:
+            return {name: {labels: list(cells) for labels, cells in values.items()}
+                    for name, values in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            for values in self._values.values():
+                values.clear()
+
+    def _path(self) -> str:
+        return os.path.join(config('DIR'), f'{os.getpid()}.json')
+
+    def _maybe_flush(self):
+        if config('DIR') and time.monotonic() - self._flushed_at >= config('FLUSH_INTERVAL'):
+            self.flush()
+
+    def flush(self):
+        """Сохраняет значения процесса в файл каталога METRICS['DIR'] (атомарно)"""
+        directory = config('DIR')
+        if not directory:
+            return
+        self._flushed_at = time.monotonic()
+        data = {name: [[list(labels), cells] for labels, cells in values.items()]
+                for name, values in self.snapshot().items()}
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = self._path()
+            temporary = f'{path}.{threading.get_ident()}.tmp'
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"Ошибка сохранения метрик: {e}")
+
+    def collect(self) -> Dict[str, Dict[Tuple[str, ...], list]]:
+        """Значения всех процессов (или только текущего, если каталог не задан)"""
+        directory = config('DIR')
+        if not directory:
+            return self.snapshot()
+
+        self.flush()
+        merged: Dict[str, Dict[Tuple[str, ...], list]] = {name: {} for name in self._metrics}
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ошибка чтения метрик {filename}: {e}")
+                continue
+            for name, rows in data.items():
+                if name not in merged:
+                    continue
+                for labels, cells in rows:
+                    target = merged[name].setdefault(tuple(labels), [0] * len(cells))
+                    for position, value in enumerate(cells):
+                        target[position] += value
+        return merged
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        values = self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels, cells in sorted(values.get(name, {}).items()):
+                lines.extend(metric.render(labels, cells))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = ''
+    cells = 1
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def _labels(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _label_text(self, labels: Tuple[str, ...], extra: List[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if config('ENABLED'):
+            registry.add(self, self._labels(labels), 0, amount)
+
+    def render(self, labels, cells):
+        return [f'{self.name}{self._label_text(labels)} {_format(cells[0])}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LLM_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # Ячейки: по одной на границу, +Inf, сумма, количество
+        self.cells = len(self.buckets) + 3
+        super().__init__(name, help, labelnames)
+
+    def observe(self, value: float, **labels):
+        if not config('ENABLED'):
+            return
+        # Первая граница, не меньшая value (len(buckets) - ячейка +Inf)
+        position = bisect.bisect_left(self.buckets, value)
+        registry.add(self, self._labels(labels), position, 1, value)
+
+    def render(self, labels, cells):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), cells):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else _format(bound)
+            lines.append(f'{self.name}_bucket{self._label_text(labels, [("le", le)])} {_format(cumulative)}')
+        lines.append(f'{self.name}_sum{self._label_text(labels)} {_format(cells[-2])}')
+        lines.append(f'{self.name}_count{self._label_text(labels)} {_format(cells[-1])}')
+        return lines
+
+
+# LLM (task - тип задачи агента, mode - generate, stream или llm для узлов LangGraph)
+llm_requests = Counter(
+    'soulmirror_llm_requests_total', 'Вызовы LLM по исходу (ok, fallback)', ('task', 'mode', 'outcome')
+)
+llm_latency = Histogram(
+    'soulmirror_llm_request_seconds', 'Полное время вызова LLM', ('task', 'mode'), LLM_BUCKETS
+)
+llm_first_token = Histogram(
+    'soulmirror_llm_first_token_seconds',
+    'Время до первого токена (для generate - load_duration + prompt_eval_duration Ollama)',
+    ('task', 'mode'), LLM_BUCKETS
+)
+llm_eval_duration = Histogram(
+    'soulmirror_llm_eval_duration_seconds', 'eval_duration из ответа Ollama', ('task', 'mode'), LLM_BUCKETS
+)
+llm_prompt_tokens = Counter('soulmirror_llm_prompt_tokens_total', 'Токены промптов (prompt_eval_count)', ('task',))
+llm_eval_tokens = Counter('soulmirror_llm_eval_tokens_total', 'Сгенерированные токены (eval_count)', ('task',))
+
+# Кэши и фоновые задачи
+cache_requests = Counter('soulmirror_cache_requests_total', 'Обращения к кэшам по результату', ('cache', 'result'))
+queue_wait = Histogram(
+    'soulmirror_background_queue_seconds', 'Ожидание фоновой задачи в очереди пула', ('task',), QUEUE_BUCKETS
+)
+
+# Представления Django
+view_latency = Histogram(
+    'soulmirror_view_seconds', 'Время ответа представления', ('view', 'method', 'status'), VIEW_BUCKETS
+)
+view_queries = Histogram(
+    'soulmirror_view_db_queries', 'Запросы к БД за один ответ представления', ('view',), QUERY_BUCKETS
+)
+
+
+def observe_ollama(task: str, mode: str, data: dict):
+    """Токены и длительности из финального ответа Ollama (длительности в наносекундах)"""
+    if data.get('prompt_eval_count'):
+        llm_prompt_tokens.inc(data['prompt_eval_count'], task=task)
+    if data.get('eval_count'):
+        llm_eval_tokens.inc(data['eval_count'], task=task)
+    if data.get('eval_duration'):
+        llm_eval_duration.observe(data['eval_duration'] / 1e9, task=task, mode=mode)
+    if mode == 'generate' and data.get('prompt_eval_duration'):
+        llm_first_token.observe(
+            (data.get('load_duration', 0) + data['prompt_eval_duration']) / 1e9, task=task, mode=mode
+        )
+
+
+def authorized(request) -> bool:
+    """Доступ к /metrics: Bearer токен из METRICS['TOKEN'] или персонал"""
+    token = config('TOKEN')
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    return request.user.is_authenticated and request.user.is_staff
@@ -0,0 +1,46 @@
+"""
+Middleware приложения
+"""
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+
+
+class QueryCounter:
+    """execute_wrapper, считающий запросы к БД"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Время ответа и количество запросов к БД по представлениям (см. core/metrics.py)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics.config('ENABLED'):
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        started = time.monotonic()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.view_latency.observe(
+            time.monotonic() - started, view=view, method=request.method, status=f'{response.status_code // 100}xx'
+        )
+        metrics.view_queries.observe(counter.count, view=view)
+        return response
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_task_author'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyentry',
+            name='ai_advice_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dailyentry',
+            name='html_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='natalchart',
+            name='career_reading_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='natalchart',
+            name='html_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='natalchart',
+            name='life_purpose_reading_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='natalchart',
+            name='personality_reading_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='natalchart',
+            name='relationships_reading_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tarotreading',
+            name='html_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tarotreading',
+            name='interpretation_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
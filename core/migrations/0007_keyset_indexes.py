@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_ai_html'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dailyentry',
+            name='core_dailye_user_id_25bad7_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dailyentry',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='core_dailye_user_id_4c7081_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarotreading',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='core_tarotr_user_id_06941d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'status', '-completed_at', '-id'], name='core_task_user_id_b966b5_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStatsRollup',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats_rollup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_tasks', models.IntegerField(default=0)),
+                ('assigned_tasks', models.IntegerField(default=0)),
+                ('in_progress_tasks', models.IntegerField(default=0)),
+                ('completed_tasks', models.IntegerField(default=0)),
+                ('books_completed', models.IntegerField(default=0)),
+                ('movies_completed', models.IntegerField(default=0)),
+                ('series_completed', models.IntegerField(default=0)),
+                ('total_entries', models.IntegerField(default=0)),
+                ('emotion_sum', models.IntegerField(default=0)),
+                ('current_streak', models.IntegerField(default=0)),
+                ('longest_streak', models.IntegerField(default=0)),
+                ('last_entry_date', models.DateField(blank=True, null=True)),
+                ('total_tarot', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+    ]
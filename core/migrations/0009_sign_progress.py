@@ -0,0 +1,97 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+XP_PER_LEVEL = 500
+
+
+def json_to_rows(apps, schema_editor):
+    """Переносит JSON поля sign_experience, sign_levels и sign_progress в строки SignProgress"""
+    ZodiacProfile = apps.get_model('core', 'ZodiacProfile')
+    SignProgress = apps.get_model('core', 'SignProgress')
+
+    rows = []
+    profiles = ZodiacProfile.objects.only('id', 'sign_experience', 'sign_levels', 'sign_progress')
+    for profile in profiles.iterator(chunk_size=1000):
+        experience = profile.sign_experience or {}
+        levels = profile.sign_levels or {}
+        progress = profile.sign_progress or {}
+        for sign in dict.fromkeys([*progress, *levels, *experience]):
+            exp = int(experience.get(sign, 0))
+            rows.append(SignProgress(
+                profile_id=profile.id,
+                sign=sign,
+                level=int(levels.get(sign, 1)) + exp // XP_PER_LEVEL,
+                experience=exp % XP_PER_LEVEL,
+                progress=float(progress.get(sign, 0)),
+            ))
+        if len(rows) >= 5000:
+            SignProgress.objects.bulk_create(rows)
+            rows = []
+    SignProgress.objects.bulk_create(rows)
+
+
+def rows_to_json(apps, schema_editor):
+    """Обратный перенос: собирает JSON поля профилей из строк SignProgress"""
+    ZodiacProfile = apps.get_model('core', 'ZodiacProfile')
+    SignProgress = apps.get_model('core', 'SignProgress')
+
+    profiles = {}
+    for row in SignProgress.objects.order_by('id').iterator(chunk_size=5000):
+        data = profiles.setdefault(row.profile_id, ({}, {}, {}))
+        if row.level != 1 or row.experience:
+            data[0][row.sign] = row.experience
+            data[1][row.sign] = row.level
+        data[2][row.sign] = row.progress
+
+    updated = []
+    for profile in ZodiacProfile.objects.filter(id__in=list(profiles)).only('id'):
+        profile.sign_experience, profile.sign_levels, profile.sign_progress = profiles[profile.id]
+        updated.append(profile)
+    ZodiacProfile.objects.bulk_update(
+        updated, ['sign_experience', 'sign_levels', 'sign_progress'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_user_stats_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sign', models.CharField(choices=[('aries', 'Овен'), ('taurus', 'Телец'), ('gemini', 'Близнецы'), ('cancer', 'Рак'), ('leo', 'Лев'), ('virgo', 'Дева'), ('libra', 'Весы'), ('scorpio', 'Скорпион'), ('sagittarius', 'Стрелец'), ('capricorn', 'Козерог'), ('aquarius', 'Водолей'), ('pisces', 'Рыбы')], max_length=20)),
+                ('level', models.IntegerField(default=1)),
+                ('experience', models.IntegerField(default=0)),
+                ('progress', models.FloatField(default=0)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sign_rows', to='core.zodiacprofile')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['sign', '-level', '-experience'], name='core_signpr_sign_120b99_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='signprogress',
+            constraint=models.UniqueConstraint(fields=('profile', 'sign'), name='unique_profile_sign'),
+        ),
+        migrations.RunPython(json_to_rows, rows_to_json),
+        migrations.RemoveField(
+            model_name='zodiacprofile',
+            name='sign_experience',
+        ),
+        migrations.RemoveField(
+            model_name='zodiacprofile',
+            name='sign_levels',
+        ),
+        migrations.RemoveField(
+            model_name='zodiacprofile',
+            name='sign_progress',
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def opening_snapshots(apps, schema_editor):
+    """Начальные снимки: накопленный до журнала опыт пользователей"""
+    User = apps.get_model('core', 'User')
+    ExperienceEvent = apps.get_model('core', 'ExperienceEvent')
+
+    now = django.utils.timezone.now()
+    users = User.objects.filter(total_experience__gt=0).values_list('id', 'total_experience')
+    ExperienceEvent.objects.bulk_create(
+        (ExperienceEvent(user_id=user_id, source='snapshot', amount=total, created_at=now)
+         for user_id, total in users.iterator(chunk_size=1000)),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sign_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExperienceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('entry', 'Запись дневника'), ('task', 'Задание'), ('snapshot', 'Снимок')], max_length=20)),
+                ('amount', models.IntegerField()),
+                ('sign', models.CharField(blank=True, choices=[('aries', 'Овен'), ('taurus', 'Телец'), ('gemini', 'Близнецы'), ('cancer', 'Рак'), ('leo', 'Лев'), ('virgo', 'Дева'), ('libra', 'Весы'), ('scorpio', 'Скорпион'), ('sagittarius', 'Стрелец'), ('capricorn', 'Козерог'), ('aquarius', 'Водолей'), ('pisces', 'Рыбы')], max_length=20, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='experience_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='core_experi_user_id_f3f36a_idx'), models.Index(fields=['created_at'], name='core_experi_created_6a8ec3_idx')],
+            },
+        ),
+        migrations.RunPython(opening_snapshots, migrations.RunPython.noop),
+    ]
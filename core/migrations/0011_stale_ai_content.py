@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_experience_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyadvice',
+            name='is_stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='natalchart',
+            name='is_stale',
+            field=models.BooleanField(default=False),
+        ),
+    ]
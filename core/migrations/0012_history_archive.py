@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_stale_ai_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('entries', 'Записи дневника'), ('tarot', 'Расклады Таро')], max_length=20)),
+                ('month', models.DateField()),
+                ('payload', models.BinaryField()),
+                ('rows', models.IntegerField(default=0)),
+                ('emotion_sum', models.IntegerField(default=0)),
+                ('days', models.JSONField(default=list)),
+                ('first_created_at', models.DateTimeField()),
+                ('last_created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_history', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Архив истории',
+                'verbose_name_plural': 'Архив истории',
+                'ordering': ['-month'],
+                'unique_together': {('user', 'kind', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_history_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyentry',
+            name='advice_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='dailyentry',
+            index=models.Index(condition=models.Q(('advice_pending', True)), fields=['id'], name='core_entry_advice_pending'),
+        ),
+    ]
@@ -1,8 +1,13 @@
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 import json
 
+from . import fragment_cache
+from .ai.formatting import AI_HTML_VERSION, render_ai_html
+
 
 class User(AbstractUser):
     """Расширенная модель пользователя"""
@@ -45,14 +50,7 @@ class ZodiacProfile(models.Model):
     birth_sign = models.ForeignKey(ZodiacSign, on_delete=models.SET_NULL, null=True, related_name='birth_profiles')
     inner_sign = models.ForeignKey(ZodiacSign, on_delete=models.SET_NULL, null=True, related_name='inner_profiles')
 
-    # Опыт каждого знака зодиака (JSON: {sign_name: experience_points})
-    sign_experience = models.JSONField(default=dict)
-
-    # Уровни каждого знака зодиака (JSON: {sign_name: level})
-    sign_levels = models.JSONField(default=dict)
-
-    # Старая система прогресса - оставляем для обратной совместимости
-    sign_progress = models.JSONField(default=dict)
+    # Уровни, опыт и прогресс знаков хранятся построчно в SignProgress
 
     # Ответы на начальный опросник
     quiz_answers = models.JSONField(default=dict)
@@ -67,58 +65,128 @@ class ZodiacProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.inner_sign}"
 
+    def _sign_rows(self) -> dict:
+        """
+        Строки прогресса знаков {знак: SignProgress}
+        (из prefetch_related('sign_rows'), иначе одним запросом)
+        """
+        return {row.sign: row for row in self.sign_rows.all()}
+
+    def _sign_rows_changed(self):
+        """Сбрасывает prefetch строк знаков и кэш фрагментов профиля после записи"""
+        getattr(self, '_prefetched_objects_cache', {}).pop('sign_rows', None)
+        fragment_cache.bump_version(self.user_id, 'profile')
+
+    def _ensure_sign_rows(self, signs):
+        """Создает недостающие строки знаков (существующие не трогает)"""
+        SignProgress.objects.bulk_create(
+            [SignProgress(profile=self, sign=sign) for sign in signs],
+            ignore_conflicts=True
+        )
+
     def get_sign_level(self, sign_name: str) -> int:
         """Получить уровень конкретного знака"""
-        return self.sign_levels.get(sign_name, 1)
+        row = self._sign_rows().get(sign_name)
+        return row.level if row else 1
 
     def get_sign_experience(self, sign_name: str) -> int:
         """Получить опыт конкретного знака"""
-        return self.sign_experience.get(sign_name, 0)
+        row = self._sign_rows().get(sign_name)
+        return row.experience if row else 0
 
     def add_sign_experience(self, sign_name: str, experience: int) -> dict:
         """
         Добавить опыт знаку и проверить повышение уровня
         Возвращает словарь с информацией о изменениях
-        """
-        current_exp = self.get_sign_experience(sign_name)
-        current_level = self.get_sign_level(sign_name)
 
-        new_exp = current_exp + experience
-        self.sign_experience[sign_name] = new_exp
-
-        # Проверяем повышение уровня
-        levels_gained = 0
-        while new_exp >= self.XP_PER_LEVEL:
-            new_exp -= self.XP_PER_LEVEL
-            current_level += 1
-            levels_gained += 1
-
-        self.sign_experience[sign_name] = new_exp
-        self.sign_levels[sign_name] = current_level
+        Опыт и уровень меняются одним UPDATE через F(), поэтому одновременные
+        начисления не теряются
+        """
+        self._ensure_sign_rows([sign_name])
+        total = F('experience') + experience
+        SignProgress.objects.filter(profile=self, sign=sign_name).update(
+            level=F('level') + total / self.XP_PER_LEVEL,
+            experience=total % self.XP_PER_LEVEL
+        )
+        self._sign_rows_changed()
+
+        row = SignProgress.objects.only('level', 'experience').get(profile=self, sign=sign_name)
+        # Уровень до начисления восстанавливаем по итоговому опыту
+        previous_total = (row.level - 1) * self.XP_PER_LEVEL + row.experience - experience
+        levels_gained = row.level - (previous_total // self.XP_PER_LEVEL + 1)
 
         return {
             'sign': sign_name,
-            'new_level': current_level,
+            'new_level': row.level,
             'levels_gained': levels_gained,
-            'current_exp': new_exp,
+            'current_exp': row.experience,
             'exp_to_next_level': self.XP_PER_LEVEL
         }
 
+    def get_sign_progress(self) -> dict:
+        """Прогресс знаков по записям дневника {знак: очки}"""
+        return {sign: row.progress for sign, row in self._sign_rows().items()}
+
+    def set_sign_progress(self, scores: dict):
+        """Заменяет прогресс знаков (результат опросника)"""
+        SignProgress.objects.bulk_create(
+            [SignProgress(profile=self, sign=sign, progress=points) for sign, points in scores.items()],
+            update_conflicts=True,
+            unique_fields=['profile', 'sign'],
+            update_fields=['progress']
+        )
+        self._sign_rows_changed()
+
+    def add_sign_progress(self, influences: dict):
+        """Прибавляет влияние записей к прогрессу знаков одним UPDATE через F()"""
+        influences = {sign: points for sign, points in influences.items() if points}
+        if not influences:
+            return
+        self._ensure_sign_rows(influences)
+        SignProgress.objects.filter(profile=self, sign__in=list(influences)).update(
+            progress=F('progress') + Case(
+                *[When(sign=sign, then=Value(float(points))) for sign, points in influences.items()],
+                default=Value(0.0),
+                output_field=models.FloatField()
+            )
+        )
+        self._sign_rows_changed()
+
+    def get_closest_sign(self) -> str:
+        """Знак с наибольшим прогрессом (None, если прогресса еще нет)"""
+        return (
+            self.sign_rows.order_by('-progress', 'id')
+            .values_list('sign', flat=True).first()
+        )
+
+    def follow_closest_sign(self) -> bool:
+        """Делает внутренним знак с наибольшим прогрессом; True, если знак сменился"""
+        closest_sign_name = self.get_closest_sign()
+        if not closest_sign_name or (self.inner_sign and closest_sign_name == self.inner_sign.name):
+            return False
+        self.inner_sign = ZodiacSign.objects.get(name=closest_sign_name)
+        self.save(update_fields=['inner_sign', 'updated_at'])
+        return True
+
     def get_dominant_sign(self) -> str:
         """Определяет доминирующий знак по уровню"""
-        if not self.sign_levels:
+        rows = self._sign_rows()
+        if not rows:
             return self.birth_sign.name if self.birth_sign else 'aries'
 
         # Находим знак с максимальным уровнем
-        max_sign = max(self.sign_levels.items(), key=lambda x: x[1])
-        return max_sign[0]
+        max_sign = max(rows.values(), key=lambda row: row.level)
+        return max_sign.sign
 
     def check_sign_change(self) -> tuple[bool, str]:
         """
         Проверяет, нужно ли сменить внутренний знак
         Возвращает (нужна_смена, новый_знак)
         """
-        if not self.sign_levels or not self.inner_sign:
+        if not self.inner_sign:
+            return False, None
+        rows = self._sign_rows()
+        if not rows:
             return False, None
 
         dominant_sign = self.get_dominant_sign()
@@ -126,8 +194,8 @@ class ZodiacProfile(models.Model):
 
         # Если это разные знаки
         if dominant_sign != current_sign:
-            dominant_level = self.get_sign_level(dominant_sign)
-            current_level = self.get_sign_level(current_sign)
+            dominant_level = rows[dominant_sign].level
+            current_level = rows[current_sign].level if current_sign in rows else 1
 
             # Смена происходит только если разница >= SIGN_CHANGE_THRESHOLD
             if dominant_level - current_level >= self.SIGN_CHANGE_THRESHOLD:
@@ -139,10 +207,12 @@ class ZodiacProfile(models.Model):
         """Получить статистику по всем знакам для отображения"""
         stats = []
         all_signs = ZodiacSign.SIGNS
+        rows = self._sign_rows()
 
         for sign_code, sign_name in all_signs:
-            level = self.get_sign_level(sign_code)
-            exp = self.get_sign_experience(sign_code)
+            row = rows.get(sign_code)
+            level = row.level if row else 1
+            exp = row.experience if row else 0
             stats.append({
                 'code': sign_code,
                 'name': sign_name,
@@ -157,7 +227,76 @@ class ZodiacProfile(models.Model):
         return stats
 
 
-class DailyEntry(models.Model):
+class SignProgress(models.Model):
+    """
+    Уровень, опыт и прогресс одного знака в профиле
+
+    Строка создается при первом начислении знаку; значения меняются
+    атомарно через F(), не переписывая строку профиля
+    """
+    profile = models.ForeignKey(ZodiacProfile, on_delete=models.CASCADE, related_name='sign_rows')
+    sign = models.CharField(max_length=20, choices=ZodiacSign.SIGNS)
+
+    level = models.IntegerField(default=1)
+    experience = models.IntegerField(default=0)  # Опыт внутри текущего уровня (за задания)
+    progress = models.FloatField(default=0)  # Очки влияния записей дневника и опросника
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'sign'], name='unique_profile_sign'),
+        ]
+        indexes = [
+            # Рейтинги по знаку: (sign, -level, -experience)
+            models.Index(fields=['sign', '-level', '-experience']),
+        ]
+
+    def __str__(self):
+        return f"{self.profile_id} - {self.sign}: {self.level} ({self.experience} XP)"
+
+
+class RenderedTextModel(models.Model):
+    """
+    Модель с AI текстами, HTML которых строится один раз при сохранении
+
+    RENDERED_FIELDS: {исходное поле: поле с готовым HTML}
+    """
+    RENDERED_FIELDS = {}
+
+    # Версия разметки, которой построен сохраненный HTML (0 - еще не строился)
+    html_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def html_update_fields(cls):
+        """Поля, которые меняет render_html() (для bulk_update)"""
+        return list(cls.RENDERED_FIELDS.values()) + ['html_version']
+
+    def render_html(self):
+        """Строит HTML всех AI текстов текущей версией разметки"""
+        for source, target in self.RENDERED_FIELDS.items():
+            setattr(self, target, render_ai_html(getattr(self, source)))
+        self.html_version = AI_HTML_VERSION
+
+    def html_for(self, source):
+        """Готовый HTML поля; устаревший HTML строится на лету без сохранения"""
+        if self.html_version == AI_HTML_VERSION:
+            return getattr(self, self.RENDERED_FIELDS[source])
+        return render_ai_html(getattr(self, source))
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.render_html()
+        elif set(update_fields) & set(self.RENDERED_FIELDS):
+            self.render_html()
+            kwargs['update_fields'] = set(update_fields) | set(self.html_update_fields())
+        super().save(*args, **kwargs)
+
+
+class DailyEntry(RenderedTextModel):
     """Ежедневные записи пользователя"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_entries')
     date = models.DateField(auto_now_add=True)
@@ -169,28 +308,106 @@ class DailyEntry(models.Model):
 
     # AI анализ и совет
     ai_advice = models.TextField(blank=True)
+    ai_advice_html = models.TextField(blank=True, editable=False)
+    # Совет импортированной записи генерирует позже backfill_entry_advice (core/diary_import.py)
+    advice_pending = models.BooleanField(default=False)
     experience_gained = models.IntegerField(default=0)
     sign_influences = models.JSONField(default=dict)  # Влияние на знаки зодиака
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    RENDERED_FIELDS = {'ai_advice': 'ai_advice_html'}
+
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Daily Entries"
         indexes = [
-            models.Index(fields=['user', '-created_at']),
+            # Курсорная пагинация истории: (user, -created_at, -id)
+            models.Index(fields=['user', '-created_at', '-id']),
+            # Очередь советов импортированных записей (частичный индекс только по ожидающим)
+            models.Index(fields=['id'], condition=Q(advice_pending=True), name='core_entry_advice_pending'),
         ]
 
     def __str__(self):
         return f"{self.user.username} - {self.date}"
 
 
+class UserStatsRollup(models.Model):
+    """
+    Сводная статистика пользователя, которая обновляется вместе с записями
+    (обработчики в signals.py), поэтому страницы читают одну строку
+    вместо агрегатов по всей истории. Пересчет с нуля: rebuild_rollups
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats_rollup')
+
+    # Задания по статусам и выполненные по типам
+    total_tasks = models.IntegerField(default=0)
+    assigned_tasks = models.IntegerField(default=0)
+    in_progress_tasks = models.IntegerField(default=0)
+    completed_tasks = models.IntegerField(default=0)
+    books_completed = models.IntegerField(default=0)
+    movies_completed = models.IntegerField(default=0)
+    series_completed = models.IntegerField(default=0)
+
+    # Записи дневника: сумма эмоций для среднего и серии дней подряд
+    total_entries = models.IntegerField(default=0)
+    emotion_sum = models.IntegerField(default=0)
+    current_streak = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
+    last_entry_date = models.DateField(null=True, blank=True)
+
+    total_tarot = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Статистика пользователя"
+        verbose_name_plural = "Статистика пользователей"
+
+    def __str__(self):
+        return f"Статистика {self.user_id}"
+
+
+class ExperienceEvent(models.Model):
+    """
+    Запись журнала опыта (только добавление)
+
+    Сумма amount по журналу пользователя равна User.total_experience.
+    Старые записи сворачиваются командой compact_xp_ledger в снимки
+    (source='snapshot') по знакам
+    """
+    SOURCES = [
+        ('entry', 'Запись дневника'),
+        ('task', 'Задание'),
+        ('snapshot', 'Снимок'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='experience_events')
+    source = models.CharField(max_length=20, choices=SOURCES)
+    amount = models.IntegerField()
+    sign = models.CharField(max_length=20, choices=ZodiacSign.SIGNS, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Опыт пользователя за период
+            models.Index(fields=['user', 'created_at']),
+            # Сворачивание старых записей
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.source}: {self.amount:+d} XP"
+
+
 class DailyAdvice(models.Model):
     """Ежедневный совет от ИИ"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_advices')
     date = models.DateField(auto_now_add=True)
     advice = models.TextField()
     is_revealed = models.BooleanField(default=False)
+    # Совет показывается, пока clear_ai_cache --refresh готовит новый (см. core/refresh.py)
+    is_stale = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -236,13 +453,14 @@ class Task(models.Model):
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['user', '-completed_at']),
+            models.Index(fields=['user', 'status', '-completed_at', '-id']),
         ]
 
     def __str__(self):
         return f"{self.user.username} - {self.get_task_type_display()}: {self.title}"
 
 
-class TarotReading(models.Model):
+class TarotReading(RenderedTextModel):
     """Расклады Таро"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tarot_readings')
     question = models.TextField()
@@ -252,17 +470,23 @@ class TarotReading(models.Model):
 
     # Интерпретация от ИИ
     interpretation = models.TextField()
+    interpretation_html = models.TextField(blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    RENDERED_FIELDS = {'interpretation': 'interpretation_html'}
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.created_at.date()}"
 
 
-class NatalChart(models.Model):
+class NatalChart(RenderedTextModel):
     """Натальная карта пользователя"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='natal_charts')
 
@@ -289,9 +513,25 @@ class NatalChart(models.Model):
     relationships_reading = models.TextField(blank=True)
     life_purpose_reading = models.TextField(blank=True)
 
+    # Готовый HTML разделов
+    personality_reading_html = models.TextField(blank=True, editable=False)
+    career_reading_html = models.TextField(blank=True, editable=False)
+    relationships_reading_html = models.TextField(blank=True, editable=False)
+    life_purpose_reading_html = models.TextField(blank=True, editable=False)
+
+    # Разделы показываются, пока clear_ai_cache --refresh готовит новые (см. core/refresh.py)
+    is_stale = models.BooleanField(default=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    RENDERED_FIELDS = {
+        'personality_reading': 'personality_reading_html',
+        'career_reading': 'career_reading_html',
+        'relationships_reading': 'relationships_reading_html',
+        'life_purpose_reading': 'life_purpose_reading_html',
+    }
+
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Натальная карта"
@@ -301,6 +541,42 @@ class NatalChart(models.Model):
         return f"Натальная карта {self.user.username} ({self.birth_date})"
 
 
+class ArchivedHistory(models.Model):
+    """
+    Архив старых записей дневника или раскладов Таро пользователя за месяц
+
+    Строки хранятся одним JSON блоком, сжатым zlib (core/archive.py), и
+    продолжают учитываться в сводной статистике. Истории читают оба уровня
+    """
+    KINDS = [
+        ('entries', 'Записи дневника'),
+        ('tarot', 'Расклады Таро'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_history')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    month = models.DateField()  # Первое число месяца
+    payload = models.BinaryField()
+
+    # Для статистики и пагинации без распаковки блока
+    rows = models.IntegerField(default=0)
+    emotion_sum = models.IntegerField(default=0)
+    days = models.JSONField(default=list)  # Различные даты записей дневника
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month']
+        unique_together = ['user', 'kind', 'month']
+        verbose_name = "Архив истории"
+        verbose_name_plural = "Архив истории"
+
+    def __str__(self):
+        return f"{self.user_id} {self.kind} {self.month:%Y-%m}: {self.rows}"
+
+
 class QuizQuestion(models.Model):
     """Вопросы астрологического опросника"""
     question_text = models.TextField()
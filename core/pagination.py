@@ -0,0 +1,69 @@
+"""
+Keyset (курсорная) пагинация для длинных списков пользователя
+
+Вместо OFFSET страница выбирается условием "строго после последней показанной
+записи" по паре (поле времени, id). Запрос всегда читает только page_size + 1
+строк по индексу (user, -поле, -id), сколько бы записей ни было у пользователя,
+и новые записи не сдвигают уже загруженные страницы.
+"""
+import base64
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+
+PAGE_SIZE = 20
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или подделан"""
+
+
+class KeysetPage(NamedTuple):
+    """Страница списка и курсор следующей страницы (None - страниц больше нет)"""
+    items: List
+    next_cursor: Optional[str]
+
+
+def encode_cursor(value: datetime, pk: int) -> str:
+    """Курсор из значения поля сортировки и id последней записи страницы"""
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разбирает курсор; InvalidCursor, если он некорректен"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(value), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def keyset_page(queryset: QuerySet, field: str, cursor: str = None, page_size: int = PAGE_SIZE) -> KeysetPage:
+    """
+    Страница queryset в порядке (-field, -id), начиная после курсора
+
+    Args:
+        queryset: Отфильтрованный queryset (например, записи одного пользователя)
+        field: Поле времени для сортировки (created_at, completed_at)
+        cursor: Курсор из предыдущей страницы или None для первой
+        page_size: Размер страницы
+
+    Returns:
+        KeysetPage
+    """
+    queryset = queryset.filter(**{f'{field}__isnull': False})
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+
+    items = list(queryset.order_by(f'-{field}', '-pk')[:page_size + 1])
+    if len(items) <= page_size:
+        return KeysetPage(items, None)
+
+    items = items[:page_size]
+    last = items[-1]
+    return KeysetPage(items, encode_cursor(getattr(last, field), last.pk))
@@ -0,0 +1,216 @@
+"""
+Профилирование отдельных запросов
+
+ProfilingMiddleware для выбранной доли запросов (SAMPLE_RATE) собирает время
+SQL (количество, длительность, повторяющиеся запросы), вызовов LLM агента,
+рендеринга шаблонов и фильтров ai_filters. Итог отдается в заголовке
+Server-Timing, а запросы дольше SLOW_MS пишутся в лог core.profiling вместе
+с самыми долгими SQL запросами и их планами (EXPLAIN). Параметры SQL в лог
+не попадают (там тексты дневника, имена и вопросы) - только их типы.
+
+Для запросов вне выборки профиль не создается, и точки учета (add, span,
+timed) сводятся к чтению contextvar.
+
+Настройки (settings.PROFILING): ENABLED - включить middleware, SAMPLE_RATE -
+доля профилируемых запросов, SLOW_MS - порог медленного запроса, EXPLAIN_TOP -
+сколько самых долгих запросов показывать с планом.
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+# Длина текста SQL в отчете о медленном запросе
+SQL_LOG_LENGTH = 1000
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 1.0,
+    'SLOW_MS': 500,
+    'EXPLAIN_TOP': 3,
+}
+
+# Разделы профиля: имя метрики Server-Timing и название в отчете о медленном запросе
+SECTIONS = {
+    'db': 'SQL',
+    'llm': 'LLM',
+    'template': 'Шаблоны',
+    'filters': 'Фильтры ai_filters',
+}
+
+# Описания в заголовке (значения заголовков - только ASCII)
+TIMING_DESCRIPTIONS = {
+    'llm': 'LLM calls',
+    'template': 'Template rendering',
+    'filters': 'ai_filters',
+}
+
+
+def config(name: str):
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+@dataclass
+class QueryRecord:
+    alias: str
+    sql: str
+    params: tuple
+    seconds: float
+
+
+@dataclass
+class RequestProfile:
+    """Профиль одного запроса: {раздел: [секунды, количество]} и выполненные SQL"""
+    started: float = field(default_factory=time.monotonic)
+    sections: Dict[str, list] = field(default_factory=dict)
+    queries: List[QueryRecord] = field(default_factory=list)
+
+    def add(self, name: str, seconds: float):
+        section = self.sections.setdefault(name, [0.0, 0])
+        section[0] += seconds
+        section[1] += 1
+
+    @property
+    def duplicate_queries(self) -> int:
+        """Запросы, повторяющие уже выполненный (тот же SQL с теми же параметрами)"""
+        distinct = {(query.alias, query.sql, repr(query.params)) for query in self.queries}
+        return len(self.queries) - len(distinct)
+
+    def server_timing(self, total: float) -> str:
+        """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+        parts = []
+        for name in SECTIONS:
+            if name not in self.sections:
+                continue
+            seconds, count = self.sections[name]
+            if name == 'db':
+                description = f'{count} queries, {self.duplicate_queries} duplicate'
+            else:
+                description = TIMING_DESCRIPTIONS[name]
+            parts.append(f'{name};dur={seconds * 1000:.1f};desc="{description}"')
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: учитывает время и текст каждого SQL запроса"""
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.monotonic() - started
+            self.add('db', seconds)
+            self.queries.append(QueryRecord(context['connection'].alias, sql, params, seconds))
+
+
+_profile: ContextVar[Optional[RequestProfile]] = ContextVar('request_profile', default=None)
+
+
+def add(name: str, seconds: float):
+    """Учитывает время раздела в профиле текущего запроса (если он профилируется)"""
+    profile = _profile.get()
+    if profile is not None:
+        profile.add(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Учитывает время блока в профиле текущего запроса"""
+    if _profile.get() is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        add(name, time.monotonic() - started)
+
+
+def timed(name: str):
+    """Декоратор: учитывает время вызовов функции в профиле текущего запроса"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profile.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def explain(query: QueryRecord) -> str:
+    """План запроса (только для SELECT)"""
+    if not query.sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    connection = connections[query.alias]
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + query.sql, query.params)
+            return '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+    except DatabaseError as e:
+        return f'не удалось получить план: {e}'
+
+
+def redacted(query: QueryRecord) -> str:
+    """Текст SQL для лога: обрезанный, параметры заменены их типами"""
+    sql = query.sql if len(query.sql) <= SQL_LOG_LENGTH else query.sql[:SQL_LOG_LENGTH] + '...'
+    params = query.params or ()
+    if isinstance(params, dict):
+        params = params.values()
+    return f"{sql} [{', '.join(type(value).__name__ for value in params)}]"
+
+
+class ProfilingMiddleware:
+    """Профилирование доли запросов (см. модуль); без PROFILING['ENABLED'] не подключается"""
+
+    def __init__(self, get_response):
+        if not config('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= config('SAMPLE_RATE'):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+
+        total = time.monotonic() - profile.started
+        response['Server-Timing'] = profile.server_timing(total)
+        if total * 1000 >= config('SLOW_MS'):
+            self.report_slow(request, profile, total)
+        return response
+
+    def report_slow(self, request, profile: RequestProfile, total: float):
+        """Пишет в лог медленный запрос: разделы, самые долгие SQL и их планы"""
+        lines = [f"Медленный запрос {request.method} {request.path}: {total * 1000:.0f} мс"]
+        for name, (seconds, count) in profile.sections.items():
+            lines.append(f"  {SECTIONS.get(name, name)}: {seconds * 1000:.1f} мс, вызовов {count}")
+        if profile.queries:
+            lines.append(f"  Повторяющихся SQL: {profile.duplicate_queries}")
+        slowest = sorted(profile.queries, key=lambda query: query.seconds, reverse=True)
+        for query in slowest[:config('EXPLAIN_TOP')]:
+            lines.append(f"  {query.seconds * 1000:.1f} мс [{query.alias}] {redacted(query)}")
+            plan = explain(query)
+            if plan:
+                lines.extend(f"    {line}" for line in plan.splitlines())
+        logger.warning('\n'.join(lines))
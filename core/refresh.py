@@ -0,0 +1,203 @@
+"""
+Обновление AI текстов без лавины запросов к LLM
+
+Вместо удаления записи помечаются устаревшими (is_stale) и продолжают
+показываться пользователям. Новые версии генерируются по очереди с
+ограниченной частотой, и каждая запись заменяется одним условным UPDATE:
+если за время генерации запись изменилась (пользователь пересчитал
+натальную карту или открыл новый раздел), замена пропускается, и запись
+остается устаревшей до следующего прохода.
+
+Заготовленный ответ (LLM недоступна) не заменяет прежний текст: запись
+остается устаревшей и обновится при следующем запуске.
+
+Обновляются сегодняшние советы дня и готовые разделы натальных карт.
+Тем же способом EntryAdviceBackfill дописывает советы импортированных
+записей дневника (core/diary_import.py), которые ждут генерации.
+"""
+import threading
+import time
+from datetime import date
+from typing import Callable, Optional
+
+from django.db.models import QuerySet
+
+from . import fragment_cache
+from .ai.agent import SoulMirrorAgent, get_agent
+from .models import DailyAdvice, DailyEntry, NatalChart
+
+
+class FallbackResponse(Exception):
+    """LLM вернула заготовку вместо нового текста"""
+
+
+def _generated(text: str) -> str:
+    if get_agent().is_fallback(text):
+        raise FallbackResponse('LLM недоступна, получен заготовленный ответ')
+    return text
+
+
+class RateLimiter:
+    """Не больше rate запусков в минуту (равномерно, без всплесков)"""
+
+    def __init__(self, rate_per_minute: float):
+        self.interval = 60 / rate_per_minute if rate_per_minute > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _sign_name(sign, default='Овен'):
+    return sign.get_name_display() if sign else default
+
+
+class AdviceRefresh:
+    name = 'advice'
+    description = 'Советы дня'
+
+    def candidates(self) -> QuerySet:
+        """Советы, которые видят пользователи (сегодняшние)"""
+        return DailyAdvice.objects.filter(date=date.today())
+
+    def mark_stale(self) -> int:
+        return self.candidates().filter(is_stale=False).update(is_stale=True)
+
+    def stale(self) -> QuerySet:
+        return (
+            self.candidates().filter(is_stale=True)
+            .select_related('user__zodiac_profile__inner_sign').order_by('pk')
+        )
+
+    def regenerate(self, advice: DailyAdvice) -> bool:
+        user = advice.user
+        profile = getattr(user, 'zodiac_profile', None)
+        text = _generated(get_agent().generate_daily_advice({
+            'inner_sign': _sign_name(profile.inner_sign if profile else None),
+            'level': user.level,
+            'experience': user.total_experience,
+            'user_id': user.id,
+        }))
+        # Замена только если совет все еще ждет обновления
+        return bool(DailyAdvice.objects.filter(pk=advice.pk, is_stale=True).update(advice=text, is_stale=False))
+
+
+class NatalRefresh:
+    name = 'natal'
+    description = 'Натальные карты'
+
+    def candidates(self) -> QuerySet:
+        return NatalChart.objects.all()
+
+    def mark_stale(self) -> int:
+        return self.candidates().filter(is_stale=False).update(is_stale=True)
+
+    def stale(self) -> QuerySet:
+        return (
+            self.candidates().filter(is_stale=True)
+            .select_related('user__zodiac_profile__birth_sign', 'user__zodiac_profile__inner_sign')
+            .order_by('pk')
+        )
+
+    def regenerate(self, chart: NatalChart) -> bool:
+        user = chart.user
+        profile = getattr(user, 'zodiac_profile', None)
+        agent = get_agent()
+        # Разделы, которые еще не открывались, сгенерируются лениво при первом открытии
+        for section in SoulMirrorAgent.NATAL_SECTIONS:
+            if getattr(chart, section):
+                setattr(chart, section, _generated(agent.interpret_natal_section(
+                    section,
+                    birth_sign=_sign_name(profile.birth_sign if profile else None),
+                    planets=chart.planets,
+                    user_profile={
+                        'inner_sign': _sign_name(profile.inner_sign if profile else None),
+                        'level': user.level
+                    }
+                )))
+        chart.render_html()
+
+        fields = list(SoulMirrorAgent.NATAL_SECTIONS) + NatalChart.html_update_fields()
+        # Замена только если карта не менялась с момента чтения
+        return bool(
+            NatalChart.objects.filter(pk=chart.pk, is_stale=True, updated_at=chart.updated_at)
+            .update(is_stale=False, **{field: getattr(chart, field) for field in fields})
+        )
+
+
+KINDS = {kind.name: kind for kind in (AdviceRefresh(), NatalRefresh())}
+
+
+class EntryAdviceBackfill:
+    """Советы импортированных записей дневника (advice_pending), от новых к старым"""
+    name = 'entries'
+    description = 'Советы к записям дневника'
+
+    def stale(self) -> QuerySet:
+        return (
+            DailyEntry.objects.filter(advice_pending=True)
+            .select_related('user__zodiac_profile__inner_sign').order_by('-pk')
+        )
+
+    def regenerate(self, entry: DailyEntry) -> bool:
+        user = entry.user
+        profile = getattr(user, 'zodiac_profile', None)
+        result = get_agent().process_daily_entry(
+            event_description=entry.event_description,
+            emotion_level=entry.emotion_level,
+            user_profile={
+                'inner_sign': _sign_name(profile.inner_sign if profile else None, 'не определен'),
+                'level': user.level,
+                'experience': user.total_experience
+            }
+        )
+        entry.ai_advice = _generated(result['advice'])
+        entry.render_html()
+
+        fields = ['ai_advice'] + DailyEntry.html_update_fields()
+        swapped = bool(
+            DailyEntry.objects.filter(pk=entry.pk, advice_pending=True)
+            .update(advice_pending=False, **{field: getattr(entry, field) for field in fields})
+        )
+        if swapped:
+            fragment_cache.bump_version(user.id, 'entries')
+        return swapped
+
+
+def refresh_stale(kind, rate_per_minute: float, limit: Optional[int] = None,
+                  progress: Callable[[int, int, int], None] = None) -> tuple:
+    """
+    Генерирует новые версии устаревших записей не чаще rate_per_minute в минуту
+
+    Args:
+        progress: вызывается после каждой записи с (обработано, заменено, всего)
+
+    Returns:
+        (заменено, пропущено, ошибок)
+    """
+    limiter = RateLimiter(rate_per_minute)
+    records = kind.stale()
+    if limit is not None:
+        records = records[:limit]
+    records = list(records)
+
+    swapped = skipped = failed = 0
+    for number, record in enumerate(records, 1):
+        limiter.wait()
+        try:
+            if kind.regenerate(record):
+                swapped += 1
+            else:
+                skipped += 1
+        except Exception as e:
+            print(f"Ошибка обновления {kind.name} {record.pk}: {e}")
+            failed += 1
+        if progress is not None:
+            progress(number, swapped, len(records))
+    return swapped, skipped, failed
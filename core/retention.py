@@ -0,0 +1,139 @@
+"""
+Сроки хранения AI данных и пакетное удаление
+
+QuerySet.delete() загружает все удаляемые объекты, обходит каскады и шлет
+сигналы в Python, а на SQLite держит блокировку записи все это время.
+delete_in_batches удаляет строки диапазонами первичного ключа: каждый пакет -
+один DELETE без загрузки объектов в своей короткой транзакции, поэтому
+память ограничена размером пакета, а другие запросы успевают писать между
+пакетами.
+
+Так как сигналы не отправляются, политика сама выполняет то, что делали
+обработчики post_delete: для раскладов Таро уменьшает total_tarot в сводках
+и сбрасывает версии кэша фрагментов затронутых пользователей. Расклады,
+уже перенесенные в архив (core/archive.py), удаляются из архивных блоков.
+
+Настройки (settings.RETENTION): сроки хранения в днях по политикам
+и BATCH_SIZE - размер пакета по умолчанию.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Set
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, QuerySet
+from django.utils import timezone
+
+from . import archive, fragment_cache
+from .models import DailyAdvice, TarotReading, UserStatsRollup
+
+
+DEFAULTS = {
+    'advice': 90,
+    'tarot': 365,
+    'BATCH_SIZE': 1000,
+}
+
+
+def config(name: str):
+    return getattr(settings, 'RETENTION', {}).get(name, DEFAULTS[name])
+
+
+def delete_in_batches(queryset: QuerySet, batch_size: int = None,
+                      before_batch: Callable[[QuerySet], None] = None,
+                      progress: Callable[[int, int], None] = None) -> int:
+    """
+    Удаляет строки queryset пакетами по диапазонам первичного ключа
+
+    Args:
+        before_batch: вызывается в транзакции пакета до удаления (для поправок сводок)
+        progress: вызывается после каждого пакета с (удалено, всего)
+
+    Returns:
+        количество удаленных строк
+    """
+    batch_size = batch_size or config('BATCH_SIZE')
+    total = queryset.count()
+    deleted = 0
+    last_pk = None
+    while deleted < total:
+        remaining = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(remaining.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        batch = remaining.filter(pk__lte=pks[-1])
+        with transaction.atomic(using=queryset.db):
+            if before_batch is not None:
+                before_batch(batch)
+            # Один DELETE без загрузки объектов и без сигналов
+            deleted += batch._raw_delete(batch.db)
+        last_pk = pks[-1]
+        if progress is not None:
+            progress(deleted, total)
+    return deleted
+
+
+@dataclass
+class Policy:
+    """Срок хранения модели: строки старше days дней по полю date_field удаляются"""
+    name: str
+    model: type
+    date_field: str
+    description: str
+    # Область кэша фрагментов, которую сбрасывает удаление (как bump_fragment_version)
+    fragment_scope: Optional[str] = None
+    # Поле сводки UserStatsRollup, которое уменьшается на число удаленных строк
+    rollup_field: Optional[str] = None
+    # Вид архива core/archive.py, из которого тоже удаляются старые строки
+    archive_kind: Optional[str] = None
+
+    def cutoff(self, days: int):
+        now = timezone.now()
+        if self.model._meta.get_field(self.date_field).get_internal_type() == 'DateField':
+            return timezone.localdate(now) - timedelta(days=days)
+        return now - timedelta(days=days)
+
+    def expired(self, days: int) -> QuerySet:
+        return self.model.objects.filter(**{f'{self.date_field}__lt': self.cutoff(days)})
+
+    def delete(self, queryset: QuerySet, batch_size: int = None,
+               progress: Callable[[int, int], None] = None) -> int:
+        """Удаляет строки пакетами с поправками сводок и кэша фрагментов"""
+        affected: Set[int] = set()
+
+        def before_batch(batch):
+            if self.fragment_scope is None and self.rollup_field is None:
+                return
+            per_user = batch.values('user_id').annotate(rows=Count('pk')).order_by()
+            by_count: Dict[int, list] = {}
+            for row in per_user:
+                by_count.setdefault(row['rows'], []).append(row['user_id'])
+                affected.add(row['user_id'])
+            if self.rollup_field is not None:
+                # Один UPDATE на каждое различное число удаленных строк пользователя
+                for rows, user_ids in by_count.items():
+                    UserStatsRollup.objects.filter(user_id__in=user_ids).update(
+                        **{self.rollup_field: F(self.rollup_field) - rows}
+                    )
+
+        deleted = delete_in_batches(queryset, batch_size, before_batch, progress)
+        if self.fragment_scope is not None:
+            for user_id in affected:
+                fragment_cache.bump_version(user_id, self.fragment_scope)
+        return deleted
+
+    def delete_archived(self, days: int) -> int:
+        """Удаляет из архива строки старше срока хранения"""
+        if self.archive_kind is None:
+            return 0
+        return archive.prune(self.archive_kind, self.cutoff(days))
+
+
+POLICIES = {
+    'advice': Policy('advice', DailyAdvice, 'date', 'Советы дня'),
+    'tarot': Policy(
+        'tarot', TarotReading, 'created_at', 'Расклады Таро',
+        fragment_scope='tarot', rollup_field='total_tarot', archive_kind='tarot',
+    ),
+}
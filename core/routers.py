@@ -0,0 +1,47 @@
+"""
+Маршрутизация чтения: представления только для чтения идут в соединение 'read'
+
+Соединение 'read' (settings.DATABASES) - реплика или второе соединение
+с тем же файлом SQLite; без него роутер ничего не меняет. Запись и чтение
+вне помеченных представлений всегда идут в 'default'.
+"""
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import connections
+
+
+READ_ALIAS = 'read'
+
+_read_only = ContextVar('read_only_database', default=False)
+
+
+def use_read_database(view):
+    """Направляет чтение GET/HEAD запросов представления в соединение 'read'"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        token = _read_only.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
+
+
+class ReadWriteRouter:
+    def db_for_read(self, model, **hints):
+        if _read_only.get() and READ_ALIAS in connections.databases:
+            return READ_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Оба соединения видят одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
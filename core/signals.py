@@ -0,0 +1,205 @@
+"""
+Обработчики сигналов: поддержка сводной статистики UserStatsRollup
+и версий кэша фрагментов шаблонов
+
+Счетчики меняются атомарно через F(), поэтому обновление сводки выполняется
+в той же транзакции, что и запись (представления оборачивают запись
+в transaction.atomic). Если сводки у пользователя еще нет, она
+пересчитывается с нуля по сырым таблицам.
+
+Серии дней после удаления записей пересчитываются по всем датам
+пользователя, поэтому пересчет откладывается до фиксации транзакции и
+выполняется один раз на пользователя, сколько бы записей ни удалялось.
+"""
+import weakref
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import fragment_cache
+from .models import DailyEntry, TarotReading, Task, User, UserStatsRollup, ZodiacProfile
+from .stats import entry_dates, extend_streak, rebuild_rollup, streaks
+
+
+TASK_STATUS_FIELDS = {
+    'assigned': 'assigned_tasks',
+    'in_progress': 'in_progress_tasks',
+    'completed': 'completed_tasks',
+}
+
+TASK_TYPE_FIELDS = {
+    'book': 'books_completed',
+    'movie': 'movies_completed',
+    'series': 'series_completed',
+}
+
+
+def _task_counters(status, task_type):
+    """Поля сводки, в которые попадает задание с таким статусом и типом"""
+    fields = ['total_tasks']
+    if status in TASK_STATUS_FIELDS:
+        fields.append(TASK_STATUS_FIELDS[status])
+    if status == 'completed' and task_type in TASK_TYPE_FIELDS:
+        fields.append(TASK_TYPE_FIELDS[task_type])
+    return fields
+
+
+def _apply(user_id, deltas, rebuild=True):
+    """
+    Прибавляет к счетчикам сводки; без сводки пересчитывает ее целиком.
+    При удалении (rebuild=False) сводка не создается: пользователь может удаляться каскадом
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = UserStatsRollup.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated and rebuild:
+        rebuild_rollup(user_id)
+
+
+def _loaded(instance, field):
+    """Значение поля на момент загрузки из БД (None, если поле отложено)"""
+    return instance.__dict__.get(field)
+
+
+@receiver(post_init, sender=Task)
+def remember_task_state(sender, instance, **kwargs):
+    instance._stats_state = (_loaded(instance, 'status'), _loaded(instance, 'task_type'))
+
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance, created, **kwargs):
+    new_state = (instance.status, instance.task_type)
+    old_state = None if created else instance._stats_state
+    instance._stats_state = new_state
+
+    if old_state == new_state:
+        return
+    if old_state is not None and None in old_state:
+        # Прежний статус неизвестен (поле было отложено) - пересчитываем
+        rebuild_rollup(instance.user_id)
+        return
+
+    deltas = {}
+    if old_state is not None:
+        for field in _task_counters(*old_state):
+            deltas[field] = deltas.get(field, 0) - 1
+    for field in _task_counters(*new_state):
+        deltas[field] = deltas.get(field, 0) + 1
+    _apply(instance.user_id, deltas)
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance, **kwargs):
+    deltas = {field: -1 for field in _task_counters(instance.status, instance.task_type)}
+    _apply(instance.user_id, deltas, rebuild=False)
+
+
+@receiver(post_init, sender=DailyEntry)
+def remember_entry_emotion(sender, instance, **kwargs):
+    instance._stats_emotion = _loaded(instance, 'emotion_level')
+
+
+@receiver(post_save, sender=DailyEntry)
+def entry_saved(sender, instance, created, **kwargs):
+    old_emotion = instance._stats_emotion
+    instance._stats_emotion = instance.emotion_level
+
+    if not created:
+        if old_emotion is None:
+            rebuild_rollup(instance.user_id)
+        else:
+            _apply(instance.user_id, {'emotion_sum': instance.emotion_level - old_emotion})
+        return
+
+    rollup = UserStatsRollup.objects.filter(user_id=instance.user_id).first()
+    if rollup is None:
+        rebuild_rollup(instance.user_id)
+        return
+
+    extend_streak(rollup, instance.date)
+    UserStatsRollup.objects.filter(user_id=instance.user_id).update(
+        total_entries=F('total_entries') + 1,
+        emotion_sum=F('emotion_sum') + instance.emotion_level,
+        current_streak=rollup.current_streak,
+        longest_streak=rollup.longest_streak,
+        last_entry_date=rollup.last_entry_date,
+    )
+
+
+class _StreakRefresh:
+    """
+    Пересчет серий пользователей транзакции по оставшимся датам (вместе с архивом)
+
+    Один обработчик on_commit на транзакцию соединения; user_ids - множество
+    пользователей, у которых удалялись записи.
+    """
+
+    def __init__(self):
+        self.user_ids = set()
+        self.done = False
+
+    def __call__(self):
+        # Удаления после фиксации попадут в новый обработчик
+        self.done = True
+        for user_id in self.user_ids:
+            rollup = UserStatsRollup.objects.filter(user_id=user_id)
+            if not rollup.exists():
+                continue
+            current, longest, last = streaks(entry_dates(user_id))
+            rollup.update(current_streak=current, longest_streak=longest, last_entry_date=last)
+
+
+def _schedule_streak_refresh(user_id, using):
+    """Пересчет серий после фиксации транзакции - не больше одного на пользователя"""
+    connection = transaction.get_connection(using)
+    # Соединение держит обработчик слабой ссылкой: при откате (в том числе до точки
+    # сохранения) Django отбрасывает обработчик, и следующее удаление создаст новый
+    pending = getattr(connection, '_streak_refresh', None)
+    refresh = pending() if pending is not None else None
+    if refresh is None or refresh.done:
+        refresh = _StreakRefresh()
+        connection._streak_refresh = weakref.ref(refresh)
+        transaction.on_commit(refresh, using=using)
+    refresh.user_ids.add(user_id)
+
+
+@receiver(post_delete, sender=DailyEntry)
+def entry_deleted(sender, instance, using, **kwargs):
+    _apply(instance.user_id, {'total_entries': -1, 'emotion_sum': -instance.emotion_level}, rebuild=False)
+    _schedule_streak_refresh(instance.user_id, using)
+
+
+@receiver(post_save, sender=TarotReading)
+def tarot_saved(sender, instance, created, **kwargs):
+    if created:
+        _apply(instance.user_id, {'total_tarot': 1})
+
+
+@receiver(post_delete, sender=TarotReading)
+def tarot_deleted(sender, instance, **kwargs):
+    _apply(instance.user_id, {'total_tarot': -1}, rebuild=False)
+
+
+# Кэш фрагментов: изменение данных делает недействительными зависящие от них фрагменты
+FRAGMENT_SCOPES = {
+    DailyEntry: 'entries',
+    Task: 'tasks',
+    TarotReading: 'tarot',
+    ZodiacProfile: 'profile',
+    User: 'profile',  # Уровень и опыт в карточке профиля
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_fragment_version(sender, instance, **kwargs):
+    scope = FRAGMENT_SCOPES.get(sender)
+    if scope is None:
+        return
+    user_id = instance.pk if sender is User else instance.user_id
+    fragment_cache.bump_version(user_id, scope)
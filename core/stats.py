@@ -0,0 +1,231 @@
+"""
+Статистика пользователя: задания, записи дневника и расклады Таро
+
+Страницы читают готовую сводку UserStatsRollup (одна строка), которую
+обработчики из signals.py обновляют вместе с записями. Агрегаты по сырым
+таблицам нужны только для пересчета сводки: каждая таблица читается одним
+запросом с условными агрегатами (COUNT ... FILTER / SUM). Записи, перенесенные
+в архив (core/archive.py), учитываются по итогам архивных блоков.
+"""
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from typing import Iterable, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import ArchivedHistory, DailyEntry, TarotReading, Task, User, UserStatsRollup
+
+
+# Средняя эмоция, если записей еще нет
+DEFAULT_AVG_EMOTION = 5
+
+COMPLETED = Q(status='completed')
+
+# Агрегаты заданий: поле сводки -> условный COUNT
+TASK_AGGREGATES = {
+    'total_tasks': Count('id'),
+    'assigned_tasks': Count('id', filter=Q(status='assigned')),
+    'in_progress_tasks': Count('id', filter=Q(status='in_progress')),
+    'completed_tasks': Count('id', filter=COMPLETED),
+    'books_completed': Count('id', filter=COMPLETED & Q(task_type='book')),
+    'movies_completed': Count('id', filter=COMPLETED & Q(task_type='movie')),
+    'series_completed': Count('id', filter=COMPLETED & Q(task_type='series')),
+}
+
+ENTRY_AGGREGATES = {
+    'total_entries': Count('id'),
+    'emotion_sum': Sum('emotion_level', default=0),
+}
+
+
+@dataclass
+class UserStats:
+    """Сводная статистика пользователя для страниц и API"""
+    total_tasks: int = 0
+    completed_tasks: int = 0
+    in_progress_tasks: int = 0
+    books_completed: int = 0
+    movies_completed: int = 0
+    series_completed: int = 0
+    total_entries: int = 0
+    avg_emotion: float = DEFAULT_AVG_EMOTION
+    total_tarot: int = 0
+    current_streak: int = 0
+    longest_streak: int = 0
+
+    @classmethod
+    def for_user(cls, user) -> 'UserStats':
+        """Статистика из сводки (один запрос); сводка создается, если ее еще нет"""
+        rollup = UserStatsRollup.objects.filter(user=user).first()
+        if rollup is None:
+            rollup = rebuild_rollup(user)
+        return cls.from_rollup(rollup)
+
+    @classmethod
+    def from_rollup(cls, rollup: UserStatsRollup) -> 'UserStats':
+        """Статистика из строки сводки"""
+        # Серия прерывается, если вчера и сегодня записей не было
+        yesterday = timezone.localdate() - timedelta(days=1)
+        streak_alive = rollup.last_entry_date is not None and rollup.last_entry_date >= yesterday
+
+        return cls(
+            total_tasks=rollup.total_tasks,
+            completed_tasks=rollup.completed_tasks,
+            in_progress_tasks=rollup.in_progress_tasks,
+            books_completed=rollup.books_completed,
+            movies_completed=rollup.movies_completed,
+            series_completed=rollup.series_completed,
+            total_entries=rollup.total_entries,
+            avg_emotion=(rollup.emotion_sum / rollup.total_entries
+                         if rollup.total_entries else DEFAULT_AVG_EMOTION),
+            total_tarot=rollup.total_tarot,
+            current_streak=rollup.current_streak if streak_alive else 0,
+            longest_streak=rollup.longest_streak,
+        )
+
+    def as_dict(self) -> dict:
+        """Статистика для шаблона или JsonResponse (средняя эмоция округлена)"""
+        data = asdict(self)
+        data['avg_emotion'] = round(self.avg_emotion, 1)
+        return data
+
+
+def streaks(dates: Iterable[date]) -> Tuple[int, int, Optional[date]]:
+    """
+    Серии дней с записями
+
+    Args:
+        dates: Различные даты записей по возрастанию
+
+    Returns:
+        (длина последней серии, самая длинная серия, дата последней записи)
+    """
+    current = longest = 0
+    last = None
+    for day in dates:
+        if last is not None and day - last == timedelta(days=1):
+            current += 1
+        else:
+            current = 1
+        longest = max(longest, current)
+        last = day
+    return current, longest, last
+
+
+def extend_streak(rollup: UserStatsRollup, day: date):
+    """Учитывает в сериях новую запись за день day"""
+    last = rollup.last_entry_date
+    if last is not None and day <= last:
+        # Запись за уже учтенный (или прошедший) день серию не продлевает
+        return
+    if last is not None and day - last == timedelta(days=1):
+        rollup.current_streak += 1
+    else:
+        rollup.current_streak = 1
+    rollup.longest_streak = max(rollup.longest_streak, rollup.current_streak)
+    rollup.last_entry_date = day
+
+
+def _archived_totals(user_id: int = None) -> dict:
+    """{(пользователь, вид): итоги архивных блоков} (строки, сумма эмоций, даты записей)"""
+    blocks = ArchivedHistory.objects.order_by('user_id', 'kind', 'month')
+    if user_id is not None:
+        blocks = blocks.filter(user_id=user_id)
+    totals = {}
+    for block_user, kind, rows, emotion_sum, days in blocks.values_list(
+            'user_id', 'kind', 'rows', 'emotion_sum', 'days').iterator():
+        total = totals.setdefault((block_user, kind), {'rows': 0, 'emotion_sum': 0, 'days': []})
+        total['rows'] += rows
+        total['emotion_sum'] += emotion_sum
+        total['days'].extend(date.fromisoformat(day) for day in days)
+    return totals
+
+
+def entry_dates(user_id: int) -> list:
+    """Различные даты записей дневника пользователя по возрастанию (с архивом)"""
+    days = set(DailyEntry.objects.filter(user_id=user_id).values_list('date', flat=True).distinct())
+    days.update(_archived_totals(user_id).get((user_id, 'entries'), {'days': []})['days'])
+    return sorted(days)
+
+
+def _add_archived(rollup: UserStatsRollup, totals: dict):
+    entries = totals.get((rollup.user_id, 'entries'))
+    if entries:
+        rollup.total_entries += entries['rows']
+        rollup.emotion_sum += entries['emotion_sum']
+    tarot = totals.get((rollup.user_id, 'tarot'))
+    if tarot:
+        rollup.total_tarot += tarot['rows']
+
+
+def compute_rollup(user_id: int) -> UserStatsRollup:
+    """Сводка пользователя по сырым таблицам и архиву (без сохранения)"""
+    rollup = UserStatsRollup(user_id=user_id)
+    for field, value in Task.objects.filter(user_id=user_id).aggregate(**TASK_AGGREGATES).items():
+        setattr(rollup, field, value)
+    for field, value in DailyEntry.objects.filter(user_id=user_id).aggregate(**ENTRY_AGGREGATES).items():
+        setattr(rollup, field, value)
+    rollup.total_tarot = TarotReading.objects.filter(user_id=user_id).count()
+    _add_archived(rollup, _archived_totals(user_id))
+
+    rollup.current_streak, rollup.longest_streak, rollup.last_entry_date = streaks(entry_dates(user_id))
+    return rollup
+
+
+def rebuild_rollup(user) -> UserStatsRollup:
+    """Пересчитывает и сохраняет сводку одного пользователя"""
+    user_id = user.pk if isinstance(user, User) else user
+    rollup = compute_rollup(user_id)
+    rollup.save()
+    return rollup
+
+
+def rebuild_all_rollups(batch_size: int = 1000) -> int:
+    """
+    Пересчитывает сводки всех пользователей: по одному групповому запросу на таблицу
+
+    Returns:
+        количество пользователей
+    """
+    rollups = {user_id: UserStatsRollup(user_id=user_id) for user_id in User.objects.values_list('id', flat=True)}
+
+    grouped = (
+        (Task, TASK_AGGREGATES),
+        (DailyEntry, ENTRY_AGGREGATES),
+        (TarotReading, {'total_tarot': Count('id')}),
+    )
+    for model, aggregates in grouped:
+        for row in model.objects.order_by().values('user_id').annotate(**aggregates):
+            rollup = rollups.get(row.pop('user_id'))
+            if rollup is not None:
+                for field, value in row.items():
+                    setattr(rollup, field, value)
+
+    # Серии: различные даты записей всех пользователей одним запросом
+    dates = (
+        DailyEntry.objects.order_by('user_id', 'date')
+        .values_list('user_id', 'date').distinct()
+    )
+    user_dates = {}
+    for user_id, day in dates.iterator(chunk_size=batch_size):
+        user_dates.setdefault(user_id, set()).add(day)
+
+    archived = _archived_totals()
+    for rollup in rollups.values():
+        _add_archived(rollup, archived)
+    for (user_id, kind), totals in archived.items():
+        if kind == 'entries':
+            user_dates.setdefault(user_id, set()).update(totals['days'])
+
+    for user_id, days in user_dates.items():
+        if user_id in rollups:
+            rollup = rollups[user_id]
+            rollup.current_streak, rollup.longest_streak, rollup.last_entry_date = streaks(sorted(days))
+
+    with transaction.atomic():
+        UserStatsRollup.objects.all().delete()
+        UserStatsRollup.objects.bulk_create(rollups.values(), batch_size=batch_size)
+
+    return len(rollups)
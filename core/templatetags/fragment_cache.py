@@ -0,0 +1,54 @@
+"""
+Тег кэширования фрагментов шаблона на пользователя
+
+Пример:
+    {% load fragment_cache %}
+    {% user_fragment 'dashboard_entries' 'entries' %}
+        ... последние записи ...
+    {% enduser_fragment %}
+
+Первый аргумент - имя фрагмента, остальные - области данных (core.fragment_cache.SCOPES),
+при изменении которых фрагмент нужно перестроить.
+"""
+from django import template
+
+from core import fragment_cache
+
+register = template.Library()
+
+
+class UserFragmentNode(template.Node):
+    def __init__(self, nodelist, name, scopes):
+        self.nodelist = nodelist
+        self.name = name
+        self.scopes = scopes
+
+    def render(self, context):
+        request = context.get('request')
+        user = request.user if request is not None else context.get('user')
+        if user is None or not user.is_authenticated:
+            return self.nodelist.render(context)
+
+        name = self.name.resolve(context)
+        key = fragment_cache.fragment_key(name, user.pk, [scope.resolve(context) for scope in self.scopes])
+        html = fragment_cache.get_fragment(name, key)
+        if html is None:
+            html = self.nodelist.render(context)
+            fragment_cache.set_fragment(key, html)
+        return html
+
+
+@register.tag('user_fragment')
+def do_user_fragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' ожидает имя фрагмента и хотя бы одну область данных"
+        )
+    nodelist = parser.parse(('enduser_fragment',))
+    parser.delete_first_token()
+    return UserFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]]
+    )
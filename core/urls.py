@@ -9,11 +9,22 @@ urlpatterns = [
     path('quiz/', views.quiz_view, name='quiz'),
     path('daily-entry/', views.daily_entry_view, name='daily_entry'),
     path('entries-history/', views.entries_history_view, name='entries_history'),
+    path('entries-history/page/', views.entries_page_view, name='entries_page'),
+    path('entries-import/', views.import_entries_view, name='entries_import'),
     path('reveal-advice/', views.reveal_advice_view, name='reveal_advice'),
     path('tasks/', views.tasks_view, name='tasks'),
     path('tasks/<int:task_id>/start/', views.start_task_view, name='start_task'),
     path('tasks/<int:task_id>/complete/', views.complete_task_view, name='complete_task'),
+    path('tasks/completed/page/', views.completed_tasks_page_view, name='completed_tasks_page'),
     path('tarot/', views.tarot_view, name='tarot'),
+    path('tarot/page/', views.tarot_page_view, name='tarot_page'),
     path('natal-chart/', views.natal_chart_view, name='natal_chart'),
+    path('natal-chart/section/<str:section>/', views.natal_chart_section_view, name='natal_chart_section'),
+    path('natal-chart/section/<str:section>/stream/', views.natal_chart_section_stream_view, name='natal_chart_section_stream'),
     path('statistics/', views.statistics_view, name='statistics'),
+    path('statistics/api/', views.statistics_api_view, name='statistics_api'),
+    path('statistics/fragment-cache/', views.fragment_cache_stats_view, name='fragment_cache_stats'),
+    path('export/', views.export_view, name='export'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('leaderboard/api/', views.leaderboard_api_view, name='leaderboard_api'),
 ]
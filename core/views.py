@@ -1,8 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from datetime import date, timedelta
 from django.views.decorators.http import require_http_methods
 import json
@@ -12,17 +16,14 @@ from .models import (
     User, ZodiacSign, ZodiacProfile, DailyEntry, DailyAdvice,
     Task, TarotReading, QuizQuestion, QuizAnswer, NatalChart
 )
-from .ai.agent import SoulMirrorAgent
+from .ai.agent import SoulMirrorAgent, get_agent
+from . import archive, background, diary_import, experience, export, fragment_cache, leaderboard, metrics
+from .pagination import InvalidCursor, keyset_page
+from .routers import use_read_database
+from .stats import UserStats
 from django.conf import settings
 
 
-# Инициализация AI агента
-ai_agent = SoulMirrorAgent(
-    ollama_url=settings.OLLAMA_API_URL,
-    model=settings.OLLAMA_MODEL
-)
-
-
 def _ensure_user_has_tasks(user, profile):
     """
     Проверяет и создает задания для пользователя ТОЛЬКО для текущего знака
@@ -57,7 +58,7 @@ def _ensure_user_has_tasks(user, profile):
             # Пытаемся сгенерировать уникальное задание (максимум 5 попыток)
             max_attempts = 5
             for attempt in range(max_attempts):
-                recommendation = ai_agent.generate_task_recommendation(
+                recommendation = get_agent().generate_task_recommendation(
                     user_profile_data,
                     current_sign.get_name_display(),
                     existing_titles
@@ -196,8 +197,8 @@ def quiz_view(request):
         profile.birth_sign = birth_sign
         profile.inner_sign = inner_sign
         profile.quiz_answers = answers
-        profile.sign_progress = {sign[0]: sign_scores.get(sign[0], 0) for sign in ZodiacSign.SIGNS}
         profile.save()
+        profile.set_sign_progress({sign[0]: sign_scores.get(sign[0], 0) for sign in ZodiacSign.SIGNS})
 
         # Отмечаем опросник как пройденный
         request.user.completed_initial_quiz = True
@@ -225,23 +226,11 @@ def dashboard_view(request):
         # Если профиль не найден, редиректим на опросник
         return redirect('quiz')
 
-    # Генерируем персональный совет через AI один раз в день
+    # Совет дня генерируется в фоне: страница не ждет ответа LLM
     today = date.today()
-    try:
-        daily_advice = DailyAdvice.objects.get(user=request.user, date=today)
-    except DailyAdvice.DoesNotExist:
-        # Создаем совет через AI только если его еще нет сегодня
-        advice_text = ai_agent.generate_daily_advice({
-            'inner_sign': profile.inner_sign.get_name_display() if profile.inner_sign else 'Овен',
-            'level': request.user.level,
-            'experience': request.user.total_experience,
-            'user_id': request.user.id
-        })
-        daily_advice = DailyAdvice.objects.create(
-            user=request.user,
-            date=today,
-            advice=advice_text
-        )
+    daily_advice = DailyAdvice.objects.filter(user=request.user, date=today).first()
+    if daily_advice is None:
+        _schedule_daily_advice(request.user, profile, today)
 
     # Получаем последние 3 записи для главной страницы
     recent_entries = DailyEntry.objects.filter(user=request.user).order_by('-created_at')[:3]
@@ -263,12 +252,53 @@ def dashboard_view(request):
     return render(request, 'core/dashboard.html', context)
 
 
+def _generate_daily_advice(user_id, today, user_profile):
+    """Генерирует и сохраняет совет дня (выполняется в фоновом потоке)"""
+    advice_text = get_agent().generate_daily_advice(user_profile)
+    DailyAdvice.objects.get_or_create(
+        user_id=user_id,
+        date=today,
+        defaults={'advice': advice_text}
+    )
+
+
+def _schedule_daily_advice(user, profile, today):
+    """Запускает фоновую генерацию совета дня (не более одной на пользователя)"""
+    user_profile = {
+        'inner_sign': profile.inner_sign.get_name_display() if profile and profile.inner_sign else 'Овен',
+        'level': user.level,
+        'experience': user.total_experience,
+        'user_id': user.id
+    }
+    return background.submit_once(
+        ('daily_advice', user.id, today),
+        _generate_daily_advice, user.id, today, user_profile
+    )
+
+
 @login_required
 @require_http_methods(["POST"])
 def reveal_advice_view(request):
-    """Открывает ежедневный совет"""
+    """
+    Открывает ежедневный совет. Если совет еще генерируется, ждет его
+    не дольше ADVICE_REVEAL_WAIT секунд, затем отвечает pending - страница повторит запрос
+    """
     today = date.today()
-    advice = DailyAdvice.objects.get(user=request.user, date=today)
+    advice = DailyAdvice.objects.filter(user=request.user, date=today).first()
+    metrics.cache_requests.inc(cache='daily_advice', result='hit' if advice is not None else 'miss')
+
+    if advice is None:
+        profile = ZodiacProfile.objects.select_related('inner_sign').filter(user=request.user).first()
+        future = _schedule_daily_advice(request.user, profile, today)
+        try:
+            future.result(timeout=settings.ADVICE_REVEAL_WAIT)
+        except Exception:
+            # Таймаут или ошибка генерации - клиент повторит запрос позже
+            pass
+        advice = DailyAdvice.objects.filter(user=request.user, date=today).first()
+        if advice is None:
+            return JsonResponse({'success': False, 'pending': True}, status=202)
+
     advice.is_revealed = True
     advice.save()
 
@@ -291,7 +321,7 @@ def daily_entry_view(request):
             return redirect('quiz')
 
         # Обрабатываем запись через AI
-        result = ai_agent.process_daily_entry(
+        result = get_agent().process_daily_entry(
             event_description=event_description,
             emotion_level=emotion_level,
             user_profile={
@@ -301,36 +331,26 @@ def daily_entry_view(request):
             }
         )
 
-        # Создаем запись
-        entry = DailyEntry.objects.create(
-            user=request.user,
-            event_description=event_description,
-            emotion_level=emotion_level,
-            ai_advice=result['advice'],
-            experience_gained=result['experience_gained'],
-            sign_influences=result['sign_influences']
-        )
-
-        # Обновляем опыт пользователя
-        request.user.total_experience += result['experience_gained']
-
-        # Проверяем повышение уровня
-        new_level = (request.user.total_experience // 100) + 1
-        if new_level > request.user.level:
-            request.user.level = new_level
-
-        request.user.save()
+        # Запись, опыт, прогресс знаков и сводная статистика сохраняются одной транзакцией
+        with transaction.atomic():
+            # Создаем запись
+            entry = DailyEntry.objects.create(
+                user=request.user,
+                event_description=event_description,
+                emotion_level=emotion_level,
+                ai_advice=result['advice'],
+                experience_gained=result['experience_gained'],
+                sign_influences=result['sign_influences']
+            )
 
-        # Обновляем прогресс знаков зодиака
-        for sign, points in result['sign_influences'].items():
-            profile.sign_progress[sign] = profile.sign_progress.get(sign, 0) + points
+            # Начисляем опыт пользователю (журнал + атомарные итоги)
+            experience.award(request.user, [('entry', result['experience_gained'], None)])
 
-        # Проверяем, не изменился ли внутренний знак
-        closest_sign_name = max(profile.sign_progress.items(), key=lambda x: x[1])[0]
-        if closest_sign_name != profile.inner_sign.name:
-            profile.inner_sign = ZodiacSign.objects.get(name=closest_sign_name)
+            # Обновляем прогресс знаков зодиака
+            profile.add_sign_progress(result['sign_influences'])
 
-        profile.save()
+            # Проверяем, не изменился ли внутренний знак
+            profile.follow_closest_sign()
 
         return render(request, 'core/daily_entry_result.html', {
             'entry': entry,
@@ -341,19 +361,86 @@ def daily_entry_view(request):
 
 
 @login_required
+@require_http_methods(["POST"])
+def import_entries_view(request):
+    """
+    Импорт записей дневника из файла JSONL или CSV (поле file) в аккаунт пользователя.
+    Советы к записям генерируются позже (backfill_entry_advice)
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': 'Файл не передан'}, status=400)
+    fmt = request.POST.get('format') or ('csv' if upload.name.lower().endswith('.csv') else 'jsonl')
+    if fmt not in diary_import.FORMATS:
+        return JsonResponse({'success': False, 'error': 'Неизвестный формат'}, status=400)
+
+    lines = (line.decode('utf-8-sig') for line in upload)
+    try:
+        result = diary_import.import_entries(
+            diary_import.read_rows(lines, fmt), user=request.user, max_rows=diary_import.config('MAX_ROWS')
+        )
+    except (diary_import.InvalidRow, UnicodeDecodeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'created': result.created,
+        'pending': result.pending,
+        'errors': [{'line': number, 'error': error} for number, error in result.errors[:20]]
+    })
+
+
+def _keyset_page_response(request, queryset, field, template, context_name, archive_kind=None):
+    """
+    JSON страница списка для бесконечной прокрутки: готовый HTML карточек и курсор следующей.
+    С archive_kind страница читается и из архива (core/archive.py)
+    """
+    cursor = request.GET.get('cursor')
+    try:
+        if archive_kind:
+            page = archive.history_page(archive_kind, queryset, request.user.id, cursor)
+        else:
+            page = keyset_page(queryset, field, cursor)
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Некорректный курсор'}, status=400)
+
+    html = render_to_string(template, {context_name: page.items}, request=request)
+    return JsonResponse({
+        'success': True,
+        'html': html,
+        'next_cursor': page.next_cursor
+    })
+
+
+@login_required
+@use_read_database
 def entries_history_view(request):
-    """История записей дневника"""
-    # Получаем все записи пользователя с пагинацией
-    entries = DailyEntry.objects.filter(user=request.user).order_by('-created_at')
+    """История записей дневника (первая страница, остальные подгружаются при прокрутке)"""
+    page = archive.history_page('entries', DailyEntry.objects.filter(user=request.user), request.user.id)
 
     context = {
-        'entries': entries,
+        'entries': page.items,
+        'next_cursor': page.next_cursor,
         'user': request.user
     }
 
     return render(request, 'core/entries_history.html', context)
 
 
+@login_required
+@use_read_database
+def entries_page_view(request):
+    """Следующая страница истории записей дневника"""
+    return _keyset_page_response(
+        request,
+        DailyEntry.objects.filter(user=request.user),
+        'created_at',
+        'core/entries_history_items.html',
+        'entries',
+        archive_kind='entries'
+    )
+
+
 @login_required
 def tasks_view(request):
     """Просмотр заданий"""
@@ -368,10 +455,10 @@ def tasks_view(request):
         status='in_progress'
     ).select_related('target_sign')
 
-    completed_tasks = Task.objects.filter(
-        user=request.user,
-        status='completed'
-    ).select_related('target_sign').order_by('-completed_at')[:10]  # Только последние 10
+    completed_page = keyset_page(
+        Task.objects.filter(user=request.user, status='completed').select_related('target_sign'),
+        'completed_at'
+    )
 
     # Проверяем, нужно ли создать новые задания (только на странице заданий)
     active_count = assigned_tasks.count() + in_progress_tasks.count()
@@ -390,12 +477,26 @@ def tasks_view(request):
     context = {
         'assigned_tasks': assigned_tasks,
         'in_progress_tasks': in_progress_tasks,
-        'completed_tasks': completed_tasks
+        'completed_tasks': completed_page.items,
+        'completed_next_cursor': completed_page.next_cursor
     }
 
     return render(request, 'core/tasks.html', context)
 
 
+@login_required
+@use_read_database
+def completed_tasks_page_view(request):
+    """Следующая страница выполненных заданий"""
+    return _keyset_page_response(
+        request,
+        Task.objects.filter(user=request.user, status='completed').select_related('target_sign'),
+        'completed_at',
+        'core/completed_task_items.html',
+        'completed_tasks'
+    )
+
+
 @login_required
 @require_http_methods(["POST"])
 def start_task_view(request, task_id):
@@ -404,7 +505,8 @@ def start_task_view(request, task_id):
 
     if task.status == 'assigned':
         task.status = 'in_progress'
-        task.save()
+        with transaction.atomic():
+            task.save()
 
     return JsonResponse({'success': True})
 
@@ -415,51 +517,52 @@ def complete_task_view(request, task_id):
     """Отметить задание как выполненное"""
     task = get_object_or_404(Task, id=task_id, user=request.user)
 
-    task.status = 'completed'
-    task.completed_at = timezone.now()
-    task.save()
-
-    # Добавляем общий опыт пользователю
-    request.user.total_experience += task.experience_reward
-    new_level = (request.user.total_experience // 100) + 1
-    user_leveled_up = False
-    if new_level > request.user.level:
-        request.user.level = new_level
-        user_leveled_up = True
-    request.user.save()
-
-    # Новая система уровней знаков
-    sign_level_up = False
-    sign_changed = False
-    new_sign_name = None
-    old_tasks_removed = 0
-
-    if task.target_sign:
-        try:
-            profile = ZodiacProfile.objects.get(user=request.user)
+    # Журнал опыта и SignProgress фиксируются одной транзакцией: снимок рейтинга
+    # не должен увидеть запись журнала без очков знака (sync ее пропустит)
+    with transaction.atomic():
+        task.status = 'completed'
+        task.completed_at = timezone.now()
+        task.save()
 
-            # Добавляем опыт знаку зодиака
-            sign_result = profile.add_sign_experience(
-                task.target_sign.name,
-                task.experience_reward
-            )
+        # Добавляем общий опыт пользователю (журнал + атомарные итоги)
+        awarded = experience.award(
+            request.user,
+            [('task', task.experience_reward, task.target_sign.name if task.target_sign else None)]
+        )
+        user_leveled_up = awarded.leveled_up
 
-            sign_level_up = sign_result['levels_gained'] > 0
+        # Новая система уровней знаков
+        sign_level_up = False
+        sign_changed = False
+        new_sign_name = None
+        old_tasks_removed = 0
 
-            # Проверяем смену знака
-            should_change, new_sign = profile.check_sign_change()
-            if should_change:
-                old_sign = profile.inner_sign.name
-                profile.inner_sign = ZodiacSign.objects.get(name=new_sign)
-                sign_changed = True
-                new_sign_name = profile.inner_sign.get_name_display()
+        if task.target_sign:
+            try:
+                profile = ZodiacProfile.objects.get(user=request.user)
 
-                # Удаляем старые задания
-                old_tasks_removed = _cleanup_old_tasks(request.user, new_sign)
+                # Добавляем опыт знаку зодиака
+                sign_result = profile.add_sign_experience(
+                    task.target_sign.name,
+                    task.experience_reward
+                )
 
-            profile.save()
-        except ZodiacProfile.DoesNotExist:
-            pass  # Профиль будет создан при прохождении опросника
+                sign_level_up = sign_result['levels_gained'] > 0
+
+                # Проверяем смену знака
+                should_change, new_sign = profile.check_sign_change()
+                if should_change:
+                    old_sign = profile.inner_sign.name
+                    profile.inner_sign = ZodiacSign.objects.get(name=new_sign)
+                    sign_changed = True
+                    new_sign_name = profile.inner_sign.get_name_display()
+
+                    # Удаляем старые задания
+                    old_tasks_removed = _cleanup_old_tasks(request.user, new_sign)
+
+                    profile.save(update_fields=['inner_sign', 'updated_at'])
+            except ZodiacProfile.DoesNotExist:
+                pass  # Профиль будет создан при прохождении опросника
 
     response_data = {
         'success': True,
@@ -476,14 +579,15 @@ def complete_task_view(request, task_id):
 
 
 @login_required
+@use_read_database
 def tarot_view(request):
     """Расклад Таро с AI интерпретацией через LangGraph"""
     if request.method == 'POST':
         question = request.POST.get('question')
 
-        # Генерируем расклад
+        # Генерируем расклад (генератор агента: с кассетой LLM расклады воспроизводимы)
         from .ai.agent import generate_tarot_spread
-        cards = generate_tarot_spread(question)
+        cards = generate_tarot_spread(question, get_agent().random)
 
         # Получаем профиль для персонализации
         try:
@@ -500,28 +604,44 @@ def tarot_view(request):
             }
 
         # Получаем интерпретацию от AI через LangGraph
-        interpretation = ai_agent.interpret_tarot_reading(question, cards, user_profile)
-
-        # Сохраняем расклад
-        reading = TarotReading.objects.create(
-            user=request.user,
-            question=question,
-            cards=cards,
-            interpretation=interpretation
-        )
+        interpretation = get_agent().interpret_tarot_reading(question, cards, user_profile)
+
+        # Сохраняем расклад (вместе со сводной статистикой)
+        with transaction.atomic():
+            reading = TarotReading.objects.create(
+                user=request.user,
+                question=question,
+                cards=cards,
+                interpretation=interpretation
+            )
 
         return render(request, 'core/tarot_result.html', {
             'reading': reading
         })
 
-    # История раскладов
-    readings = TarotReading.objects.filter(user=request.user).order_by('-created_at')[:10]
+    # История раскладов (первая страница)
+    page = archive.history_page('tarot', TarotReading.objects.filter(user=request.user), request.user.id)
 
     return render(request, 'core/tarot.html', {
-        'readings': readings
+        'readings': page.items,
+        'next_cursor': page.next_cursor
     })
 
 
+@login_required
+@use_read_database
+def tarot_page_view(request):
+    """Следующая страница истории раскладов Таро"""
+    return _keyset_page_response(
+        request,
+        TarotReading.objects.filter(user=request.user),
+        'created_at',
+        'core/tarot_reading_items.html',
+        'readings',
+        archive_kind='tarot'
+    )
+
+
 @login_required
 def natal_chart_view(request):
     """Натальная карта"""
@@ -548,19 +668,13 @@ def natal_chart_view(request):
             except:
                 pass
 
-        # Генерируем натальную карту
+        # Генерируем натальную карту (планеты и дома) - без обращения к LLM
         birth_sign = profile.birth_sign.name if profile.birth_sign else 'aries'
-        chart_data = ai_agent.generate_natal_chart(birth_date, birth_sign)
+        chart_data = get_agent().generate_natal_chart(birth_date, birth_sign, birth_time)
 
-        # Получаем интерпретацию от AI
-        interpretations = ai_agent.interpret_natal_chart(
-            birth_sign=profile.birth_sign.get_name_display() if profile.birth_sign else 'Овен',
-            planets=chart_data['planets'],
-            user_profile={
-                'inner_sign': profile.inner_sign.get_name_display() if profile.inner_sign else 'Овен',
-                'level': request.user.level
-            }
-        )
+        # Разделы интерпретации генерируются лениво при первом открытии
+        # (см. natal_chart_section_view), поэтому при пересчете карты сбрасываем их
+        empty_readings = {section: '' for section in SoulMirrorAgent.NATAL_SECTIONS}
 
         # Сохраняем или обновляем натальную карту
         if existing_chart:
@@ -571,10 +685,10 @@ def natal_chart_view(request):
             existing_chart.planets = chart_data['planets']
             existing_chart.aspects = chart_data['aspects']
             existing_chart.interpretation = f"Натальная карта для {profile.birth_sign.get_name_display() if profile.birth_sign else 'человека'}"
-            existing_chart.personality_reading = interpretations['interpretation']
-            existing_chart.career_reading = interpretations['career_reading']
-            existing_chart.relationships_reading = interpretations['relationships_reading']
-            existing_chart.life_purpose_reading = interpretations['life_purpose_reading']
+            for section, value in empty_readings.items():
+                setattr(existing_chart, section, value)
+            # Пересчитанной карте обновление разделов не нужно
+            existing_chart.is_stale = False
             existing_chart.save()
             natal_chart = existing_chart
         else:
@@ -587,95 +701,244 @@ def natal_chart_view(request):
                 planets=chart_data['planets'],
                 aspects=chart_data['aspects'],
                 interpretation=f"Натальная карта для {profile.birth_sign.get_name_display() if profile.birth_sign else 'человека'}",
-                personality_reading=interpretations['interpretation'],
-                career_reading=interpretations['career_reading'],
-                relationships_reading=interpretations['relationships_reading'],
-                life_purpose_reading=interpretations['life_purpose_reading']
+                **empty_readings
             )
 
         return render(request, 'core/natal_chart_result.html', {
             'natal_chart': natal_chart,
-            'profile': profile
+            'profile': profile,
+            'natal_sections': _natal_sections(natal_chart)
         })
 
     return render(request, 'core/natal_chart.html', {
         'profile': profile,
-        'existing_chart': existing_chart
+        'existing_chart': existing_chart,
+        'natal_sections': _natal_sections(existing_chart) if existing_chart else []
     })
 
 
+def _natal_sections(natal_chart):
+    """Список разделов натальной карты для шаблона (готовые и ожидающие генерации)"""
+    return [
+        {
+            'code': section,
+            'title': title,
+            'text': getattr(natal_chart, section),
+            'html': natal_chart.html_for(section),
+        }
+        for section, title in SoulMirrorAgent.NATAL_SECTIONS.items()
+    ]
+
+
+def _natal_section_chart(request, section):
+    """(натальная карта, None) или (None, ответ 404) для запроса раздела"""
+    if section not in SoulMirrorAgent.NATAL_SECTIONS:
+        return None, JsonResponse({'success': False, 'error': 'Неизвестный раздел'}, status=404)
+
+    natal_chart = NatalChart.objects.filter(user=request.user).first()
+    if not natal_chart:
+        return None, JsonResponse({'success': False, 'error': 'Натальная карта не найдена'}, status=404)
+    return natal_chart, None
+
+
+def _natal_section_args(request, natal_chart):
+    """Знак рождения, планеты и профиль для генерации раздела"""
+    profile = ZodiacProfile.objects.select_related('birth_sign', 'inner_sign').filter(user=request.user).first()
+    birth_sign = profile.birth_sign if profile else None
+    inner_sign = profile.inner_sign if profile else None
+    return {
+        'birth_sign': birth_sign.get_name_display() if birth_sign else 'Овен',
+        'planets': natal_chart.planets,
+        'user_profile': {
+            'inner_sign': inner_sign.get_name_display() if inner_sign else 'Овен',
+            'level': request.user.level
+        },
+    }
+
+
 @login_required
-def statistics_view(request):
-    """Страница статистики пользователя"""
-    try:
-        profile = ZodiacProfile.objects.get(user=request.user)
-    except ZodiacProfile.DoesNotExist:
-        return redirect('quiz')
+@require_http_methods(["POST"])
+def natal_chart_section_view(request, section):
+    """
+    Генерирует раздел интерпретации натальной карты при первом открытии.
+    Готовый раздел сохраняется и повторно не генерируется.
+    """
+    natal_chart, error = _natal_section_chart(request, section)
+    if error:
+        return error
 
-    # Получаем статистику по всем знакам
-    all_signs_stats = profile.get_all_sign_stats()
+    text = getattr(natal_chart, section)
+    if not text:
+        text = get_agent().interpret_natal_section(section, **_natal_section_args(request, natal_chart))
 
-    # Статистика по заданиям
-    total_tasks = Task.objects.filter(user=request.user).count()
-    completed_tasks = Task.objects.filter(user=request.user, status='completed').count()
-    in_progress_tasks = Task.objects.filter(user=request.user, status='in_progress').count()
+        setattr(natal_chart, section, text)
+        natal_chart.save(update_fields=[section, 'updated_at'])
 
-    # Статистика по типам заданий
-    books_completed = Task.objects.filter(
-        user=request.user,
-        status='completed',
-        task_type='book'
-    ).count()
-    movies_completed = Task.objects.filter(
-        user=request.user,
-        status='completed',
-        task_type='movie'
-    ).count()
-    series_completed = Task.objects.filter(
-        user=request.user,
-        status='completed',
-        task_type='series'
-    ).count()
+    return JsonResponse({
+        'success': True,
+        'section': section,
+        'html': natal_chart.html_for(section)
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def natal_chart_section_stream_view(request, section):
+    """
+    Генерирует раздел натальной карты потоком: очищенный текст отдается по мере
+    генерации и сохраняется в конце потока. Готовый раздел отдается сразу.
+    Оформленный HTML страница затем берет из natal_chart_section_view (без LLM).
+    """
+    natal_chart, error = _natal_section_chart(request, section)
+    if error:
+        return error
 
-    # Статистика по записям
-    total_entries = DailyEntry.objects.filter(user=request.user).count()
+    text = getattr(natal_chart, section)
+    if text:
+        return HttpResponse(text, content_type='text/plain; charset=utf-8')
 
-    # Средний уровень эмоций
-    entries_emotions = DailyEntry.objects.filter(user=request.user).values_list('emotion_level', flat=True)
-    avg_emotion = sum(entries_emotions) / len(entries_emotions) if entries_emotions else 5
+    chunks = get_agent().stream_natal_section(section, **_natal_section_args(request, natal_chart))
 
-    # Статистика по Таро
-    total_tarot = TarotReading.objects.filter(user=request.user).count()
+    def stream():
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        # Клиент дочитал поток - раздел готов
+        setattr(natal_chart, section, ''.join(parts))
+        natal_chart.save(update_fields=[section, 'updated_at'])
 
-    # Текущий знак и его прогресс
-    current_sign = profile.inner_sign
-    current_sign_level = profile.get_sign_level(current_sign.name) if current_sign else 1
-    current_sign_exp = profile.get_sign_experience(current_sign.name) if current_sign else 0
-    exp_to_next = profile.XP_PER_LEVEL
-    current_sign_progress = int((current_sign_exp / exp_to_next) * 100)
+    response = StreamingHttpResponse(stream(), content_type='text/plain; charset=utf-8')
+    # Прокси (nginx) не должен копить поток целиком
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    # Топ-3 знака по уровню
-    top_signs = all_signs_stats[:3]
 
+@login_required
+@use_read_database
+def statistics_view(request):
+    """Страница статистики пользователя"""
+    try:
+        profile = ZodiacProfile.objects.select_related('inner_sign').get(user=request.user)
+    except ZodiacProfile.DoesNotExist:
+        return redirect('quiz')
+
+    def compute():
+        prefetch_related_objects([profile], 'sign_rows')
+
+        # Получаем статистику по всем знакам
+        all_signs_stats = profile.get_all_sign_stats()
+
+        # Текущий знак и его прогресс
+        current_sign = profile.inner_sign
+        current_sign_level = profile.get_sign_level(current_sign.name) if current_sign else 1
+        current_sign_exp = profile.get_sign_experience(current_sign.name) if current_sign else 0
+        exp_to_next = profile.XP_PER_LEVEL
+        current_sign_progress = int((current_sign_exp / exp_to_next) * 100)
+
+        return {
+            'all_signs_stats': all_signs_stats,
+            'current_sign': current_sign,
+            'current_sign_level': current_sign_level,
+            'current_sign_exp': current_sign_exp,
+            'current_sign_progress': current_sign_progress,
+            'exp_to_next': exp_to_next,
+            # Топ-3 знака по уровню
+            'top_signs': all_signs_stats[:3],
+            # Статистика по заданиям, записям и Таро
+            **UserStats.for_user(request.user).as_dict(),
+        }
+
+    # Статистика нужна только фрагменту 'statistics': при попадании в кэш запросы не выполняются
     context = {
         'profile': profile,
-        'all_signs_stats': all_signs_stats,
-        'current_sign': current_sign,
-        'current_sign_level': current_sign_level,
-        'current_sign_exp': current_sign_exp,
-        'current_sign_progress': current_sign_progress,
-        'exp_to_next': exp_to_next,
-        'top_signs': top_signs,
-        'total_tasks': total_tasks,
-        'completed_tasks': completed_tasks,
-        'in_progress_tasks': in_progress_tasks,
-        'books_completed': books_completed,
-        'movies_completed': movies_completed,
-        'series_completed': series_completed,
-        'total_entries': total_entries,
-        'avg_emotion': round(avg_emotion, 1),
-        'total_tarot': total_tarot,
+        'stats': SimpleLazyObject(compute),
         'user': request.user
     }
 
     return render(request, 'core/statistics.html', context)
+
+
+@login_required
+@use_read_database
+def statistics_api_view(request):
+    """Статистика пользователя в JSON"""
+    return JsonResponse({
+        'success': True,
+        'stats': UserStats.for_user(request.user).as_dict()
+    })
+
+
+@login_required
+def fragment_cache_stats_view(request):
+    """Попадания в кэш фрагментов шаблонов (для персонала, в пределах процесса)"""
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Доступ запрещен'}, status=403)
+    return JsonResponse({
+        'success': True,
+        'fragments': fragment_cache.stats.snapshot()
+    })
+
+
+@login_required
+def export_view(request):
+    """
+    Выгрузка данных пользователя потоком: ?format=jsonl|csv&section=entries
+    (JSONL без section - все разделы, CSV - ровно один раздел)
+    """
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in export.FORMATS:
+        return JsonResponse({'success': False, 'error': 'Неизвестный формат'}, status=400)
+
+    sections = request.GET.getlist('section') or list(export.SECTIONS)
+    if any(section not in export.SECTIONS for section in sections):
+        return JsonResponse({'success': False, 'error': 'Неизвестный раздел'}, status=400)
+    if fmt == 'csv' and len(sections) != 1:
+        return JsonResponse({'success': False, 'error': 'Для CSV укажите один раздел'}, status=400)
+
+    lines = export.lines(fmt, sections, user_id=request.user.id)
+    response = StreamingHttpResponse(export.buffered(lines), content_type=export.FORMATS[fmt])
+    name = sections[0] if len(sections) == 1 else 'all'
+    response['Content-Disposition'] = f'attachment; filename="soulmirror-{name}-{date.today()}.{fmt}"'
+    return response
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus (Bearer токен METRICS['TOKEN'] или персонал)"""
+    if not metrics.authorized(request):
+        return JsonResponse({'success': False, 'error': 'Доступ запрещен'}, status=403)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+def leaderboard_api_view(request):
+    """Топ знака и место текущего пользователя (знак по умолчанию - внутренний)"""
+    sign = request.GET.get('sign')
+    if not sign:
+        profile = ZodiacProfile.objects.select_related('inner_sign').filter(user=request.user).first()
+        sign = profile.inner_sign.name if profile and profile.inner_sign else None
+    if sign not in leaderboard.SIGN_CODES:
+        return JsonResponse({'success': False, 'error': 'Неизвестный знак'}, status=400)
+
+    try:
+        limit = min(int(request.GET.get('limit', 10)), leaderboard.config('TOP_LIMIT'))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректный limit'}, status=400)
+
+    board = leaderboard.get_leaderboard().boards[sign]
+    top = board.top(max(limit, 0))
+    usernames = dict(User.objects.filter(id__in=[user_id for user_id, _ in top]).values_list('id', 'username'))
+
+    def entry(place, user_id, score):
+        level, experience = leaderboard.score_level(score)
+        return {'rank': place, 'username': usernames.get(user_id), 'level': level, 'experience': experience}
+
+    rank, percentile = board.rank(request.user.id)
+    level, experience = leaderboard.score_level(board.score_of(request.user.id))
+    return JsonResponse({
+        'success': True,
+        'sign': sign,
+        'participants': len(board),
+        'top': [entry(board.rank(user_id)[0], user_id, score) for user_id, score in top],
+        'me': {'rank': rank, 'percentile': percentile, 'level': level, 'experience': experience}
+    })
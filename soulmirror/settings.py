@@ -46,6 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы время ответа включало остальные middleware
+    'core.middleware.MetricsMiddleware',
+    # Подключается только при PROFILING['ENABLED']
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,7 +63,9 @@ ROOT_URLCONF = 'soulmirror.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с учетом времени рендеринга в профиле запроса (core/profiling.py)
+        'BACKEND': 'core.backends.django_templates.DjangoTemplates',
+        'NAME': 'django',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -79,13 +85,37 @@ WSGI_APPLICATION = 'soulmirror.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite с WAL и BEGIN IMMEDIATE (см. core/backends/sqlite3/base.py).
+# Соединения живут DB_CONN_MAX_AGE секунд вместо открытия на каждый запрос
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Необязательное соединение для представлений только для чтения (core/routers.py):
+# DB_READ_NAME - путь к реплике или к тому же файлу (отдельное соединение без записи)
+if os.getenv('DB_READ_NAME'):
+    DATABASES['read'] = {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': os.getenv('DB_READ_NAME'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': {'query_only': 'ON', 'busy_timeout': 20000, 'cache_size': -20000,
+                        'mmap_size': 128 * 1024 * 1024},
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.routers.ReadWriteRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -148,6 +178,109 @@ MEDIA_ROOT = BASE_DIR / 'media'
 OLLAMA_API_URL = os.getenv('OLLAMA_API_URL', 'http://localhost:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama2')
 
+# Запись и воспроизведение ответов LLM (см. core/ai/cassette.py).
+# LLM_CASSETTE_MODE=record пишет ответы Ollama в LLM_CASSETTE_PATH,
+# replay отдает их из кассеты без Ollama. LLM_CASSETTE_LATENCY: пусто - без
+# задержки, recorded - как при записи, число - множитель записанной задержки.
+# LLM_CASSETTE_SEED - зерно случайного выбора в промптах (одинаковое при записи и воспроизведении)
+LLM_CASSETTE = {
+    'PATH': os.getenv('LLM_CASSETTE_PATH', ''),
+    'MODE': os.getenv('LLM_CASSETTE_MODE', 'replay'),
+    'LATENCY': os.getenv('LLM_CASSETTE_LATENCY') or None,
+    'SEED': int(os.getenv('LLM_CASSETTE_SEED', '0')),
+}
+
+# Защита от prompt injection (см. core/ai/sanitizer.py)
+# RULES - заменить правила по умолчанию, EXTRA_RULES - добавить свои,
+# DISABLED_RULES - отключить правила по имени
+PROMPT_SANITIZER = {
+    'MAX_LENGTH': 2000,
+    'EXTRA_RULES': [],
+    'DISABLED_RULES': [],
+}
+
+# Фоновая генерация AI текстов (см. core/background.py)
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 2))
+# Сколько секунд reveal_advice ждет совет, который еще генерируется
+ADVICE_REVEAL_WAIT = int(os.getenv('ADVICE_REVEAL_WAIT', 5))
+
+# Кэш (бэкенд и адрес задаются окружением, по умолчанию - файлы в BASE_DIR/cache).
+# Кэш общий для всех процессов: версии фрагментов увеличивают и команды управления.
+# Для нескольких серверов используйте, например,
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://127.0.0.1:6379
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    },
+}
+
+# Кэш фрагментов шаблонов главной и статистики (см. core/fragment_cache.py)
+FRAGMENT_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 24 * 60 * 60)),
+}
+
+# Метрики Prometheus на /metrics/ (см. core/metrics.py). Для нескольких процессов
+# задайте METRICS_DIR - общий каталог, который очищается при каждом деплое
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'True') == 'True',
+    'DIR': os.getenv('METRICS_DIR', ''),
+    'FLUSH_INTERVAL': int(os.getenv('METRICS_FLUSH_INTERVAL', 5)),
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+}
+
+# Профилирование запросов: заголовок Server-Timing и лог медленных запросов
+# с планами SQL (см. core/profiling.py). SAMPLE_RATE - доля профилируемых запросов
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED', 'False') == 'True',
+    'SAMPLE_RATE': float(os.getenv('PROFILING_SAMPLE_RATE', 1.0)),
+    'SLOW_MS': int(os.getenv('PROFILING_SLOW_MS', 500)),
+    'EXPLAIN_TOP': 3,
+}
+
+# Логи приложения (core.*: медленные запросы профилирования и т.п.) - в stderr
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': os.getenv('CORE_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# Сроки хранения AI данных в днях (команда apply_retention, см. core/retention.py)
+RETENTION = {
+    'advice': int(os.getenv('RETENTION_ADVICE_DAYS', 90)),
+    'tarot': int(os.getenv('RETENTION_TAROT_DAYS', 365)),
+    'BATCH_SIZE': 1000,
+}
+
+# Архив старых записей (см. core/archive.py): возраст переноса в днях, степень сжатия zlib
+ARCHIVE = {
+    'entries': int(os.getenv('ARCHIVE_ENTRIES_DAYS', 180)),
+    'tarot': int(os.getenv('ARCHIVE_TAROT_DAYS', 180)),
+    'LEVEL': 9,
+}
+
+# Массовый импорт записей дневника (см. core/diary_import.py)
+DIARY_IMPORT = {
+    'BATCH_SIZE': 1000,
+    'MAX_ROWS': int(os.getenv('DIARY_IMPORT_MAX_ROWS', 10000)),
+}
+
+# Рейтинги по знакам (см. core/leaderboard.py): полный снимок и догон по журналу опыта, секунды
+LEADERBOARD = {
+    'SNAPSHOT_INTERVAL': 60 * 60,
+    'REFRESH_INTERVAL': 60,
+    'TOP_LIMIT': 100,
+}
+
 # CSRF settings for development
 CSRF_TRUSTED_ORIGINS = ['http://localhost:8000', 'http://127.0.0.1:8000']
 CSRF_COOKIE_HTTPONLY = False
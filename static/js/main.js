@@ -43,9 +43,68 @@ const GlobalLoader = {
     }
 };
 
+// Бесконечная прокрутка списков с курсорной пагинацией.
+// Контейнер: data-infinite-scroll, data-page-url, data-next-cursor;
+// сразу за ним - .infinite-scroll-sentinel с кнопкой "Показать еще"
+const InfiniteScroll = {
+    init: function() {
+        document.querySelectorAll('[data-infinite-scroll]').forEach(container => {
+            const sentinel = container.nextElementSibling;
+            if (!sentinel || !sentinel.classList.contains('infinite-scroll-sentinel')) return;
+
+            const button = sentinel.querySelector('.load-more-btn');
+            const load = () => this.loadNext(container, sentinel, button);
+            if (button) button.addEventListener('click', load);
+
+            if ('IntersectionObserver' in window) {
+                const observer = new IntersectionObserver(entries => {
+                    if (entries.some(entry => entry.isIntersecting)) load();
+                }, { rootMargin: '400px' });
+                observer.observe(sentinel);
+                sentinel.observer = observer;
+            }
+        });
+    },
+
+    loadNext: function(container, sentinel, button) {
+        const cursor = container.dataset.nextCursor;
+        if (!cursor || container.dataset.loading) return;
+
+        container.dataset.loading = '1';
+        if (button) {
+            button.disabled = true;
+            button.textContent = 'Загрузка...';
+        }
+
+        const url = container.dataset.pageUrl + '?cursor=' + encodeURIComponent(cursor);
+        fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) throw new Error(data.error);
+                container.insertAdjacentHTML('beforeend', data.html);
+                container.dataset.nextCursor = data.next_cursor || '';
+                if (!data.next_cursor) {
+                    if (sentinel.observer) sentinel.observer.disconnect();
+                    sentinel.remove();
+                }
+            })
+            .catch(error => {
+                console.error('Ошибка загрузки страницы:', error);
+            })
+            .finally(() => {
+                delete container.dataset.loading;
+                if (button) {
+                    button.disabled = false;
+                    button.textContent = 'Показать еще';
+                }
+            });
+    }
+};
+
 // Инициализация при загрузке страницы
 document.addEventListener('DOMContentLoaded', function() {
     GlobalLoader.init();
+    InfiniteScroll.init();
 
     // Показываем спиннер при переходе по ссылкам навигации
     const navLinks = document.querySelectorAll('.nav-menu a');
@@ -83,3 +142,4 @@ window.addEventListener('load', function() {
 
 // Экспортируем GlobalLoader для использования в других скриптах
 window.GlobalLoader = GlobalLoader;
+window.InfiniteScroll = InfiniteScroll;